@@ -29,6 +29,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'log_generator.middleware.PlanMetricsMiddleware',
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -83,3 +84,114 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+
+# --- Routing / geocoding caches ---
+# Persistent tier shared by the geocode and route caches
+ROUTING_CACHE_PATH = BASE_DIR / 'routing_cache.sqlite3'
+
+GEOCODE_CACHE_TTL = 30 * 24 * 3600  # seconds
+GEOCODE_CACHE_MEMORY_SIZE = 2048
+GEOCODE_CACHE_MAX_ENTRIES = 50000
+
+ROUTE_CACHE_TTL = 7 * 24 * 3600  # seconds
+ROUTE_CACHE_PRECISION = 3  # decimal places of lat/lon in the cache key (~100 m)
+ROUTE_CACHE_MEMORY_SIZE = 512
+ROUTE_CACHE_MAX_ENTRIES = 20000
+
+# --- Plan generation ---
+PLAN_UPSTREAM_WORKERS = 16  # threads shared by all requests for geocode/route calls
+PLAN_UPSTREAM_DEADLINE = 10.0  # seconds per request for all upstream calls combined
+
+# --- Upstream services (OSRM / Nominatim) ---
+OSRM_URL = 'http://router.project-osrm.org'
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org'
+UPSTREAM_TIMEOUT = 3  # seconds per attempt
+UPSTREAM_POOL_SIZE = 16  # keep-alive connections per upstream host
+UPSTREAM_RETRIES = 2
+UPSTREAM_BACKOFF_FACTOR = 0.3
+UPSTREAM_BREAKER_THRESHOLD = 5  # consecutive failures before the circuit opens
+UPSTREAM_BREAKER_RESET = 30.0  # seconds before a trial request is allowed
+# Requests per second per upstream, across all threads of a process (None = unlimited).
+# The public Nominatim instance allows at most one request per second.
+NOMINATIM_MAX_RPS = 1.0
+OSRM_MAX_RPS = None
+
+# Routing backends, tried in order. "road_graph" routes offline over the
+# network in ROAD_GRAPH_PATH (JSON nodes/edges, see services/road_graph.py)
+# and is skipped while no graph file is configured.
+ROUTING_PROVIDERS = ['osrm', 'road_graph']
+ROAD_GRAPH_PATH = None
+
+PLAN_PROCESS_WORKERS = None  # processes for scheduling/rendering; None = one per CPU
+PLAN_INTERACTIVE_PROCESS_WORKERS = 1  # extra processes kept for interactive plan jobs
+PLAN_BATCH_MAX_TRIPS = 500
+PLAN_BATCH_UPSTREAM_DEADLINE = 60.0  # seconds for all geocodes/routes of one batch
+
+# "vector" writes log PDFs with native drawing operators; "raster" embeds page images
+LOG_PDF_BACKEND = 'vector'
+
+# Per-day log images: "palette" (16-colour PNG), "mono" (1-bit PNG), "webp"
+# (lossless) or "png" (full-colour RGB). Requests may override with
+# image_format / thumbnail_width; LOG_THUMBNAIL_WIDTH = None means no thumbnails.
+LOG_IMAGE_FORMAT = 'palette'
+LOG_THUMBNAIL_WIDTH = None
+PNG_COMPRESS_LEVEL = 6  # zlib level 0-9; higher is smaller but slower
+LOG_RENDER_THREADS = 4  # days of one plan rendered concurrently; 1 renders serially
+
+# Content-addressed store for rendered log images and PDFs (served from /api/artifacts/)
+ARTIFACT_ROOT = BASE_DIR / 'artifacts'
+# Artifacts not stored again for this long are deleted (never sooner than
+# PLAN_CACHE_TTL). Every process that renders prunes in the background at most
+# once per ARTIFACT_PRUNE_INTERVAL; with None, run `manage.py prune_artifacts`
+# from cron instead
+ARTIFACT_MAX_AGE = 24 * 3600  # seconds
+ARTIFACT_PRUNE_INTERVAL = 3600  # seconds
+
+# Plan result cache: identical requests (same locations and cycle_used) whose
+# start falls in the same bucket reuse the stored plan. Trip start times are
+# rounded down to the bucket so cached and fresh plans agree.
+PLAN_CACHE_BUCKET_MINUTES = 15
+PLAN_CACHE_TTL = 3600  # seconds
+PLAN_CACHE_MEMORY_SIZE = 256
+PLAN_CACHE_MAX_ENTRIES = 5000
+
+# Log days run midnight to midnight in the driver's home-terminal timezone.
+# Requests may override it with an IANA name in "home_timezone".
+HOME_TERMINAL_TIMEZONE = 'UTC'
+
+# Background plan jobs (/api/jobs/), queued in the database. Workers start in
+# the web process on first use unless PLAN_JOB_START_WORKERS is False, in which
+# case run `manage.py run_plan_jobs` separately.
+PLAN_JOB_START_WORKERS = True
+PLAN_JOB_WORKERS = 2
+PLAN_JOB_BULK_SLOTS = 1  # workers that may run "bulk" jobs at once
+PLAN_JOB_POLL_INTERVAL = 1.0  # seconds
+PLAN_JOB_HEARTBEAT_INTERVAL = 30  # seconds between "still running" updates from a worker
+PLAN_JOB_STALE_TIMEOUT = 120  # seconds without a heartbeat before a running job is requeued
+PLAN_JOB_MAINTENANCE_INTERVAL = 60  # seconds between idle-worker housekeeping runs
+
+# Prometheus metrics at /metrics, and an optional Server-Timing header with
+# per-stage plan timings on each response
+METRICS_ENABLED = True
+SERVER_TIMING = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'log_generator': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Opt-in per-request profiling of generate-plan (X-Profile header or ?profile=).
+# Writes cProfile stats and tracemalloc allocation reports to PROFILE_DIR and
+# returns the profile id in X-Profile-Id. With PROFILING_TOKEN set the flag
+# must equal the token.
+PROFILING_ENABLED = False
+PROFILING_TOKEN = None
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_TOP = 30  # functions / allocation sites listed in the reports
+PROFILE_TRACEMALLOC_FRAMES = 10
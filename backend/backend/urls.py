@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from log_generator.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('log_generator.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
@@ -0,0 +1,241 @@
+"""
+Offline benchmark for the planning pipeline.
+
+Runs trips of several lengths against the local OSRM/Nominatim stub and times
+each stage separately: geocode, route, drive_leg (scheduling), day splitting,
+then the production renderer (planner.iter_render_logs) with its
+create_blank_log, draw_events, image encode, artifact store and PDF spans.
+Rendering runs on the render thread pool, so its per-stage times are summed
+across threads and "render" is the wall-clock time. Results are JSON, so runs
+can be stored and compared:
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --baseline bench.json   # exit 1 on regression
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from log_generator.services.artifacts import get_artifact_store  # noqa: E402
+from log_generator.services.log_days import partition_days  # noqa: E402
+from log_generator.services.metrics import collect_timings  # noqa: E402
+from log_generator.services.pdf_drawer import IMAGE_FORMATS  # noqa: E402
+from log_generator.services.planner import (  # noqa: E402
+    build_day_logs, get_home_timezone, iter_render_logs, schedule_trip,
+)
+from log_generator.services.routing import (  # noqa: E402
+    geocode, get_geocode_cache, get_multi_leg_route, get_route_cache,
+)
+from stub_upstream import ROAD_FACTOR, StubUpstream  # noqa: E402
+
+DEFAULT_MILES = [100, 500, 1000, 2500, 5000, 10000]
+# Spans recorded by iter_render_logs
+RENDER_STAGES = ["create_blank_log", "draw_events", "png_encode", "artifact_store", "pdf"]
+STAGES = ["geocode", "route", "drive_leg", "day_split", *RENDER_STAGES, "render", "total"]
+
+# Synthetic trips run east along the equator; pickup is 10% of the way
+MILES_PER_DEGREE = 69.17
+START_LON = -160.0
+
+
+def trip_places(miles):
+    """
+    (current, pickup, dropoff) names and their coordinates for a trip of
+    about `miles` road miles.
+    """
+    degrees = miles / (MILES_PER_DEGREE * ROAD_FACTOR)
+    names = [f"Bench {miles} Start", f"Bench {miles} Pickup", f"Bench {miles} Dropoff"]
+    coords = [(0.0, START_LON), (0.0, START_LON + degrees * 0.1), (0.0, START_LON + degrees)]
+    return names, dict(zip(names, coords))
+
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+
+
+def run_trip(names, start_time, image_format="palette"):
+    """
+    One pass through the pipeline, caches cleared so upstream calls happen.
+    The PDF backend comes from LOG_PDF_BACKEND. Returns ({stage: ms}, trip facts).
+    """
+    get_geocode_cache().clear()
+    get_route_cache().clear()
+    timings = {}
+    begin = time.perf_counter()
+
+    with timed(timings, "geocode"):
+        coords = [geocode(name) for name in names]
+    with timed(timings, "route"):
+        route_1, route_2 = get_multi_leg_route(coords)
+    with timed(timings, "drive_leg"):
+        scheduler = schedule_trip(*names, route_1, route_2, 0, start_time)
+    with timed(timings, "day_split"):
+        log_days = partition_days(scheduler.events, start_time.tzinfo, names[0], names[2])
+        day_logs = build_day_logs(log_days, scheduler.ledger)
+
+    store = get_artifact_store()
+    image_bytes = 0
+    pdf_bytes = 0
+    with timed(timings, "render"), collect_timings() as spans:
+        for kind, artifact_id in iter_render_logs(day_logs, {"format": image_format, "thumbnail_width": None}):
+            if kind == "log_image":
+                image_bytes += store.path(artifact_id).stat().st_size
+            elif kind == "pdf" and artifact_id:
+                pdf_bytes = store.path(artifact_id).stat().st_size
+    for stage in RENDER_STAGES:
+        timings[stage] = spans.get(stage, 0.0) * 1000
+
+    timings["total"] = (time.perf_counter() - begin) * 1000
+    facts = {
+        "route_miles": round((route_1["distance_miles"] + route_2["distance_miles"]), 1),
+        "events": len(scheduler.events),
+        "days": len(day_logs),
+        "image_bytes": image_bytes,
+        "pdf_bytes": pdf_bytes,
+    }
+    return timings, facts
+
+
+def summarize(samples):
+    return {
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(miles_list, runs, vector_pdf, image_format):
+    places = {}
+    trips = {}
+    for miles in miles_list:
+        names, coords = trip_places(miles)
+        trips[miles] = names
+        places.update(coords)
+
+    # Fixed start so every run schedules the same trip
+    start_time = datetime(2026, 1, 5, 6, 0, tzinfo=get_home_timezone())
+    results = []
+    with StubUpstream(places) as stub, tempfile.TemporaryDirectory() as artifact_root:
+        # In-memory caches and a throwaway artifact store, so the dev data is left alone
+        settings.ROUTING_CACHE_PATH = None
+        settings.ARTIFACT_ROOT = Path(artifact_root)
+        settings.ARTIFACT_PRUNE_INTERVAL = None
+        settings.LOG_PDF_BACKEND = "vector" if vector_pdf else "raster"
+        settings.NOMINATIM_URL = stub.url
+        settings.OSRM_URL = stub.url
+        settings.ROUTING_PROVIDERS = ["osrm"]
+        settings.NOMINATIM_MAX_RPS = None  # the stub has no usage policy to respect
+        for miles in miles_list:
+            # One warm-up pass fills the template caches
+            run_trip(trips[miles], start_time, image_format)
+            samples = {stage: [] for stage in STAGES}
+            for _ in range(runs):
+                timings, facts = run_trip(trips[miles], start_time, image_format)
+                for stage in STAGES:
+                    samples[stage].append(timings.get(stage, 0.0))
+            results.append({
+                "miles": miles,
+                **facts,
+                "stages": {stage: summarize(values) for stage, values in samples.items()},
+            })
+            print(f"{miles:>6} mi  {facts['days']:>3} days  total {results[-1]['stages']['total']['median_ms']:.1f} ms",
+                  file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": runs,
+            "pdf_backend": "vector" if vector_pdf else "raster",
+            "image_format": image_format,
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance, min_delta_ms=1.0):
+    """
+    Stages whose median got slower than the baseline by more than
+    `tolerance` (a fraction) and at least min_delta_ms.
+    """
+    previous = {r["miles"]: r["stages"] for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old_stages = previous.get(result["miles"])
+        if old_stages is None:
+            continue
+        for stage, values in result["stages"].items():
+            if stage not in old_stages:
+                continue
+            old, new = old_stages[stage]["median_ms"], values["median_ms"]
+            if new > old * (1 + tolerance) and new - old >= min_delta_ms:
+                regressions.append({"miles": result["miles"], "stage": stage, "baseline_ms": old, "median_ms": new})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--miles", type=int, nargs="+", default=DEFAULT_MILES, help="trip lengths to run")
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per trip length")
+    parser.add_argument("--raster-pdf", action="store_true", help="time the raster PDF backend instead of vector")
+    parser.add_argument("--image-format", choices=list(IMAGE_FORMATS), default="palette",
+                        help="log image encoding to time")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    report = run(args.miles, args.runs, vector_pdf=not args.raster_pdf, image_format=args.image_format)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+    for regression in report.get("regressions", []):
+        print(f"REGRESSION {regression['miles']} mi {regression['stage']}: "
+              f"{regression['baseline_ms']:.1f} -> {regression['median_ms']:.1f} ms", file=sys.stderr)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Local stand-in for Nominatim and OSRM so the planning pipeline can run offline.
+
+Geocodes are answered from fixtures/places.json (plus any places added at
+runtime). Routes are synthesised from the waypoints: great-circle distance
+times ROAD_FACTOR at AVERAGE_MPH, with a LineString vertex about every
+VERTEX_SPACING_MILES, in the response shape the app asks OSRM for
+(geometries=geojson, annotations=distance).
+
+Run it directly to serve on a fixed port and point OSRM_URL / NOMINATIM_URL at it:
+    python benchmarks/stub_upstream.py 5001
+"""
+import json
+import math
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+ROAD_FACTOR = 1.2  # road miles per great-circle mile
+AVERAGE_MPH = 55.0
+VERTEX_SPACING_MILES = 5.0
+METERS_PER_MILE = 1609.34
+
+
+def great_circle_miles(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 3958.8 * 2 * math.asin(math.sqrt(a))
+
+
+def synthetic_route(points):
+    """
+    OSRM-style route over (lon, lat) waypoints.
+    """
+    coordinates = [list(points[0])]
+    legs = []
+    for (lon1, lat1), (lon2, lat2) in zip(points, points[1:]):
+        miles = great_circle_miles(lat1, lon1, lat2, lon2) * ROAD_FACTOR
+        steps = max(1, int(miles / VERTEX_SPACING_MILES))
+        for i in range(1, steps + 1):
+            t = i / steps
+            coordinates.append([lon1 + (lon2 - lon1) * t, lat1 + (lat2 - lat1) * t])
+        meters = miles * METERS_PER_MILE
+        legs.append({
+            "distance": meters,
+            "duration": miles / AVERAGE_MPH * 3600,
+            "annotation": {"distance": [meters / steps] * steps},
+        })
+    return {
+        "code": "Ok",
+        "routes": [{
+            "distance": sum(leg["distance"] for leg in legs),
+            "duration": sum(leg["duration"] for leg in legs),
+            "legs": legs,
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+        }],
+    }
+
+
+class StubUpstream:
+    """
+    Threaded HTTP server answering /search (Nominatim) and
+    /route/v1/driving/... (OSRM). `url` is the base for both settings.
+    """
+    def __init__(self, places=None, port=0):
+        with open(FIXTURES / "places.json") as f:
+            self.places = {name.lower(): tuple(coords) for name, coords in json.load(f).items()}
+        self.places.update({name.lower(): tuple(coords) for name, coords in (places or {}).items()})
+        self.requests = {"geocode": 0, "route": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlsplit(self.path)
+                if parsed.path == "/search":
+                    stub.requests["geocode"] += 1
+                    query = parse_qs(parsed.query).get("q", [""])[0].strip().lower()
+                    coords = stub.places.get(query)
+                    body = [{"lat": str(coords[0]), "lon": str(coords[1])}] if coords else []
+                elif parsed.path.startswith("/route/v1/driving/"):
+                    stub.requests["route"] += 1
+                    waypoints = unquote(parsed.path[len("/route/v1/driving/"):]).split(";")
+                    body = synthetic_route([tuple(map(float, w.split(","))) for w in waypoints])
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    stub = StubUpstream(port=int(sys.argv[1]) if len(sys.argv) > 1 else 5001)
+    print(f"Stub OSRM/Nominatim at {stub.url}")
+    stub._server.serve_forever()
@@ -1,3 +1,21 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Driver, DutyEvent, PlanJob
+
+
+@admin.register(Driver)
+class DriverAdmin(admin.ModelAdmin):
+    list_display = ('name', 'home_timezone', 'last_event_end_min')
+    search_fields = ('name',)
+
+
+@admin.register(DutyEvent)
+class DutyEventAdmin(admin.ModelAdmin):
+    list_display = ('driver', 'status', 'start_min', 'end_min', 'location', 'remark')
+    list_filter = ('status',)
+
+
+@admin.register(PlanJob)
+class PlanJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'priority', 'created_at', 'finished_at')
+    list_filter = ('status', 'priority')
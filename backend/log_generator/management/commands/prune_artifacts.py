@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from log_generator.services.artifacts import get_artifact_store, prune_artifacts
+
+
+class Command(BaseCommand):
+    help = "Delete rendered log artifacts older than ARTIFACT_MAX_AGE (run from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, help="Age in seconds (default: ARTIFACT_MAX_AGE)")
+
+    def handle(self, *args, **options):
+        if options['max_age'] is not None:
+            removed = get_artifact_store().prune(options['max_age'])
+        else:
+            removed = prune_artifacts()
+        self.stdout.write(f"Removed {removed} artifacts")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from log_generator.services.jobs import JobWorkerPool, get_job_pool
+
+
+class Command(BaseCommand):
+    help = "Run plan job workers in this process (set PLAN_JOB_START_WORKERS = False on the web servers)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help="Worker threads (default: PLAN_JOB_WORKERS)")
+        parser.add_argument('--bulk-slots', type=int, help="Workers that may run bulk jobs (default: PLAN_JOB_BULK_SLOTS)")
+
+    def handle(self, *args, **options):
+        defaults = get_job_pool()
+        pool = JobWorkerPool(
+            workers=options['workers'] or defaults.workers,
+            bulk_slots=options['bulk_slots'] if options['bulk_slots'] is not None else defaults.bulk_slots,
+            poll_interval=defaults.poll_interval,
+            stale_timeout=defaults.stale_timeout,
+            maintenance_interval=defaults.maintenance_interval,
+            heartbeat_interval=defaults.heartbeat_interval,
+        )
+        pool.start()
+        self.stdout.write(f"Running {pool.workers} plan job workers ({pool.bulk_slots} for bulk jobs)")
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            pool.stop()
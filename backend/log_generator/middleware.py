@@ -0,0 +1,48 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .services.metrics import collect_timings, http_request_seconds, http_requests, server_timing_header
+
+
+class PlanMetricsMiddleware:
+    """
+    Counts and times requests per view for /metrics. With SERVER_TIMING = True
+    the response also gets a Server-Timing header with the plan stages the
+    request went through (stages after the headers, e.g. in a stream, are not
+    included).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_timings() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, start)
+
+    def _finish(self, request, response, timings, start):
+        elapsed = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unmatched'
+        http_requests.inc(view=view, status=response.status_code)
+        http_request_seconds.observe(elapsed, view=view)
+        if getattr(settings, 'SERVER_TIMING', False):
+            timings['total'] = elapsed
+            response['Server-Timing'] = server_timing_header(timings)
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Driver',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('home_timezone', models.CharField(default='UTC', max_length=64)),
+                ('last_event_end_min', models.IntegerField(default=0)),
+                ('off_duty_since_min', models.IntegerField(blank=True, null=True)),
+                ('shift_start_min', models.IntegerField(blank=True, null=True)),
+                ('drive_minutes', models.IntegerField(default=0)),
+                ('cycle_start_min', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DutyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.SmallIntegerField(choices=[(1, 'Off Duty'), (2, 'Sleeper Berth'), (3, 'Driving'), (4, 'On Duty (not driving)')])),
+                ('start_min', models.IntegerField()),
+                ('end_min', models.IntegerField()),
+                ('location', models.CharField(blank=True, max_length=200)),
+                ('remark', models.CharField(blank=True, max_length=200)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duty_events', to='log_generator.driver')),
+            ],
+            options={
+                'ordering': ['driver', 'start_min'],
+                'indexes': [models.Index(fields=['driver', 'start_min'], name='duty_event_driver_start'), models.Index(fields=['driver', 'end_min'], name='duty_event_driver_end')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('log_generator', '0002_plan_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='planjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+    ]
@@ -1,3 +1,98 @@
+import uuid
+from datetime import timezone
+
 from django.db import models
 
-# Create your models here.
+from .services.duty_log import from_epoch_minutes
+
+
+class Driver(models.Model):
+    """
+    A driver with stored duty history.
+    The counter fields are kept up to date by services.duty_history as events
+    are recorded, so availability for the whole fleet is one query.
+    """
+    name = models.CharField(max_length=200)
+    home_timezone = models.CharField(max_length=64, default='UTC')
+
+    # Maintained counters, all times in epoch minutes
+    last_event_end_min = models.IntegerField(default=0)
+    off_duty_since_min = models.IntegerField(null=True, blank=True) # Start of the current off-duty/sleeper run
+    shift_start_min = models.IntegerField(null=True, blank=True) # First on-duty time after the last 10-hour rest
+    drive_minutes = models.IntegerField(default=0) # Driving since the last 10-hour rest
+    cycle_start_min = models.IntegerField(default=0) # End of the last 34-hour restart
+
+    def __str__(self):
+        return self.name
+
+
+class DutyEvent(models.Model):
+    """
+    One recorded duty-status interval, [start_min, end_min) in epoch minutes.
+    """
+    OFF_DUTY, SLEEPER, DRIVING, ON_DUTY = 1, 2, 3, 4
+    STATUS_CHOICES = [
+        (OFF_DUTY, 'Off Duty'),
+        (SLEEPER, 'Sleeper Berth'),
+        (DRIVING, 'Driving'),
+        (ON_DUTY, 'On Duty (not driving)'),
+    ]
+
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='duty_events')
+    status = models.SmallIntegerField(choices=STATUS_CHOICES)
+    start_min = models.IntegerField()
+    end_min = models.IntegerField()
+    location = models.CharField(max_length=200, blank=True)
+    remark = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ['driver', 'start_min']
+        indexes = [
+            models.Index(fields=['driver', 'start_min'], name='duty_event_driver_start'),
+            # Window sums filter on end_min
+            models.Index(fields=['driver', 'end_min'], name='duty_event_driver_end'),
+        ]
+
+    @property
+    def start(self):
+        return from_epoch_minutes(self.start_min, timezone.utc)
+
+    @property
+    def end(self):
+        return from_epoch_minutes(self.end_min, timezone.utc)
+
+    def __str__(self):
+        return f"{self.driver} {self.get_status_display()} {self.start_min}-{self.end_min}"
+
+
+class PlanJob(models.Model):
+    """
+    A queued generate-plan request, run by services.jobs workers.
+    Lower priority values run first.
+    """
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    INTERACTIVE, BULK = 0, 10
+    PRIORITIES = {'interactive': INTERACTIVE, 'bulk': BULK}
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=INTERACTIVE)
+    params = models.JSONField() # Validated inputs: locations, cycle_used, start_time, timezone, prior_days
+    cache_key = models.CharField(max_length=64)
+    result = models.JSONField(null=True, blank=True) # build_plan output (artifact ids)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=128, blank=True) # Id of the worker thread that claimed the job
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Refreshed while the job runs
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job of the highest priority
+            models.Index(fields=['status', 'priority', 'created_at'], name='plan_job_queue'),
+        ]
+
+    def __str__(self):
+        return f"PlanJob {self.id} ({self.status})"
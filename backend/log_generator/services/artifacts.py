@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .cache import get_setting
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "pdf": "application/pdf",
+}
+
+ARTIFACT_ID_RE = re.compile(r"^[0-9a-f]{64}\.(%s)$" % "|".join(CONTENT_TYPES))
+
+# Store root -> monotonic time of the next background prune in this process
+_next_prune = {}
+_prune_lock = threading.Lock()
+
+
+class ArtifactStore:
+    """
+    Content-addressed file store for rendered logs.
+    An artifact id is "<sha256>.<ext>", so identical renders share one file and
+    a stored file never changes (safe to cache forever downstream).
+    Files are sharded as root/ab/cd/<sha256>.<ext>. A file's mtime is the
+    last time it was stored, which prune() uses to expire old renders.
+    Writing a new file also starts a background prune, at most once per
+    ARTIFACT_PRUNE_INTERVAL seconds per process.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, artifact_id):
+        if not ARTIFACT_ID_RE.match(artifact_id):
+            raise ValueError(f"Invalid artifact id: {artifact_id}")
+        return self.root / artifact_id[:2] / artifact_id[2:4] / artifact_id
+
+    def exists(self, artifact_id):
+        try:
+            return self.path(artifact_id).exists()
+        except ValueError:
+            return False
+
+    def put(self, data, ext):
+        if ext not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported artifact type: {ext}")
+        artifact_id = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        path = self.path(artifact_id)
+        try:
+            # Already stored: refresh it, so it lives as long as the newest plan using it
+            os.utime(path)
+            return artifact_id
+        except FileNotFoundError:
+            pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.maybe_prune()
+        return artifact_id
+
+    def prune(self, max_age, now=None):
+        """
+        Delete artifacts (and leftover temp files) not stored for max_age
+        seconds. Returns the number of files removed.
+        """
+        cutoff = (now or time.time()) - max_age
+        removed = 0
+        for path in self.root.glob("*/*/*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        return removed
+
+    def maybe_prune(self):
+        """
+        Prune in a background thread if ARTIFACT_PRUNE_INTERVAL seconds have
+        passed since this process last did. Returns the thread, or None.
+        """
+        interval = get_setting("ARTIFACT_PRUNE_INTERVAL", 3600)
+        if not interval:
+            return None
+        key = str(self.root)
+        with _prune_lock:
+            now = time.monotonic()
+            if now < _next_prune.get(key, 0.0):
+                return None
+            _next_prune[key] = now + interval
+        thread = threading.Thread(target=self._prune_in_background, name="artifact-prune", daemon=True)
+        thread.start()
+        return thread
+
+    def _prune_in_background(self):
+        try:
+            removed = self.prune(artifact_max_age())
+            if removed:
+                logger.info("Pruned %d old artifacts", removed)
+        except Exception:
+            logger.exception("Artifact pruning failed")
+
+    @staticmethod
+    def content_type(artifact_id):
+        return CONTENT_TYPES[artifact_id.rsplit(".", 1)[-1]]
+
+
+def get_artifact_store():
+    root = get_setting("ARTIFACT_ROOT", None)
+    if root is None:
+        # Same default as settings.ARTIFACT_ROOT, for use outside Django
+        root = Path(__file__).resolve().parent.parent.parent / "artifacts"
+    return ArtifactStore(root)
+
+
+def artifact_max_age():
+    # ARTIFACT_MAX_AGE, never shorter than PLAN_CACHE_TTL so a cached plan's files outlive the cache entry
+    return max(get_setting("ARTIFACT_MAX_AGE", 24 * 3600), get_setting("PLAN_CACHE_TTL", 3600))
+
+
+def prune_artifacts():
+    """
+    Apply ARTIFACT_MAX_AGE to the store now. Returns the number of files removed.
+    """
+    return get_artifact_store().prune(artifact_max_age())
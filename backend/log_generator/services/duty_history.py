@@ -0,0 +1,234 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.db import transaction
+from django.db.models import (
+    Case, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from ..models import Driver, DutyEvent
+from .duty_log import local_day_bounds
+
+# Limits in minutes
+DRIVE_LIMIT_MIN = 11 * 60
+WINDOW_LIMIT_MIN = 14 * 60
+CYCLE_LIMIT_MIN = 70 * 60
+CYCLE_WINDOW_DAYS = 8
+RESET_MIN = 10 * 60
+RESTART_MIN = 34 * 60
+
+ON_DUTY_STATUSES = (DutyEvent.DRIVING, DutyEvent.ON_DUTY)
+
+
+def _apply_rest(driver, rest_start, rest_end):
+    # Off-duty/sleeper run [rest_start, rest_end): 10 hours resets the shift, 34 the cycle
+    rest = rest_end - rest_start
+    if rest >= RESET_MIN:
+        driver.shift_start_min = None
+        driver.drive_minutes = 0
+    if rest >= RESTART_MIN:
+        driver.cycle_start_min = rest_end
+
+
+def record_duty_events(driver_id, events):
+    """
+    Append duty events to a driver's history and update its counters.
+    events: dicts with status, start_min, end_min (epoch minutes) and optional
+    location/remark. They must not start before the driver's last recorded
+    event ends; gaps between events count as off duty.
+    Raises ValueError for invalid or overlapping events.
+    """
+    with transaction.atomic():
+        driver = Driver.objects.select_for_update().get(pk=driver_id)
+        rows = []
+        for e in sorted(events, key=lambda e: e['start_min']):
+            start_min, end_min, status = e['start_min'], e['end_min'], e['status']
+            if status not in (1, 2, 3, 4):
+                raise ValueError(f"Invalid status: {status}")
+            if end_min <= start_min:
+                raise ValueError("Event must end after it starts")
+            if start_min < driver.last_event_end_min:
+                raise ValueError("Event overlaps recorded duty history")
+
+            # Rest runs from the end of the last on-duty time, so gaps count too
+            rest_start = driver.off_duty_since_min
+            if rest_start is None:
+                rest_start = driver.last_event_end_min
+            if status in ON_DUTY_STATUSES:
+                _apply_rest(driver, rest_start, start_min)
+                driver.off_duty_since_min = None
+                if driver.shift_start_min is None:
+                    driver.shift_start_min = start_min
+                if status == DutyEvent.DRIVING:
+                    driver.drive_minutes += end_min - start_min
+            else:
+                _apply_rest(driver, rest_start, end_min)
+                driver.off_duty_since_min = rest_start
+            driver.last_event_end_min = end_min
+
+            rows.append(DutyEvent(
+                driver=driver, status=status, start_min=start_min, end_min=end_min,
+                location=e.get('location') or "", remark=e.get('remark') or "",
+            ))
+
+        DutyEvent.objects.bulk_create(rows)
+        driver.save(update_fields=[
+            'last_event_end_min', 'off_duty_since_min', 'shift_start_min', 'drive_minutes', 'cycle_start_min',
+        ])
+    return len(rows)
+
+
+def cycle_window_start(now_min, tz, days=CYCLE_WINDOW_DAYS):
+    """
+    Local midnight `days - 1` days before the day containing now_min: the
+    start of the calendar-day window CycleLedger uses for the 70/8 rule.
+    """
+    day_start = local_day_bounds(now_min, tz)[1]
+    for _ in range(days - 1):
+        day_start = local_day_bounds(day_start - 1, tz)[1]
+    return round(day_start)
+
+
+def _zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo("UTC")
+
+
+def _in_hours(minutes):
+    return ExpressionWrapper(minutes / 60.0, output_field=FloatField())
+
+
+def with_availability(drivers, now_min):
+    """
+    Annotate a Driver queryset with remaining drive_hours, window_hours and
+    cycle_hours at now_min (epoch minutes), computed in the database: shift
+    limits come from the maintained counters plus the rest taken since the
+    last event, and the cycle from a per-driver sum of on-duty time in the
+    last 8 local calendar days in the driver's home timezone, as in the
+    planner's ledger (or since the last 34-hour restart).
+    """
+    now = Value(now_min)
+    # One window start per home timezone in use (unknown names count as UTC)
+    zones = drivers.order_by().values_list('home_timezone', flat=True).distinct()
+    calendar_start = Case(
+        *[When(home_timezone=name, then=Value(cycle_window_start(now_min, _zone(name)))) for name in zones],
+        default=Value(cycle_window_start(now_min, ZoneInfo("UTC"))),
+        output_field=IntegerField(),
+    )
+    window_start = OuterRef('cycle_window_start')
+    on_duty = (
+        DutyEvent.objects
+        .filter(driver=OuterRef('pk'), status__in=ON_DUTY_STATUSES, start_min__lt=now_min)
+        .filter(end_min__gt=window_start)
+        .values('driver')
+        .annotate(total=Sum(Least(F('end_min'), now) - Greatest(F('start_min'), window_start)))
+        .values('total')
+    )
+
+    return drivers.alias(
+        cycle_window_start=Greatest(calendar_start, F('cycle_start_min')),
+    ).alias(
+        rest_minutes=now - Coalesce(F('off_duty_since_min'), F('last_event_end_min')),
+        cycle_used_minutes=Coalesce(Subquery(on_duty, output_field=IntegerField()), Value(0)),
+    ).annotate(
+        drive_hours=_in_hours(Case(
+            When(rest_minutes__gte=RESET_MIN, then=Value(DRIVE_LIMIT_MIN)),
+            default=Greatest(Value(0), Value(DRIVE_LIMIT_MIN) - F('drive_minutes')),
+        )),
+        window_hours=_in_hours(Case(
+            When(Q(rest_minutes__gte=RESET_MIN) | Q(shift_start_min__isnull=True), then=Value(WINDOW_LIMIT_MIN)),
+            default=Greatest(Value(0), Value(WINDOW_LIMIT_MIN) - (now - F('shift_start_min'))),
+        )),
+        cycle_hours=_in_hours(Case(
+            When(rest_minutes__gte=RESTART_MIN, then=Value(CYCLE_LIMIT_MIN)),
+            default=Greatest(Value(0), Value(CYCLE_LIMIT_MIN) - F('cycle_used_minutes')),
+        )),
+    )
+
+
+def _rest_start(driver):
+    # Start of the rest the driver is on since their last on-duty time
+    if driver.off_duty_since_min is not None:
+        return driver.off_duty_since_min
+    return driver.last_event_end_min
+
+
+def _cycle_start(driver, now_min):
+    # A 34-hour rest still in progress at now_min counts as a restart already
+    if now_min - _rest_start(driver) >= RESTART_MIN:
+        return max(driver.cycle_start_min, round(now_min))
+    return driver.cycle_start_min
+
+
+def prior_duty_hours(driver, start_min, tz, days=7):
+    """
+    On-duty hours for each of the `days` local days before the one containing
+    start_min, oldest first, in one aggregate query. Time before the driver's
+    last 34-hour restart is not counted.
+    """
+    cycle_start = _cycle_start(driver, start_min)
+    bounds = []
+    day_start = local_day_bounds(start_min, tz)[1]
+    for _ in range(days):
+        _, day_start, day_end = local_day_bounds(day_start - 1, tz)
+        lo, hi = round(day_start), round(day_end)
+        bounds.insert(0, (min(max(lo, cycle_start), hi), hi))
+
+    sums = {}
+    for i, (lo, hi) in enumerate(bounds):
+        sums[f"day_{i}"] = Sum(
+            Least(F('end_min'), Value(hi)) - Greatest(F('start_min'), Value(lo)),
+            filter=Q(end_min__gt=lo, start_min__lt=hi),
+        )
+    totals = driver.duty_events.filter(status__in=ON_DUTY_STATUSES).aggregate(**sums)
+    return [max(0, totals[f"day_{i}"] or 0) / 60.0 for i in range(days)]
+
+
+def current_shift(driver, start_min, tz):
+    """
+    The driver's state at start_min, for seeding TripScheduler: on-duty hours
+    earlier on the local day (today_hours), and for a shift not yet ended by
+    a 10-hour rest its start (shift_start_min), driving hours (drive_hours)
+    and driving since the last 30-minute break (continuous_drive_hours).
+    JSON-safe, so it can be part of cache keys and job parameters.
+    """
+    start_min = round(start_min)
+    day_start = round(local_day_bounds(start_min, tz)[1])
+    lo = min(max(day_start, _cycle_start(driver, start_min)), start_min)
+    today = driver.duty_events.filter(
+        status__in=ON_DUTY_STATUSES, end_min__gt=lo, start_min__lt=start_min,
+    ).aggregate(total=Sum(Least(F('end_min'), Value(start_min)) - Greatest(F('start_min'), Value(lo))))
+    shift = {
+        "today_hours": max(0, today["total"] or 0) / 60.0,
+        "shift_start_min": None,
+        "drive_hours": 0.0,
+        "continuous_drive_hours": 0.0,
+    }
+    if driver.shift_start_min is None or start_min - _rest_start(driver) >= RESET_MIN:
+        return shift
+
+    # Walk back through the shift until a break of 30 minutes or more
+    # (off duty, sleeper, on duty or a gap between events)
+    continuous = 0
+    cursor = start_min
+    events = driver.duty_events.filter(
+        end_min__gt=driver.shift_start_min, start_min__lt=start_min,
+    ).order_by('-start_min').values_list('status', 'start_min', 'end_min')
+    for status, event_start, event_end in events:
+        event_end = min(event_end, cursor)
+        if cursor - event_end >= 30:
+            break
+        if status == DutyEvent.DRIVING:
+            continuous += event_end - event_start
+        elif event_end - event_start >= 30:
+            break
+        cursor = event_start
+
+    shift.update(
+        shift_start_min=driver.shift_start_min,
+        drive_hours=driver.drive_minutes / 60.0,
+        continuous_drive_hours=continuous / 60.0,
+    )
+    return shift
@@ -0,0 +1,85 @@
+import sys
+from datetime import datetime, time, timedelta, timezone
+
+# Epoch for naive datetimes: naive times are treated as wall-clock minutes
+_NAIVE_EPOCH = datetime(1970, 1, 1)
+_AWARE_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_epoch_minutes(dt):
+    """
+    Minutes since 1970-01-01. Aware datetimes give true epoch minutes; naive
+    datetimes are measured on their own wall clock (no timezone applied).
+    """
+    if dt.tzinfo is None:
+        return (dt - _NAIVE_EPOCH).total_seconds() / 60.0
+    return (dt - _AWARE_EPOCH).total_seconds() / 60.0
+
+
+def from_epoch_minutes(minutes, tzinfo=None):
+    if tzinfo is None:
+        return _NAIVE_EPOCH + timedelta(minutes=minutes)
+    return (_AWARE_EPOCH + timedelta(minutes=minutes)).astimezone(tzinfo)
+
+
+def local_day_bounds(epoch_min, tz):
+    """
+    (date, start_min, end_min) of the calendar day in `tz` containing epoch_min.
+    Days are 23 or 25 hours long across daylight-saving changes.
+    """
+    day = from_epoch_minutes(epoch_min, tz).date()
+    start = to_epoch_minutes(datetime.combine(day, time(0), tz))
+    end = to_epoch_minutes(datetime.combine(day + timedelta(days=1), time(0), tz))
+    return day, start, end
+
+
+class DutyRecord:
+    """
+    One duty-status interval of a planned trip, kept in memory from the
+    scheduler to the drawer (stored history is models.DutyEvent).
+    start_min is in epoch minutes (see to_epoch_minutes), duration in minutes;
+    location and remark are interned since the same few strings repeat.
+    Status codes: 1 Off Duty, 2 Sleeper, 3 Driving, 4 On Duty.
+    """
+    __slots__ = ("status", "start_min", "duration", "location", "remark", "tzinfo")
+
+    def __init__(self, status, start_min, duration, location, remark, tzinfo=None):
+        self.status = status
+        self.start_min = start_min
+        self.duration = duration
+        self.location = sys.intern(location or "")
+        self.remark = sys.intern(remark or "")
+        self.tzinfo = tzinfo
+
+    @property
+    def end_min(self):
+        return self.start_min + self.duration
+
+    @property
+    def start(self):
+        return from_epoch_minutes(self.start_min, self.tzinfo)
+
+    @property
+    def end(self):
+        return from_epoch_minutes(self.end_min, self.tzinfo)
+
+    # Read-only dict-style access, for callers written against the old event dicts
+    def __getitem__(self, key):
+        if key not in ("status", "start", "end", "duration", "location", "remark"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"DutyRecord({self.status}, {self.start_min:.1f}, {self.duration:.1f}, {self.location!r}, {self.remark!r})"
+
+
+class DaySegment:
+    """
+    A duty interval clipped to one log day, positioned on the 24-hour grid.
+    """
+    __slots__ = ("status", "start_hour", "duration_hours")
+
+    def __init__(self, status, start_hour, duration_hours):
+        self.status = status
+        self.start_hour = start_hour
+        self.duration_hours = duration_hours
@@ -0,0 +1,121 @@
+from collections import deque
+
+from .duty_log import local_day_bounds
+
+# Cycle hours at or below this count as none left (shared with the scheduler)
+EPSILON = 1e-6
+
+
+class CycleLedger:
+    """
+    Rolling on-duty ledger for the 70-hour / 8-day rule.
+
+    Keeps one on-duty bucket (minutes) per local day for the last
+    `window_days` days, plus their running sum, so recording on-duty time and
+    asking "hours used in the window" are both O(1). Each day is summarised in
+    `recaps` when it closes, which feeds the log sheet's recap table.
+    """
+    def __init__(self, start_min, tz=None, prior_days=(), limit_hours=70, window_days=8, today_hours=0):
+        """
+        prior_days: on-duty hours for the days before the start day, oldest
+        first (only the last window_days - 1 are kept). today_hours: on-duty
+        hours already worked on the start day before start_min.
+        """
+        self.tz = tz
+        self.limit_minutes = limit_hours * 60
+        self.window_days = window_days
+        self.buckets = deque(maxlen=window_days)
+        for hours in list(prior_days)[-(window_days - 1):]:
+            self.buckets.append(float(hours) * 60)
+        # Pad missing history with empty days, then open the start day
+        while len(self.buckets) < window_days - 1:
+            self.buckets.appendleft(0.0)
+        self.buckets.append(0.0)
+        self.used_before_today = sum(self.buckets)
+
+        # Open the start day with the time already worked on it
+        self.buckets[-1] = float(today_hours) * 60
+        self.window_minutes = self.used_before_today + self.buckets[-1]
+        self.day, self.day_start_min, self.day_end_min = local_day_bounds(start_min, tz)
+        self.worked_today = self.buckets[-1]
+        self.recaps = {}
+
+    def used_hours(self):
+        # On-duty hours in the current 8-day window (including today)
+        return self.window_minutes / 60.0
+
+    def available_hours(self):
+        return max(0.0, (self.limit_minutes - self.window_minutes) / 60.0)
+
+    def _close_day(self):
+        used_last_7 = self.used_before_today / 60.0
+        total = self.window_minutes / 60.0
+        # Tomorrow the oldest day drops out of the window
+        oldest = self.buckets[0] if len(self.buckets) == self.window_days else 0.0
+        available_tomorrow = (self.limit_minutes - (self.window_minutes - oldest)) / 60.0
+        self.recaps[self.day] = {
+            'limit': f"{self.limit_minutes // 60} / {self.window_days}",
+            'used_last_7': used_last_7,
+            'available_today': max(0.0, self.limit_minutes / 60.0 - used_last_7),
+            'worked_today': self.worked_today / 60.0,
+            'total_since_start': total,
+            'available_tomorrow': max(0.0, available_tomorrow),
+        }
+
+    def advance_to(self, epoch_min):
+        """
+        Roll the window forward to the day containing epoch_min, closing every
+        day passed on the way.
+        """
+        while epoch_min >= self.day_end_min:
+            self._close_day()
+            if len(self.buckets) == self.window_days:
+                self.window_minutes -= self.buckets[0]
+            self.buckets.append(0.0)
+            self.day, self.day_start_min, self.day_end_min = local_day_bounds(self.day_end_min, self.tz)
+            self.used_before_today = self.window_minutes
+            self.worked_today = 0.0
+
+    def minutes_until_available(self, now_min):
+        """
+        Minutes from now_min (in the current day) until old days rolling out
+        of the window free some cycle hours: 0 if hours are available now,
+        None if nothing frees up before today itself would roll out.
+        """
+        if (self.limit_minutes - self.window_minutes) / 60.0 > EPSILON:
+            return 0
+        # At each coming midnight the oldest remaining day drops out
+        freed = 0.0
+        midnight = self.day_end_min
+        for minutes in list(self.buckets)[:-1]:
+            freed += minutes
+            if (self.limit_minutes - (self.window_minutes - freed)) / 60.0 > EPSILON:
+                return midnight - now_min
+            midnight = local_day_bounds(midnight, self.tz)[2]
+        return None
+
+    def add_on_duty(self, start_min, end_min):
+        # Driving or on-duty interval, split at local midnight
+        while start_min < end_min:
+            self.advance_to(start_min)
+            clipped_end = min(end_min, self.day_end_min)
+            minutes = clipped_end - start_min
+            self.buckets[-1] += minutes
+            self.window_minutes += minutes
+            self.worked_today += minutes
+            start_min = clipped_end
+
+    def restart(self):
+        """
+        34-hour restart: on-duty time before it no longer counts toward the cycle.
+        """
+        for i in range(len(self.buckets)):
+            self.buckets[i] = 0.0
+        self.window_minutes = 0.0
+        self.used_before_today = 0.0
+
+    def recap_for(self, day):
+        """
+        Recap values for a closed day (advance_to past its end first).
+        """
+        return self.recaps.get(day)
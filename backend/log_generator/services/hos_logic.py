@@ -1,42 +1,63 @@
-from datetime import datetime, timedelta
 import random
 
+from .duty_log import DutyRecord, from_epoch_minutes, to_epoch_minutes
+from .hos_ledger import EPSILON, CycleLedger
+from .route_index import RouteIndex, state_at
+
+# EPSILON (hours / miles) is the tolerance for treating a boundary as reached.
+# It is the ledger's, so "no cycle hours left" means the same thing in both.
+
 class TripScheduler:
-    def __init__(self, start_time, cycle_used_hours=0):
-        self.current_time = start_time
-        # cycle_used_hours is the amount used in the last 7 days + today so far (before this trip)
-        self.cycle_used = cycle_used_hours
+    def __init__(self, start_time, cycle_used_hours=0, prior_days=None, shift=None):
+        # Clock is kept in epoch minutes (see duty_log.to_epoch_minutes)
+        self.tzinfo = start_time.tzinfo
+        self.current_min = to_epoch_minutes(start_time)
+        # Rolling 70/8 ledger. prior_days is the on-duty hours of the previous
+        # 7 days (oldest first); without it, cycle_used_hours (the amount used
+        # in the last 7 days + today so far) is booked as yesterday, so it
+        # stays in the window for as long as possible.
+        if prior_days is None:
+            prior_days = [cycle_used_hours]
+        # shift: the driver's state at start_time (see duty_history.current_shift),
+        # so a plan continues the day's hours and open shift instead of starting fresh
+        shift = shift or {}
+        self.ledger = CycleLedger(self.current_min, self.tzinfo, prior_days,
+                                  today_hours=shift.get('today_hours', 0))
         self.events = []
         
-        self.drive_time_today = 0
-        self.on_duty_time_start = self.current_time
-        self.drive_time_continuous = 0
+        self.drive_time_today = shift.get('drive_hours', 0)
+        shift_start = shift.get('shift_start_min')
+        self.on_duty_start_min = shift_start if shift_start is not None else self.current_min
+        self.drive_time_continuous = shift.get('continuous_drive_hours', 0)
         self.miles_since_fuel = 0
         
-        # Track daily on-duty totals for 70/8 rule
-        # Simplified: We just add to a running total since we don't have full 8-day history
-        self.cycle_used_at_start = cycle_used_hours
+        self.cycle_used_at_start = self.ledger.used_hours()
+
+    @property
+    def cycle_used(self):
+        # On-duty hours in the current 8-day window
+        return self.ledger.used_hours()
+
+    @property
+    def current_time(self):
+        return from_epoch_minutes(self.current_min, self.tzinfo)
+
+    @property
+    def on_duty_time_start(self):
+        return from_epoch_minutes(self.on_duty_start_min, self.tzinfo)
         
     def add_event(self, status, duration_minutes, location, remark):
-        start = self.current_time
-        end = start + timedelta(minutes=duration_minutes)
-        self.events.append({
-            "status": status,
-            "start": start,
-            "end": end,
-            "duration": duration_minutes,
-            "location": location,
-            "remark": remark
-        })
-        self.current_time = end
+        start_min = self.current_min
+        self.events.append(DutyRecord(status, start_min, duration_minutes, location, remark, self.tzinfo))
+        self.current_min += duration_minutes
         
         # Update HOS Counters
         if status == 3: # Driving
             self.drive_time_today += (duration_minutes / 60.0)
             self.drive_time_continuous += (duration_minutes / 60.0)
-            self.cycle_used += (duration_minutes / 60.0)
+            self.ledger.add_on_duty(start_min, self.current_min)
         elif status == 4: # On Duty
-            self.cycle_used += (duration_minutes / 60.0)
+            self.ledger.add_on_duty(start_min, self.current_min)
             # On Duty event >= 30 mins counts as a break (FMCSA rule)
             if duration_minutes >= 30:
                 self.drive_time_continuous = 0
@@ -46,35 +67,15 @@ class TripScheduler:
                  self.reset_clocks()
             if duration_minutes >= 30:
                 self.drive_time_continuous = 0
-            # 34-hour restart (Simplified check)
+            # 34-hour restart: close the days it spans, then start a fresh cycle
             if duration_minutes >= 2040: # 34 * 60
-                self.cycle_used = 0
+                self.ledger.advance_to(self.current_min)
+                self.ledger.restart()
 
     def reset_clocks(self):
         self.drive_time_today = 0
         self.drive_time_continuous = 0
-        self.on_duty_time_start = self.current_time
-
-    def check_break_needed(self, needed_drive_hours):
-        if self.drive_time_continuous + needed_drive_hours > 8:
-            return True, (8 - self.drive_time_continuous)
-        return False, 0
-
-    def check_reset_needed(self, needed_drive_hours, needed_total_hours):
-        # 11 hour driving limit
-        if self.drive_time_today + needed_drive_hours > 11:
-            return True
-        # 14 hour window check
-        window_elapsed = (self.current_time - self.on_duty_time_start).total_seconds() / 3600
-        if window_elapsed + needed_total_hours > 14:
-            return True
-        return False
-        
-    def check_cycle_violation(self):
-        # 70 hours in 8 days
-        if self.cycle_used > 70:
-            return True
-        return False
+        self.on_duty_start_min = self.current_min
 
     def _get_state(self, loc_str):
         if not loc_str: return ""
@@ -85,101 +86,97 @@ class TripScheduler:
                 return part
         return ""
 
-    def drive_leg(self, distance_miles, duration_hours, start_loc, end_loc):
+    def hours_until_reset(self):
+        # Whichever of the 11-hour driving limit and the 14-hour window runs out first
+        window_elapsed = (self.current_min - self.on_duty_start_min) / 60
+        return min(11 - self.drive_time_today, 14 - window_elapsed)
+
+    def drive_leg(self, distance_miles, duration_hours, start_loc, end_loc, geometry=None):
+        """
+        Event-driven leg simulation: each iteration either drives straight to
+        the nearest constraint boundary (30-min break at 8h, 11h driving,
+        14h window, 70h cycle, 1000-mile fuel, end of leg) as one merged
+        segment, or takes the break/reset/fuel stop that boundary requires.
+        Cost is proportional to the number of duty changes, not hours driven.
+        Driving segments are labelled with their start coordinates along
+        `geometry` (the leg's GeoJSON LineString) and the state containing
+        them, so identical inputs give identical events.
+        """
         avg_speed = distance_miles / duration_hours if duration_hours > 0 else 50
         
         remaining_miles = distance_miles
-        remaining_hours = duration_hours
         
         start_state = self._get_state(start_loc)
         end_state = self._get_state(end_loc)
+        route_index = RouteIndex.from_geometry(geometry)
+        # Without geometry, highway numbers come from a generator seeded by the leg
+        rng = random.Random(f"{start_loc}|{end_loc}")
         
-        loop_guard = 0
-        while remaining_miles > 0:
-            loop_guard += 1
-            if loop_guard > 500: # increased guard for long trips
-                break
-            
-            # Check Fuel
-            if self.miles_since_fuel + remaining_miles > 1000:
-                # Need fuel before destination?
-                dist_can_drive = 1000 - self.miles_since_fuel
-                if dist_can_drive < remaining_miles:
-                    # Drive to fuel stop
-                    drive_hrs = dist_can_drive / avg_speed
-                    # We will handle this by shortening the step below if needed, 
-                    # but actually we can just rely on the step loop logic if we cap step_miles
-                    pass 
-
-            # Step determination
-            step_hours = min(1, remaining_hours)
-            if step_hours < 0.1: step_hours = remaining_hours
-            step_miles = step_hours * avg_speed
-            
-            # 1. Fuel Check during step
-            if self.miles_since_fuel + step_miles > 1000:
-                # Drive only until fuel needed
-                miles_to_fuel = 1000 - self.miles_since_fuel
-                hours_to_fuel = miles_to_fuel / avg_speed
-                if hours_to_fuel > 0.01:
-                    step_hours = hours_to_fuel
-                    step_miles = miles_to_fuel
-                    # After this step we WILL fuel
-            
-            # 2. Break Check
-            break_needed, time_til_break = self.check_break_needed(step_hours)
-            if break_needed and time_til_break < step_hours:
-                partial_hours = max(0, time_til_break)
-                if partial_hours > 0.01:
-                    # Determine location for this short drive
-                    # Simple interpolation of state? 
-                    curr_state = start_state if remaining_miles > (distance_miles/2) else end_state
-                    if not curr_state: curr_state = "US"
-                    hwy_num = random.randint(1, 99)
-                    
-                    self.add_event(3, partial_hours*60, f"Highway I-{hwy_num}, {curr_state}", "Driving")
-                    remaining_hours -= partial_hours
-                    remaining_miles -= (partial_hours * avg_speed)
-                    self.miles_since_fuel += (partial_hours * avg_speed)
-                
-                self.add_event(1, 30, "Rest Area", "30-min Rest Break")
-                continue
-            
-            # 3. Daily Reset Check (11/14 rule)
-            if self.check_reset_needed(step_hours, step_hours):
+        while remaining_miles > EPSILON:
+            # 1. Daily Reset (11/14 rule)
+            until_reset = self.hours_until_reset()
+            if until_reset <= EPSILON:
                 self.add_event(2, 600, "Truck Stop", "10-hour Sleeper Berth Reset")
                 continue
 
-            # 4. Weekly Cycle Check
-            # If adding this drive puts us over 70...
-            if self.cycle_used + step_hours > 70:
-                # We need a 34 hour restart!
-                self.add_event(1, 2040, "Truck Stop", "34-Hour Cycle Restart")
+            # 2. Weekly Cycle (70 hours in 8 days), after rolling the window to now
+            self.ledger.advance_to(self.current_min)
+            until_cycle = self.ledger.available_hours()
+            if until_cycle <= EPSILON:
+                # Rest until enough old on-duty time rolls out of the window,
+                # or take a 34-hour restart if that is sooner. A wait of ~0
+                # would make no progress, so it also restarts.
+                wait = self.ledger.minutes_until_available(self.current_min)
+                if wait is not None and EPSILON * 60 < wait < 2040:
+                    self.add_event(1, wait, "Truck Stop", "Off Duty - Waiting for Cycle Hours")
+                else:
+                    self.add_event(1, 2040, "Truck Stop", "34-Hour Cycle Restart")
+                continue
+
+            # 3. 30-min break after 8 hours of driving
+            until_break = 8 - self.drive_time_continuous
+            if until_break <= EPSILON:
+                self.add_event(1, 30, "Rest Area", "30-min Rest Break")
+                continue
+
+            # 4. Fuel every 1000 miles
+            miles_to_fuel = 1000 - self.miles_since_fuel
+            if miles_to_fuel <= EPSILON:
+                self.add_event(4, 30, "Fuel Station", "Fueling - On Duty")
+                self.miles_since_fuel = 0
                 continue
 
-            # If all safe, Drive
-            # Safety check: ensure we move forward
-            if step_hours < 0.001:
-                 # Force a minimal step to avoid infinite loop
-                 step_hours = 0.001
+            # Drive up to the nearest boundary in one segment
+            step_hours = min(
+                remaining_miles / avg_speed,
+                until_reset,
+                until_cycle,
+                until_break,
+                miles_to_fuel / avg_speed,
+            )
+            step_miles = min(step_hours * avg_speed, remaining_miles)
             
             # Dynamic Location
-            # rough proxy for progress
-            curr_state = start_state if remaining_miles > (distance_miles/2) else end_state
-            if not curr_state: curr_state = "US"
-            hwy_num = random.randint(1, 99)
-            loc_str = f"Highway I-{hwy_num}, {curr_state}"
+            if route_index is not None:
+                # The state comes from the position itself, not the trip
+                # endpoints; coordinates alone where no state matches
+                lat, lon = route_index.position_at(1 - remaining_miles / distance_miles)
+                state = state_at(lat, lon)
+                loc_str = f"{lat:.2f}, {lon:.2f}, {state}" if state else f"{lat:.2f}, {lon:.2f}"
+            else:
+                # rough proxy for progress
+                curr_state = start_state if remaining_miles > (distance_miles/2) else end_state
+                if not curr_state: curr_state = "US"
+                loc_str = f"Highway I-{rng.randint(1, 99)}, {curr_state}"
             
             self.add_event(3, step_hours*60, loc_str, "Driving")
             
             # Update counters
-            remaining_hours -= step_hours
-            step_miles_actual = (step_hours * avg_speed) # Re-calculate based on final step_hours
-            remaining_miles -= step_miles_actual
-            self.miles_since_fuel += step_miles_actual
+            remaining_miles -= step_miles
+            self.miles_since_fuel += step_miles
             
             # Post-Drive actions
-            if self.miles_since_fuel >= 1000:
+            if self.miles_since_fuel >= 1000 - EPSILON:
                 # Fueling event
                 self.add_event(4, 30, "Fuel Station", "Fueling - On Duty")
                 self.miles_since_fuel = 0
@@ -0,0 +1,266 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from ..models import PlanJob
+from .cache import get_setting
+from .planner import build_plan, get_cached_plan, get_interactive_pool, get_plan_cache, get_process_pool
+from .routing import geocode, get_multi_leg_route
+
+logger = logging.getLogger(__name__)
+
+
+def job_params(locations, cycle_used, start_time, prior_days, image_options=None, shift=None):
+    # JSON-safe form of validated plan inputs
+    return {
+        "locations": locations,
+        "cycle_used": cycle_used,
+        "start_time": start_time.isoformat(),
+        "timezone": str(start_time.tzinfo),
+        "prior_days": prior_days,
+        "image_options": image_options,
+        "shift": shift,
+    }
+
+
+def _plan_args(params):
+    # Back to (locations, cycle_used, start_time, prior_days, image_options, shift) with the named zone restored
+    start_time = datetime.fromisoformat(params["start_time"]).astimezone(ZoneInfo(params["timezone"]))
+    return (params["locations"], params["cycle_used"], start_time, params["prior_days"],
+            params.get("image_options"), params.get("shift"))
+
+
+def submit_job(locations, cycle_used, start_time, prior_days, image_options, cache_key,
+               priority=PlanJob.INTERACTIVE, shift=None):
+    """
+    Queue a plan and wake the workers. A plan already in the cache gives a
+    job that is done immediately.
+    """
+    params = job_params(locations, cycle_used, start_time, prior_days, image_options, shift)
+    plan = get_cached_plan(cache_key)
+    if plan is not None:
+        now = timezone.now()
+        return PlanJob.objects.create(
+            params=params, cache_key=cache_key, priority=priority,
+            status=PlanJob.DONE, result=plan, started_at=now, finished_at=now,
+        )
+
+    job = PlanJob.objects.create(params=params, cache_key=cache_key, priority=priority)
+    if get_setting("PLAN_JOB_START_WORKERS", True):
+        get_job_pool().start()
+    get_job_pool().notify()
+    return job
+
+
+def claim_next_job(max_priority=None, worker=""):
+    """
+    Mark the next queued job (lowest priority value, then oldest) as running
+    under `worker` and return it, or None. Safe across threads and processes:
+    the claim is a conditional UPDATE, so only one worker gets each job.
+    """
+    queued = PlanJob.objects.filter(status=PlanJob.QUEUED)
+    if max_priority is not None:
+        queued = queued.filter(priority__lte=max_priority)
+    for job_id in queued.order_by('priority', 'created_at').values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = PlanJob.objects.filter(pk=job_id, status=PlanJob.QUEUED).update(
+            status=PlanJob.RUNNING, started_at=now, heartbeat_at=now, worker=worker
+        )
+        if claimed:
+            return PlanJob.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job):
+    """
+    Geocode, route, schedule and render one claimed job, storing the result.
+    Returns False if the job was requeued and claimed by another worker in the
+    meantime; its result is then left to that worker.
+    """
+    try:
+        locations, cycle_used, start_time, prior_days, image_options, shift = _plan_args(job.params)
+        coords = [geocode(loc) for loc in locations]
+        if not all(coords):
+            raise ValueError("Could not geocode locations")
+        route_1, route_2 = get_multi_leg_route(coords)
+        # Scheduling and rendering are CPU-bound: run them in worker processes.
+        # Interactive jobs have their own pool, so a bulk backlog on the
+        # shared pool does not delay them.
+        pool = get_interactive_pool() if job.priority <= PlanJob.INTERACTIVE else get_process_pool()
+        plan = pool.submit(
+            build_plan, *locations, route_1, route_2, cycle_used, start_time, prior_days, image_options, shift
+        ).result()
+        get_plan_cache().set(job.cache_key, plan)
+        job.status, job.result = PlanJob.DONE, plan
+    except Exception as e:
+        logger.exception("Plan job %s failed", job.id)
+        job.status, job.error = PlanJob.FAILED, str(e)
+    job.finished_at = timezone.now()
+    # Only the worker that still owns the job may finish it
+    saved = PlanJob.objects.filter(pk=job.pk, status=PlanJob.RUNNING, worker=job.worker).update(
+        status=job.status, result=job.result, error=job.error, finished_at=job.finished_at
+    )
+    if not saved:
+        logger.warning("Plan job %s was taken over by another worker; dropping this result", job.id)
+    return bool(saved)
+
+
+def heartbeat(job_ids, worker):
+    # Mark running jobs as alive; returns how many `worker` still owns
+    return PlanJob.objects.filter(pk__in=job_ids, status=PlanJob.RUNNING, worker=worker).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def requeue_stale_jobs(timeout):
+    # Jobs whose worker stopped sending heartbeats (it died) are put back in the queue
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return PlanJob.objects.filter(status=PlanJob.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=PlanJob.QUEUED, started_at=None, heartbeat_at=None, worker=""
+    )
+
+
+class JobWorkerPool:
+    """
+    Local worker threads that take jobs from the PlanJob table.
+    At most `bulk_slots` workers run bulk jobs at once, so interactive jobs
+    always have a free worker even while a large bulk submission drains.
+    Idle workers requeue jobs whose worker died at most once per
+    `maintenance_interval` seconds across the pool.
+    A heartbeat thread refreshes the running jobs every `heartbeat_interval`
+    seconds; jobs without a heartbeat for `stale_timeout` seconds are requeued.
+    """
+    def __init__(self, workers=2, bulk_slots=1, poll_interval=1.0, stale_timeout=120, maintenance_interval=60,
+                 heartbeat_interval=30):
+        self.workers = workers
+        self.bulk_slots = min(bulk_slots, workers)
+        self.poll_interval = poll_interval
+        self.stale_timeout = stale_timeout
+        self.maintenance_interval = maintenance_interval
+        self.heartbeat_interval = heartbeat_interval
+        # Unique across hosts and processes; each thread appends its index
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running = {} # job id -> worker id of the thread running it
+        self._next_maintenance = time.monotonic() + maintenance_interval
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._bulk_running = 0
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            requeue_stale_jobs(self.stale_timeout)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, args=(f"{self.worker_id}/{i}",),
+                                          name=f"plan-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="plan-job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _claim(self, worker):
+        with self._lock:
+            bulk_allowed = self._bulk_running < self.bulk_slots
+            job = claim_next_job(None if bulk_allowed else PlanJob.INTERACTIVE, worker)
+            if job is not None:
+                self._running[job.pk] = worker
+                if job.priority > PlanJob.INTERACTIVE:
+                    self._bulk_running += 1
+            return job
+
+    def _beat(self):
+        with self._lock:
+            running = list(self._running.items())
+        for job_id, worker in running:
+            heartbeat([job_id], worker)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self._beat()
+            except Exception:
+                logger.exception("Plan job heartbeat failed")
+            finally:
+                close_old_connections()
+
+    def _maintenance_due(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_maintenance:
+                return False
+            self._next_maintenance = now + self.maintenance_interval
+            return True
+
+    def _maintain(self):
+        try:
+            requeued = requeue_stale_jobs(self.stale_timeout)
+            if requeued:
+                logger.warning("Requeued %d stale plan jobs", requeued)
+        except Exception:
+            logger.exception("Plan job maintenance failed")
+        finally:
+            close_old_connections()
+
+    def _run(self, worker):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                job = self._claim(worker)
+            except Exception:
+                logger.exception("Could not claim a plan job")
+                job = None
+            if job is None:
+                if self._maintenance_due():
+                    self._maintain()
+                self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                run_job(job)
+            finally:
+                with self._lock:
+                    del self._running[job.pk]
+                    if job.priority > PlanJob.INTERACTIVE:
+                        self._bulk_running -= 1
+                close_old_connections()
+
+
+_job_pool_lock = threading.Lock()
+_job_pool = None
+
+
+def get_job_pool():
+    global _job_pool
+    with _job_pool_lock:
+        if _job_pool is None:
+            _job_pool = JobWorkerPool(
+                workers=get_setting("PLAN_JOB_WORKERS", 2),
+                bulk_slots=get_setting("PLAN_JOB_BULK_SLOTS", 1),
+                poll_interval=get_setting("PLAN_JOB_POLL_INTERVAL", 1.0),
+                stale_timeout=get_setting("PLAN_JOB_STALE_TIMEOUT", 120),
+                maintenance_interval=get_setting("PLAN_JOB_MAINTENANCE_INTERVAL", 60),
+                heartbeat_interval=get_setting("PLAN_JOB_HEARTBEAT_INTERVAL", 30),
+            )
+        return _job_pool
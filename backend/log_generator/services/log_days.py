@@ -0,0 +1,112 @@
+from .duty_log import DaySegment, from_epoch_minutes, local_day_bounds
+
+# Status codes
+OFF_DUTY, SLEEPER, DRIVING, ON_DUTY = 1, 2, 3, 4
+
+
+class LogDay:
+    """
+    One log day in the home-terminal timezone: its [start_min, end_min)
+    interval in epoch minutes, the duty segments clipped to it and the exact
+    per-status minutes.
+    """
+    __slots__ = ("date", "start_min", "end_min", "segments", "minutes", "remarks", "from_city", "to_city")
+
+    def __init__(self, day, start_min, end_min):
+        self.date = day
+        self.start_min = start_min
+        self.end_min = end_min
+        self.segments = []
+        self.minutes = [0.0, 0.0, 0.0, 0.0] # Off, SB, Drive, On
+        self.remarks = []
+        self.from_city = None
+        self.to_city = None
+
+    @property
+    def length_hours(self):
+        # 24, or 23/25 on daylight-saving changeover days
+        return (self.end_min - self.start_min) / 60.0
+
+    def add(self, status, start_min, end_min, location):
+        duration = end_min - start_min
+        if duration <= 0:
+            return
+        self.segments.append(DaySegment(status, (start_min - self.start_min) / 60.0, duration / 60.0))
+        self.minutes[status - 1] += duration
+        if self.from_city is None:
+            self.from_city = location
+        self.to_city = location
+
+    def totals_hours(self, places=2):
+        """
+        Per-status hours rounded to `places`, distributing the rounding so the
+        displayed values add up to the day length exactly.
+        """
+        unit = 10 ** places
+        exact = [m / 60.0 * unit for m in self.minutes]
+        target = round(self.length_hours * unit)
+        floors = [int(x) for x in exact]
+        # Largest remainders get the leftover hundredths
+        order = sorted(range(len(exact)), key=lambda i: exact[i] - floors[i], reverse=True)
+        for i in order[:max(0, target - sum(floors))]:
+            floors[i] += 1
+        return [f / unit for f in floors]
+
+
+def _local_day(epoch_min, tz):
+    # LogDay for the local calendar day containing epoch_min
+    return LogDay(*local_day_bounds(epoch_min, tz))
+
+
+class _DayIndex:
+    """
+    Builds consecutive LogDays while spans are added in chronological order.
+    """
+    def __init__(self, tz, epoch_min):
+        self.tz = tz
+        self.days = [_local_day(epoch_min, tz)]
+
+    def day_at(self, epoch_min):
+        day = self.days[-1]
+        while epoch_min >= day.end_min:
+            day = _local_day(day.end_min, self.tz)
+            self.days.append(day)
+        return day
+
+    def add_span(self, status, start_min, end_min, location):
+        # Clip the span at each local midnight it crosses
+        while start_min < end_min:
+            day = self.day_at(start_min)
+            clipped_end = min(end_min, day.end_min)
+            day.add(status, start_min, clipped_end, location)
+            start_min = clipped_end
+
+
+def partition_days(events, tz, first_location=None, last_location=None):
+    """
+    Clip duty events at local midnight in `tz` (the home-terminal timezone) and
+    index them by log day, in one pass over the (chronological) events.
+    Time before the first event and after the last on their log days is
+    recorded as Off Duty, so every day accounts for its full length.
+    Returns the LogDay list in date order.
+    """
+    if not events:
+        return []
+
+    first = events[0]
+    index = _DayIndex(tz, first.start_min)
+    cursor = index.days[0].start_min
+    location = first_location or first.location
+
+    for e in events:
+        # Anything not covered by an event (before the trip, or gaps) is Off Duty
+        index.add_span(OFF_DUTY, cursor, e.start_min, location)
+        local_start = from_epoch_minutes(e.start_min, tz)
+        index.day_at(e.start_min).remarks.append(f"{local_start.strftime('%H:%M')} - {e.location} - {e.remark}")
+        index.add_span(e.status, e.start_min, e.end_min, e.location)
+        cursor = max(cursor, e.end_min)
+        location = e.location
+
+    # Rest of the last day is Off Duty
+    index.add_span(OFF_DUTY, cursor, index.days[-1].end_min, last_location or location)
+    return index.days
@@ -0,0 +1,202 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; covers a cached lookup up to a multi-week trip render
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels, e.g. counter.inc(upstream="osrm").
+    """
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labels, key), value
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus semantics), values in seconds.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {} # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), key + (le,)), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, key), counts[-1]
+            yield f"{self.name}_count", _format_labels(self.labels, key), cumulative
+
+
+class Registry:
+    """
+    Metrics of this process, rendered in the Prometheus text format.
+    Callbacks are evaluated at render time, for values kept elsewhere
+    (e.g. cache hit counts).
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def callback(self, func):
+        """
+        func() yields (name, type, help, {label: value}, value) tuples.
+        """
+        with self._lock:
+            self._callbacks.append(func)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            callbacks = list(self._callbacks)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+
+        # Samples of one metric must be contiguous, so group callback output by name
+        families = {}
+        for func in callbacks:
+            for name, kind, help_text, labels, value in func():
+                family = families.setdefault(name, (kind, help_text, []))
+                family[2].append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "plan_stage_seconds", "Time spent in each plan pipeline stage.", labels=("stage",)
+)
+upstream_requests = registry.counter(
+    "upstream_requests_total", "Upstream HTTP calls by outcome (ok, error, circuit_open).",
+    labels=("upstream", "outcome"),
+)
+upstream_seconds = registry.histogram(
+    "upstream_request_seconds", "Upstream HTTP call latency, retries included.", labels=("upstream",)
+)
+routing_errors = registry.counter(
+    "routing_provider_errors_total", "Routing provider failures (the next provider is tried).", labels=("provider",)
+)
+routing_fallbacks = registry.counter(
+    "routing_fallbacks_total", "Routes answered with straight-line legs because every provider failed."
+)
+geocode_failures = registry.counter("geocode_failures_total", "Addresses that could not be geocoded.")
+http_requests = registry.counter(
+    "http_requests_total", "API requests by view and status code.", labels=("view", "status")
+)
+http_request_seconds = registry.histogram(
+    "http_request_seconds", "API request latency until the response headers.", labels=("view",)
+)
+
+
+# Per-request stage timings for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+# Spans of one request may finish on several render threads at once
+_timings_lock = threading.Lock()
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collect the spans finished in this context (and the threads started with
+    a copy of it) into a {stage: seconds} dict.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a pipeline stage into plan_stage_seconds and the current request's
+    Server-Timing entries.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            with _timings_lock:
+                timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -1,5 +1,32 @@
 from PIL import Image, ImageDraw, ImageFont
 import io
+import tempfile
+import threading
+
+from .metrics import span
+from .vector_pdf import PdfCanvas, VectorPdfWriter
+
+# Static form images (and vector operators) keyed by LogSheetDrawer.template_key()
+_template_cache = {}
+_vector_template_cache = {}
+_template_lock = threading.Lock()
+
+# Every colour the sheet is drawn with, plus grays for the antialiased text
+# edges: white, black, blue, gray, lightgray, then 10 evenly spaced grays
+_LOG_COLOURS = [(255, 255, 255), (0, 0, 0), (0, 0, 255), (128, 128, 128), (211, 211, 211)] + [
+    (int(i * 255 / 11),) * 3 for i in range(1, 11)
+]
+_palette_image = Image.new('P', (1, 1))
+_palette_image.putpalette([c for colour in _LOG_COLOURS for c in colour] + [0] * 3 * (256 - len(_LOG_COLOURS)))
+
+# Lookup tables for "mono": every non-white shade becomes black, except on
+# the black hour bar, where the white labels use a 50% threshold
+_MONO_THRESHOLD = [255 if v > 240 else 0 for v in range(256)]
+_MONO_BAR_THRESHOLD = [255 if v >= 128 else 0 for v in range(256)]
+
+# Output format -> artifact extension.
+# png: full-colour RGB; palette: 16-colour PNG; mono: 1-bit PNG; webp: lossless WebP
+IMAGE_FORMATS = {"png": "png", "palette": "png", "mono": "png", "webp": "webp"}
 
 class LogSheetDrawer:
     def __init__(self):
@@ -15,56 +42,77 @@ class LogSheetDrawer:
         self.grid_width = 1400  # Wider for landscape
         self.hour_width = self.grid_width / 24
         
+    def hour_bar_box(self):
+        # Black bar with white hour labels above the grid: [(x0, y0), (x1, y1)]
+        x0 = self.margin_x + 150
+        return [(x0, self.grid_top - 40), (x0 + self.grid_width, self.grid_top)]
+
+    def template_key(self):
+        # Everything the static form depends on
+        return (self.width, self.height, self.margin_x, self.margin_y,
+                self.grid_top, self.grid_height, self.grid_width)
+
+    def get_template(self):
+        """
+        The static part of the form (boxes, grid, labels, recap table), rendered
+        once per drawer configuration and shared by every page.
+        Callers must copy() it before drawing on it.
+        """
+        key = self.template_key()
+        template = _template_cache.get(key)
+        if template is None:
+            with _template_lock:
+                template = _template_cache.get(key)
+                if template is None:
+                    template = Image.new('RGB', (self.width, self.height), color='white')
+                    self.draw_template(ImageDraw.Draw(template))
+                    _template_cache[key] = template
+        return template
+
     def create_blank_log(self, day_info, driver_name):
         # day_info is a dict: {date, miles_today, carrier, main_office, home_terminal, truck_num, trailer_num, from_city, to_city}
-        img = Image.new('RGB', (self.width, self.height), color='white')
+        img = self.get_template().copy()
         draw = ImageDraw.Draw(img)
-        
+        self.draw_fields(draw, day_info)
+        return img, draw
+
+    def draw_template(self, draw):
         # --- HEADER SECTION ---
         # Title
         draw.text((self.margin_x, 50), "DRIVERS DAILY LOG (24 hours)", fill="black")
         draw.text((self.width - 400, 50), "Original - File at home terminal", fill="black")
         
-        # Date & Miles
-        draw.text((self.margin_x + 350, 40), f"Date: {day_info.get('date', '')}", fill="black")
+        # Date line
         draw.line([(self.margin_x + 390, 55), (self.margin_x + 550, 55)], fill="black", width=1)
         
         # From / To
         draw.text((self.margin_x, 100), "From:", fill="black")
-        draw.text((self.margin_x + 60, 100), day_info.get('from_city', ''), fill="black")
         draw.line([(self.margin_x + 60, 115), (self.margin_x + 600, 115)], fill="black", width=1)
         
         draw.text((self.margin_x + 650, 100), "To:", fill="black")
-        draw.text((self.margin_x + 690, 100), day_info.get('to_city', ''), fill="black")
         draw.line([(self.margin_x + 690, 115), (self.margin_x + 1300, 115)], fill="black", width=1)
         
         # Boxes for Miles (Left side)
         draw.rectangle([(self.margin_x, 150), (self.margin_x + 200, 200)], outline="black")
         draw.text((self.margin_x + 10, 205), "Total Miles Driving Today", fill="black")
-        draw.text((self.margin_x + 10, 165), f"{day_info.get('miles_today', 0):.1f}", fill="black", font=None) # Default font
         
         draw.rectangle([(self.margin_x + 220, 150), (self.margin_x + 420, 200)], outline="black")
         draw.text((self.margin_x + 230, 205), "Total Mileage Today", fill="black")
-        draw.text((self.margin_x + 230, 165), f"{day_info.get('miles_today', 0):.1f}", fill="black") # Assuming same for now
         
         # Truck Info
         draw.rectangle([(self.margin_x, 230), (self.margin_x + 420, 280)], outline="black")
         draw.text((self.margin_x + 10, 285), "Truck/Tractor & Trailer Numbers", fill="black")
-        draw.text((self.margin_x + 10, 245), f"Truck: {day_info.get('truck_num', 'N/A')}  Trailer: {day_info.get('trailer_num', 'N/A')}", fill="black")
         
         # Carrier Info (Right side)
         right_start_x = self.margin_x + 600
         
         draw.line([(right_start_x, 160), (self.width - self.margin_x, 160)], fill="black", width=1)
-        draw.text((right_start_x + 10, 140), day_info.get('carrier', 'Carrier Name'), fill="black")
         draw.text((right_start_x + 200, 165), "Name of Carrier or Carriers", fill="black")
         
         draw.line([(right_start_x, 210), (self.width - self.margin_x, 210)], fill="black", width=1)
-        draw.text((right_start_x + 10, 190), day_info.get('main_office', 'Office Address'), fill="black")
         draw.text((right_start_x + 200, 215), "Main Office Address", fill="black")
 
         draw.line([(right_start_x, 260), (self.width - self.margin_x, 260)], fill="black", width=1)
-        draw.text((right_start_x + 10, 240), day_info.get('home_terminal', 'Home Terminal Address'), fill="black")
         draw.text((right_start_x + 200, 265), "Home Terminal Address", fill="black")
         
         # --- GRID SECTION ---
@@ -73,7 +121,7 @@ class LogSheetDrawer:
         row_h = 50
         
         # Black top bar for hours
-        draw.rectangle([(self.margin_x + 150, self.grid_top - 40), (self.margin_x + 150 + self.grid_width, self.grid_top)], fill="black")
+        draw.rectangle(self.hour_bar_box(), fill="black")
         
         # Hour Labels (Midnight, 1, 2... Noon ... Midnight)
         grid_x_start = self.margin_x + 150
@@ -111,12 +159,6 @@ class LogSheetDrawer:
         # Total Hours Column
         draw.text((grid_x_start + self.grid_width + 10, self.grid_top - 35), "Total", fill="black")
         draw.text((grid_x_start + self.grid_width + 10, self.grid_top - 20), "Hours", fill="black")
-        
-        # Draw Totals
-        totals = day_info.get('totals', [0,0,0,0]) # Off, SB, D, ON
-        for i, total in enumerate(totals):
-            y = self.grid_top + (i * row_h) + 15
-            draw.text((grid_x_start + self.grid_width + 20, y), f"{total:.2f}", fill="black")
 
         # --- REMARKS SECTION ---
         rem_y = self.grid_top + 250
@@ -127,36 +169,13 @@ class LogSheetDrawer:
         draw.line([(self.margin_x, rem_y + 20), (self.margin_x, rem_y + 300)], fill="black", width=1)
         draw.line([(self.width - self.margin_x, rem_y + 20), (self.width - self.margin_x, rem_y + 300)], fill="black", width=1)
         draw.line([(self.margin_x, rem_y + 300), (self.width - self.margin_x, rem_y + 300)], fill="black", width=1)
-
-        # Draw actual remark lines
-        # events should be passed in day_info or drawn separately. 
-        # But create_blank_log is usually called first.
-        # Let's trust that draw_events might handle lines?
-        # Actually proper standard is that remarks are text list.
-        # We can pass them in day_info['remarks_list']
-        
-        remarks_list = day_info.get('remarks_list', [])
-        current_rem_y = rem_y + 30
-        for rem in remarks_list:
-            # Format: Time - Location - Remark
-            # e.g "06:15 - Green Bay, WI - Pre-trip Inspection"
-            draw.text((self.margin_x + 10, current_rem_y), rem, fill="black")
-            current_rem_y += 20
-            if current_rem_y > rem_y + 280:
-                break # overflow protection
         
         # --- RECAP SECTION ---
         recap_y = self.height - 150
         draw.text((self.margin_x, recap_y - 25), "Recap: Complete at end of day", fill="black")
         
-        # Recap data
-        recap = day_info.get('recap', {})
-        
         # Table geometry
-        table_x = self.margin_x + 200
-        table_y = recap_y
-        table_w = 1000
-        table_h = 100
+        table_x, table_y, table_w, table_h, col_w = self._recap_table()
         
         # Draw Box
         draw.rectangle([(table_x, table_y), (table_x + table_w, table_y + table_h)], outline="black")
@@ -168,9 +187,6 @@ class LogSheetDrawer:
         # 4. Worked Today
         # 5. Total Since Start
         # 6. Available Tomorrow
-        cols = 6
-        col_w = table_w / cols
-        
         headers = [
             "70 Hr Limit", 
             "Used Last 7 Days", 
@@ -180,31 +196,81 @@ class LogSheetDrawer:
             "Avail Tomorrow"
         ]
         
-        values = [
-            recap.get('limit', '70/8'),
-            f"{recap.get('used_last_7', 0):.2f}",
-            f"{recap.get('available_today', 0):.2f}",
-            f"{recap.get('worked_today', 0):.2f}",
-            f"{recap.get('total_since_start', 0):.2f}",
-            f"{recap.get('available_tomorrow', 0):.2f}"
-        ]
-        
-        # Draw headers and values
-        for i in range(cols):
+        # Draw headers
+        for i in range(len(headers)):
             x = table_x + (i * col_w)
             # Vertical line
             draw.line([(x, table_y), (x, table_y + table_h)], fill="black", width=1)
             
             # Header
             draw.text((x + 5, table_y + 10), headers[i], fill="black")
-            
-            # Value
-            draw.text((x + 20, table_y + 60), values[i], fill="black")  # Larger font ideally, but default ok
 
         # Horizontal separator
         draw.line([(table_x, table_y + 40), (table_x + table_w, table_y + 40)], fill="black", width=1)
 
-        return img, draw
+    def _recap_table(self):
+        # (x, y, width, height, column width) of the recap table
+        table_w = 1000
+        return self.margin_x + 200, self.height - 150, table_w, 100, table_w / 6
+
+    def draw_fields(self, draw, day_info):
+        # Date
+        draw.text((self.margin_x + 350, 40), f"Date: {day_info.get('date', '')}", fill="black")
+        
+        # From / To
+        draw.text((self.margin_x + 60, 100), day_info.get('from_city', ''), fill="black")
+        draw.text((self.margin_x + 690, 100), day_info.get('to_city', ''), fill="black")
+        
+        # Miles
+        draw.text((self.margin_x + 10, 165), f"{day_info.get('miles_today', 0):.1f}", fill="black", font=None) # Default font
+        draw.text((self.margin_x + 230, 165), f"{day_info.get('miles_today', 0):.1f}", fill="black") # Assuming same for now
+        
+        # Truck Info
+        draw.text((self.margin_x + 10, 245), f"Truck: {day_info.get('truck_num', 'N/A')}  Trailer: {day_info.get('trailer_num', 'N/A')}", fill="black")
+        
+        # Carrier Info (Right side)
+        right_start_x = self.margin_x + 600
+        draw.text((right_start_x + 10, 140), day_info.get('carrier', 'Carrier Name'), fill="black")
+        draw.text((right_start_x + 10, 190), day_info.get('main_office', 'Office Address'), fill="black")
+        draw.text((right_start_x + 10, 240), day_info.get('home_terminal', 'Home Terminal Address'), fill="black")
+        
+        # Draw Totals
+        row_h = 50
+        grid_x_start = self.margin_x + 150
+        totals = day_info.get('totals', [0,0,0,0]) # Off, SB, D, ON
+        for i, total in enumerate(totals):
+            y = self.grid_top + (i * row_h) + 15
+            draw.text((grid_x_start + self.grid_width + 20, y), f"{total:.2f}", fill="black")
+
+        # Remark lines
+        # Proper standard is that remarks are a text list, passed in day_info['remarks_list']
+        rem_y = self.grid_top + 250
+        remarks_list = day_info.get('remarks_list', [])
+        current_rem_y = rem_y + 30
+        for rem in remarks_list:
+            # Format: Time - Location - Remark
+            # e.g "06:15 - Green Bay, WI - Pre-trip Inspection"
+            draw.text((self.margin_x + 10, current_rem_y), rem, fill="black")
+            current_rem_y += 20
+            if current_rem_y > rem_y + 280:
+                break # overflow protection
+        
+        # Recap data
+        recap = day_info.get('recap', {})
+        table_x, table_y, table_w, table_h, col_w = self._recap_table()
+        
+        values = [
+            recap.get('limit', '70/8'),
+            f"{recap.get('used_last_7', 0):.2f}",
+            f"{recap.get('available_today', 0):.2f}",
+            f"{recap.get('worked_today', 0):.2f}",
+            f"{recap.get('total_since_start', 0):.2f}",
+            f"{recap.get('available_tomorrow', 0):.2f}"
+        ]
+        
+        for i, value in enumerate(values):
+            x = table_x + (i * col_w)
+            draw.text((x + 20, table_y + 60), value, fill="black")  # Larger font ideally, but default ok
 
     def draw_events(self, img, draw, events):
         grid_start_x = self.margin_x + 150
@@ -213,12 +279,13 @@ class LogSheetDrawer:
         last_y = None
         
         for event in events:
-            row_idx = event['status'] - 1
+            row_idx = event.status - 1
             # Center of the row
             y_base = self.grid_top + (row_idx * 50) + 25 
             
-            start_hour = event['start_hour']
-            end_hour = start_hour + event['duration_hours']
+            start_hour = event.start_hour
+            # Clamp to the grid (a 25-hour daylight-saving day runs past it)
+            end_hour = min(start_hour + event.duration_hours, 24)
             
             x_start = grid_start_x + (start_hour * self.hour_width)
             x_end = grid_start_x + (end_hour * self.hour_width)
@@ -236,15 +303,107 @@ class LogSheetDrawer:
             last_x = x_end
             last_y = y_base
             
-    def save_image(self, img):
+    def save_image(self, img, image_format="png", compress_level=6):
+        """
+        Encode a rendered page in one of IMAGE_FORMATS.
+        The sheet is line art in a handful of colours, so the palette, mono and
+        webp formats are several times smaller and faster to encode than RGB.
+        """
         buf = io.BytesIO()
-        img.save(buf, format='PNG')
+        if image_format == "png":
+            img.save(buf, format='PNG', compress_level=compress_level)
+        elif image_format == "palette":
+            # Map onto the fixed sheet palette: no per-image colour search, no dithering
+            paletted = img.quantize(palette=_palette_image, dither=Image.Dither.NONE)
+            paletted.save(buf, format='PNG', bits=4, compress_level=compress_level)
+        elif image_format == "mono":
+            # Anything darker than near-white is ink: a plain 50% threshold would
+            # drop the gray and lightgray grid lines. The white hour labels on
+            # the black bar are thresholded at 50% so they stay readable.
+            gray = img.convert('L')
+            mono = gray.point(_MONO_THRESHOLD, '1')
+            (x0, y0), (x1, y1) = self.hour_bar_box()
+            bar = (round(x0), round(y0), round(x1), round(y1))
+            mono.paste(gray.crop(bar).point(_MONO_BAR_THRESHOLD, '1'), bar[:2])
+            mono.save(buf, format='PNG', compress_level=compress_level)
+        elif image_format == "webp":
+            # Lossless WebP of the palette-reduced page; low effort settings cost
+            # ~15% in size but halve the encode time
+            paletted = img.quantize(palette=_palette_image, dither=Image.Dither.NONE)
+            paletted.convert('RGB').save(buf, format='WEBP', lossless=True, method=1, quality=0)
+        else:
+            raise ValueError(f"Unknown image format: {image_format}")
         return buf.getvalue()
 
-    def save_pdf(self, images):
-        if not images:
+    def thumbnail(self, img, width):
+        """
+        Downscaled copy of a page, `width` pixels wide. Box filtering is enough
+        for line art and much cheaper than Lanczos.
+        """
+        height = max(1, round(img.height * width / img.width))
+        return img.resize((width, height), Image.Resampling.BOX)
+
+    def render_day(self, day_info, events, driver_name="Driver"):
+        with span("create_blank_log"):
+            img, draw = self.create_blank_log(day_info, driver_name)
+        with span("draw_events"):
+            self.draw_events(img, draw, events)
+        return img
+
+    def open_pdf(self):
+        return PdfPageWriter()
+
+    def get_vector_template(self):
+        # PDF operators for the static form, built once per configuration
+        key = self.template_key()
+        ops = _vector_template_cache.get(key)
+        if ops is None:
+            canvas = PdfCanvas(self.width, self.height)
+            self.draw_template(canvas)
+            ops = canvas.getvalue()
+            _vector_template_cache[key] = ops
+        return ops
+
+    def render_day_vector(self, day_info, events):
+        """
+        Same layout as render_day, recorded as native PDF operators.
+        """
+        canvas = PdfCanvas(self.width, self.height)
+        self.draw_fields(canvas, day_info)
+        self.draw_events(None, canvas, events)
+        return canvas
+
+    def open_vector_pdf(self):
+        return VectorPdfWriter(self.get_vector_template())
+
+
+class PdfPageWriter:
+    """
+    Builds a multi-page PDF one page at a time in a temporary file, using
+    Pillow's append mode, so earlier pages do not stay in memory.
+    """
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self.page_count = 0
+
+    def add_page(self, img):
+        if self.page_count == 0:
+            img.save(self._file, format='PDF')
+        else:
+            img.save(self._file, format='PDF', append=True)
+        self.page_count += 1
+
+    def getvalue(self):
+        if self.page_count == 0:
             return None
-        buf = io.BytesIO()
-        # Save first image and append the rest
-        images[0].save(buf, format='PDF', save_all=True, append_images=images[1:])
-        return buf.getvalue()
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
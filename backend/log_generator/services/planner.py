@@ -0,0 +1,402 @@
+import contextvars
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from .artifacts import get_artifact_store
+from .cache import TieredCache, get_setting
+from .log_days import partition_days
+from .metrics import span
+from .profiling import is_profiling
+from .routing import normalize_address
+from .hos_logic import TripScheduler
+from .pdf_drawer import IMAGE_FORMATS, LogSheetDrawer
+
+
+def get_home_timezone(name=None):
+    """
+    ZoneInfo for `name`, or the HOME_TERMINAL_TIMEZONE setting.
+    Raises ZoneInfoNotFoundError for unknown names.
+    """
+    return ZoneInfo(name or get_setting("HOME_TERMINAL_TIMEZONE", "UTC"))
+
+
+def schedule_trip(current_loc_str, pickup_loc_str, dropoff_loc_str, route_1, route_2, cycle_used, start_time, prior_days=None,
+                  shift=None):
+    scheduler = TripScheduler(start_time=start_time, cycle_used_hours=cycle_used, prior_days=prior_days, shift=shift)
+
+    # 1. Pre-trip (15m)
+    scheduler.add_event(4, 15, current_loc_str, "Pre-trip Inspection")
+
+    # 2. Drive to Pickup
+    scheduler.drive_leg(route_1['distance_miles'], route_1['duration_hours'], current_loc_str, pickup_loc_str,
+                        route_1.get('geometry'))
+
+    # 3. Pickup (1hr)
+    scheduler.add_event(4, 60, pickup_loc_str, "Loading")
+
+    # 4. Drive to Dropoff
+    scheduler.drive_leg(route_2['distance_miles'], route_2['duration_hours'], pickup_loc_str, dropoff_loc_str,
+                        route_2.get('geometry'))
+
+    # 5. Dropoff (1hr)
+    scheduler.add_event(4, 60, dropoff_loc_str, "Unloading")
+
+    # 6. Post-trip (15m)
+    scheduler.add_event(4, 15, dropoff_loc_str, "Post-trip Inspection")
+    return scheduler
+
+
+def build_day_logs(log_days, ledger):
+    """
+    Per-day header, totals and recap values, in date order.
+    Recaps come from the scheduler's rolling 70/8 ledger.
+    Returns a list of (day_info, day_segments) ready for LogSheetDrawer.
+    """
+    # Close every log day in the ledger, including the trailing off-duty time
+    if log_days:
+        ledger.advance_to(log_days[-1].end_min)
+
+    day_logs = []
+    for day in log_days:
+        day_info = {
+            'date': str(day.date),
+            'miles_today': day.minutes[2] / 60.0 * 50.0, # Driving hours at ~50 mph
+            'carrier': "Logistics Co.",
+            'main_office': "123 Main St, Springfield",
+            'home_terminal': "456 Depot Ln, Hometown",
+            'truck_num': "1042",
+            'trailer_num': "5301",
+            'from_city': day.from_city,
+            'to_city': day.to_city,
+            # Exact clipped durations, rounded for display so they add up to the day length
+            'totals': day.totals_hours(),
+            'remarks_list': day.remarks,
+            'recap': ledger.recap_for(day.date)
+        }
+        day_logs.append((day_info, day.segments))
+    return day_logs
+
+
+def get_image_options(image_format=None, thumbnail_width=None):
+    """
+    Normalised per-day image options {"format", "thumbnail_width"}, defaulting
+    to the LOG_IMAGE_FORMAT and LOG_THUMBNAIL_WIDTH settings.
+    thumbnail_width None means no thumbnails. Raises ValueError.
+    """
+    image_format = image_format or get_setting("LOG_IMAGE_FORMAT", "palette")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"image_format must be one of: {', '.join(IMAGE_FORMATS)}")
+    if thumbnail_width is None:
+        thumbnail_width = get_setting("LOG_THUMBNAIL_WIDTH", None)
+    if thumbnail_width is not None:
+        max_width = LogSheetDrawer().width
+        try:
+            thumbnail_width = int(thumbnail_width)
+        except (TypeError, ValueError):
+            raise ValueError("thumbnail_width must be an integer")
+        if not 16 <= thumbnail_width < max_width:
+            raise ValueError(f"thumbnail_width must be between 16 and {max_width - 1}")
+    return {"format": image_format, "thumbnail_width": thumbnail_width}
+
+
+def _render_day(drawer, day_info, day_events, options, compress_level, vector):
+    """
+    Render, encode and store one day; runs on a render thread.
+    Returns (thumbnail id or None, image id, PDF page). The page is a vector
+    canvas, or the image itself for the raster backend (the caller closes it).
+    """
+    store = get_artifact_store()
+    image_format = options["format"]
+    extension = IMAGE_FORMATS[image_format]
+    img = drawer.render_day(day_info, day_events)
+
+    thumb_id = None
+    if options["thumbnail_width"]:
+        with span("png_encode"):
+            thumb = drawer.thumbnail(img, options["thumbnail_width"])
+            data = drawer.save_image(thumb, image_format, compress_level)
+            thumb.close()
+        with span("artifact_store"):
+            thumb_id = store.put(data, extension)
+
+    # Store the day's image for download
+    with span("png_encode"):
+        data = drawer.save_image(img, image_format, compress_level)
+    with span("artifact_store"):
+        image_id = store.put(data, extension)
+
+    if not vector:
+        return thumb_id, image_id, img
+    img.close()
+    with span("pdf"):
+        page = drawer.render_day_vector(day_info, day_events)
+    return thumb_id, image_id, page
+
+
+def iter_render_logs(day_logs, image_options=None):
+    """
+    Draw every day's sheet into the artifact store, yielding
+    ("log_thumbnail", id) if thumbnails were asked for, then ("log_image", id)
+    for each day in date order, and finally ("pdf", pdf_id or None).
+    Days are independent once their recaps are computed, so they render on
+    the render thread pool (Pillow releases the GIL while encoding); at most
+    a few pages are in flight and the PDF is written incrementally in order,
+    so peak memory does not grow with trip length.
+    """
+    drawer = LogSheetDrawer()
+    options = image_options or get_image_options()
+    compress_level = get_setting("PNG_COMPRESS_LEVEL", 6)
+    # "vector" draws the PDF with native operators; "raster" embeds the page images
+    vector = get_setting("LOG_PDF_BACKEND", "vector") == "vector"
+    # Profiled requests render inline, so the profile shows the rendering
+    pool = None if is_profiling() else get_render_pool()
+    window = 1 if pool is None else get_setting("LOG_RENDER_THREADS", 4) * 2
+
+    with (drawer.open_vector_pdf() if vector else drawer.open_pdf()) as pdf:
+        pending = deque()
+        days = iter(day_logs)
+        while True:
+            # Keep the pool busy a few days ahead of the PDF writer
+            for day_info, day_events in days:
+                args = (drawer, day_info, day_events, options, compress_level, vector)
+                if pool is None:
+                    pending.append(_render_day(*args))
+                else:
+                    # Copy the context so render spans count toward this request's timings
+                    pending.append(pool.submit(contextvars.copy_context().run, _render_day, *args))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+
+            result = pending.popleft()
+            thumb_id, image_id, page = result if pool is None else result.result()
+            if thumb_id:
+                yield "log_thumbnail", thumb_id
+
+            # Append to PDF in date order, then release the page
+            with span("pdf"):
+                pdf.add_page(page)
+            if not vector:
+                page.close()
+            yield "log_image", image_id
+
+        with span("pdf"):
+            pdf_data = pdf.getvalue()
+
+    with span("artifact_store"):
+        pdf_id = get_artifact_store().put(pdf_data, "pdf") if pdf_data else None
+    yield "pdf", pdf_id
+
+
+def render_logs(day_logs, image_options=None):
+    """
+    Returns (list of image artifact ids, list of thumbnail ids, PDF artifact id or None).
+    """
+    log_image_ids = []
+    thumbnail_ids = []
+    pdf_id = None
+    for kind, artifact_id in iter_render_logs(day_logs, image_options):
+        if kind == "log_image":
+            log_image_ids.append(artifact_id)
+        elif kind == "log_thumbnail":
+            thumbnail_ids.append(artifact_id)
+        else:
+            pdf_id = artifact_id
+    return log_image_ids, thumbnail_ids, pdf_id
+
+
+def schedule_plan(current_loc_str, pickup_loc_str, dropoff_loc_str, route_1, route_2, cycle_used, start_time=None,
+                  prior_days=None, shift=None):
+    """
+    Schedule one routed trip and split it into log days, without rendering.
+    Returns (summary, day_logs): summary holds the itinerary and route
+    geometry of the generate-plan response, day_logs feeds render_logs.
+    """
+    if start_time is None:
+        start_time = datetime.now(get_home_timezone())
+    tz = start_time.tzinfo
+    with span("drive_leg"):
+        scheduler = schedule_trip(
+            current_loc_str, pickup_loc_str, dropoff_loc_str, route_1, route_2, cycle_used, start_time, prior_days,
+            shift,
+        )
+    with span("day_split"):
+        log_days = partition_days(scheduler.events, tz, current_loc_str, dropoff_loc_str)
+        day_logs = build_day_logs(log_days, scheduler.ledger)
+
+    summary = {
+        "itinerary": [f"{e.remark} at {e.start.strftime('%H:%M')}" for e in scheduler.events],
+        "route_geometry": {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "geometry": route_1['geometry'], "properties": {"type": "pre-load"}},
+                {"type": "Feature", "geometry": route_2['geometry'], "properties": {"type": "load"}}
+            ]
+        }
+    }
+    return summary, day_logs
+
+
+def build_plan(current_loc_str, pickup_loc_str, dropoff_loc_str, route_1, route_2, cycle_used, start_time=None,
+               prior_days=None, image_options=None, shift=None):
+    """
+    Schedule, split into days and render one trip whose locations are already
+    routed. start_time should be timezone-aware: log days are split at
+    midnight in its timezone. prior_days optionally gives the on-duty hours of
+    the previous 7 days (oldest first) for the 70/8 ledger; otherwise
+    cycle_used is used. shift optionally carries a stored driver's hours
+    earlier today and open shift (duty_history.current_shift).
+    image_options comes from get_image_options. Returns the
+    generate-plan response body, with rendered logs as artifact ids
+    ("log_images", "log_thumbnails", "pdf") that the view turns into download URLs.
+    Only takes plain data, so it can run in a worker process.
+    """
+    summary, day_logs = schedule_plan(
+        current_loc_str, pickup_loc_str, dropoff_loc_str, route_1, route_2, cycle_used, start_time, prior_days,
+        shift,
+    )
+    log_image_ids, thumbnail_ids, pdf_id = render_logs(day_logs, image_options)
+    return {
+        "itinerary": summary["itinerary"],
+        "log_images": log_image_ids,
+        "log_thumbnails": thumbnail_ids,
+        "pdf": pdf_id,
+        "route_geometry": summary["route_geometry"],
+    }
+
+
+_pool_lock = threading.Lock()
+_process_pool = None
+_interactive_pool = None
+
+
+def _init_worker():
+    # Workers start from a fresh interpreter, so set Django up there too
+    if os.environ.get("DJANGO_SETTINGS_MODULE"):
+        import django
+        django.setup()
+
+
+def get_process_pool():
+    """
+    Shared process pool for CPU-bound scheduling and Pillow rendering.
+    Workers are started by a fork server (spawned where that is unavailable)
+    rather than forked from the web process, whose other threads may hold
+    locks (logging, metrics) at fork time that the child could never release.
+    """
+    global _process_pool
+    if _process_pool is None:
+        with _pool_lock:
+            if _process_pool is None:
+                _process_pool = _new_process_pool(get_setting("PLAN_PROCESS_WORKERS", None) or os.cpu_count() or 1)
+    return _process_pool
+
+
+def get_interactive_pool():
+    """
+    Small process pool reserved for interactive plan jobs, so they never
+    queue behind a bulk backlog on the shared pool.
+    """
+    global _interactive_pool
+    if _interactive_pool is None:
+        with _pool_lock:
+            if _interactive_pool is None:
+                _interactive_pool = _new_process_pool(get_setting("PLAN_INTERACTIVE_PROCESS_WORKERS", 1))
+    return _interactive_pool
+
+
+def _new_process_pool(workers):
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context(method), initializer=_init_worker,
+    )
+
+
+_render_pool = None
+
+
+def get_render_pool():
+    """
+    Shared thread pool for rendering the days of a plan, or None to render
+    serially (LOG_RENDER_THREADS <= 1, or inside a plan worker process, where
+    the process pool already keeps every core busy).
+    """
+    global _render_pool
+    if multiprocessing.parent_process() is not None:
+        return None
+    if _render_pool is None:
+        threads = get_setting("LOG_RENDER_THREADS", 4)
+        if threads <= 1:
+            return None
+        with _pool_lock:
+            if _render_pool is None:
+                _render_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="log-render")
+    return _render_pool
+
+
+_plan_cache = None
+
+
+def get_plan_cache():
+    global _plan_cache
+    if _plan_cache is None:
+        with _pool_lock:
+            if _plan_cache is None:
+                _plan_cache = TieredCache(
+                    "plan",
+                    memory_size=get_setting("PLAN_CACHE_MEMORY_SIZE", 256),
+                    max_entries=get_setting("PLAN_CACHE_MAX_ENTRIES", 5000),
+                    ttl=get_setting("PLAN_CACHE_TTL", 3600),
+                    path=get_setting("ROUTING_CACHE_PATH", None),
+                )
+    return _plan_cache
+
+
+def bucket_start_time(now=None):
+    """
+    Round the trip start down to the PLAN_CACHE_BUCKET_MINUTES boundary, so
+    requests within the same bucket schedule (and cache) identically.
+    """
+    now = now or datetime.now(get_home_timezone())
+    bucket = get_setting("PLAN_CACHE_BUCKET_MINUTES", 15)
+    minutes = (now.hour * 60 + now.minute) // bucket * bucket
+    return now.replace(hour=minutes // 60, minute=minutes % 60, second=0, microsecond=0)
+
+
+def plan_cache_key(locations, cycle_used, start_time, prior_days=None, image_options=None, shift=None):
+    """
+    Canonical hash of everything a plan depends on.
+    """
+    canonical = json.dumps({
+        "images": image_options or get_image_options(),
+        "locations": [normalize_address(loc) for loc in locations],
+        "cycle_used": round(float(cycle_used), 2),
+        "prior_days": [round(float(h), 2) for h in prior_days] if prior_days is not None else None,
+        "shift": shift,
+        "start": start_time.isoformat(),
+        "timezone": str(start_time.tzinfo),
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get_cached_plan(key):
+    """
+    Cached plan for `key`, or None. A plan whose artifacts have been removed
+    from the store counts as a miss.
+    """
+    plan = get_plan_cache().get(key)
+    if plan is None:
+        return None
+    store = get_artifact_store()
+    artifact_ids = list(plan["log_images"]) + plan.get("log_thumbnails", []) + ([plan["pdf"]] if plan.get("pdf") else [])
+    if not all(store.exists(artifact_id) for artifact_id in artifact_ids):
+        return None
+    return plan
@@ -0,0 +1,133 @@
+import cProfile
+import contextvars
+import hmac
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from .cache import get_setting
+
+# cProfile can only have one active profiler per process (3.12+), and
+# tracemalloc is process-wide, so only one request is profiled at a time.
+_profile_lock = threading.Lock()
+# Set while the current context is being profiled. cProfile only sees the
+# calling thread, so work that would go to a thread pool should run inline.
+_profiling = contextvars.ContextVar("profiling", default=False)
+
+
+def is_profiling():
+    return _profiling.get()
+
+
+def profiling_allowed(flag):
+    """
+    Whether a request's profile flag (X-Profile header or ?profile=) turns
+    profiling on: PROFILING_ENABLED must be set and, if PROFILING_TOKEN is
+    configured, the flag must equal it.
+    """
+    if not flag or not get_setting("PROFILING_ENABLED", False):
+        return False
+    token = get_setting("PROFILING_TOKEN", None)
+    return hmac.compare_digest(str(flag), str(token)) if token else True
+
+
+def get_profile_dir():
+    path = get_setting("PROFILE_DIR", None)
+    if path is None:
+        # Same default as settings.PROFILE_DIR, for use outside Django
+        path = Path(__file__).resolve().parent.parent.parent / "profiles"
+    return Path(path)
+
+
+class RequestProfiler:
+    """
+    cProfile and tracemalloc around one block of work.
+    On exit writes, under the profile directory:
+        <id>.pstats      cProfile stats (python -m pstats <file>, snakeviz, ...)
+        <id>.alloc.txt   top allocations made during the block, by line and by traceback
+        <id>.json        summary: wall time, peak traced memory, top functions
+    `active` is False (and nothing is written) if another profile is running.
+    """
+    def __init__(self, label, profile_dir=None, top=None, frames=None):
+        self.label = label
+        self.profile_dir = Path(profile_dir) if profile_dir else get_profile_dir()
+        self.top = top or get_setting("PROFILE_TOP", 30)
+        self.frames = frames or get_setting("PROFILE_TRACEMALLOC_FRAMES", 10)
+        self.profile_id = None
+        self.active = False
+
+    def __enter__(self):
+        self.active = _profile_lock.acquire(blocking=False)
+        if not self.active:
+            return self
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self._before = tracemalloc.take_snapshot()
+        self._profiler = cProfile.Profile()
+        self._profiling_token = _profiling.set(True)
+        self._start = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if not self.active:
+            return False
+        try:
+            self._profiler.disable()
+            _profiling.reset(self._profiling_token)
+            wall = time.perf_counter() - self._start
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if self._started_tracing:
+                tracemalloc.stop()
+            self._write(wall, peak, after)
+        finally:
+            _profile_lock.release()
+        return False
+
+    def _write(self, wall, peak, after):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        base = self.profile_dir / self.profile_id
+        self._profiler.dump_stats(f"{base}.pstats")
+
+        # Only count memory allocated by our code and libraries, not tracemalloc itself
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        before, after = self._before.filter_traces(filters), after.filter_traces(filters)
+        by_line = after.compare_to(before, "lineno")[:self.top]
+        by_traceback = after.compare_to(before, "traceback")[:10]
+        with open(f"{base}.alloc.txt", "w") as f:
+            f.write(f"# {self.label}: top {len(by_line)} allocation sites (size delta during the request)\n")
+            for stat in by_line:
+                f.write(f"{stat}\n")
+            f.write("\n# Largest allocations by traceback\n")
+            for stat in by_traceback:
+                f.write(f"\n{stat.size_diff / 1024:.1f} KiB in {stat.count_diff} blocks\n")
+                f.write("\n".join(stat.traceback.format()) + "\n")
+
+        stats = pstats.Stats(self._profiler)
+        top_functions = []
+        for (filename, line, name), (calls, _, tottime, cumtime, _) in sorted(
+            stats.stats.items(), key=lambda item: item[1][3], reverse=True
+        )[:self.top]:
+            top_functions.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            })
+        summary = {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "wall_seconds": round(wall, 6),
+            "peak_traced_bytes": peak,
+            "top_functions": top_functions,
+        }
+        with open(f"{base}.json", "w") as f:
+            json.dump(summary, f, indent=2)
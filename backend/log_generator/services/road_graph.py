@@ -0,0 +1,174 @@
+import heapq
+import json
+import math
+from array import array
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+class RoadGraph:
+    """
+    Compact, array-backed road network (CSR adjacency) for offline routing.
+
+    File format (JSON):
+        {
+          "nodes": [[node_id, lat, lon], ...],
+          "edges": [[from_id, to_id, miles, speed_mph], ...]   # speed optional
+        }
+    Edges are two-way unless the edge list has a fifth element `true` (one-way).
+    """
+    DEFAULT_SPEED = 55.0
+    CELL_DEGREES = 1.0
+
+    def __init__(self, nodes, edges):
+        self.node_ids = []
+        self.lat = array("d")
+        self.lon = array("d")
+        index = {}
+        for node_id, lat, lon in nodes:
+            index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self.lat.append(float(lat))
+            self.lon.append(float(lon))
+
+        # Build adjacency lists first, then flatten into CSR arrays
+        adjacency = [[] for _ in self.node_ids]
+        self.max_speed = 0.0
+        for edge in edges:
+            src, dst, miles = index[edge[0]], index[edge[1]], float(edge[2])
+            speed = float(edge[3]) if len(edge) > 3 and edge[3] else self.DEFAULT_SPEED
+            oneway = len(edge) > 4 and bool(edge[4])
+            self.max_speed = max(self.max_speed, speed)
+            adjacency[src].append((dst, miles, miles / speed))
+            if not oneway:
+                adjacency[dst].append((src, miles, miles / speed))
+
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        self.edge_miles = array("d")
+        self.edge_hours = array("d")
+        for neighbours in adjacency:
+            for dst, miles, hours in neighbours:
+                self.targets.append(dst)
+                self.edge_miles.append(miles)
+                self.edge_hours.append(hours)
+            self.offsets.append(len(self.targets))
+
+        # Coarse spatial grid for snapping coordinates to the nearest node
+        self._cells = {}
+        for i in range(len(self.node_ids)):
+            self._cells.setdefault(self._cell(self.lat[i], self.lon[i]), []).append(i)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["nodes"], data["edges"])
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.CELL_DEGREES)), int(math.floor(lon / self.CELL_DEGREES)))
+
+    def nearest_node(self, lat, lon):
+        """
+        Index of the node closest to (lat, lon).
+        Searches grid rings outward; once a candidate is found one more ring is
+        checked, since a node in the next ring can still be closer.
+        """
+        if not self.node_ids:
+            raise ValueError("Road graph is empty")
+        cy, cx = self._cell(lat, lon)
+        best, best_dist = None, float("inf")
+        found_at = None
+        ring = 0
+        max_ring = 360 // int(self.CELL_DEGREES)
+        while ring <= max_ring:
+            for y in range(cy - ring, cy + ring + 1):
+                for x in range(cx - ring, cx + ring + 1):
+                    if max(abs(y - cy), abs(x - cx)) != ring:
+                        continue
+                    for i in self._cells.get((y, x), ()):
+                        d = haversine_miles(lat, lon, self.lat[i], self.lon[i])
+                        if d < best_dist:
+                            best, best_dist = i, d
+            if best is not None:
+                if found_at is None:
+                    found_at = ring
+                elif ring > found_at:
+                    break
+            ring += 1
+        return best
+
+    def shortest_path(self, src, dst):
+        """
+        A* over travel time with an admissible great-circle / max-speed heuristic.
+        Returns (node index path, miles, hours) or None when unreachable.
+        """
+        if src == dst:
+            return [src], 0.0, 0.0
+        max_speed = self.max_speed or self.DEFAULT_SPEED
+        goal_lat, goal_lon = self.lat[dst], self.lon[dst]
+
+        def heuristic(i):
+            return haversine_miles(self.lat[i], self.lon[i], goal_lat, goal_lon) / max_speed
+
+        best_hours = {src: 0.0}
+        miles_to = {src: 0.0}
+        came_from = {}
+        heap = [(heuristic(src), 0.0, src)]
+        closed = set()
+        while heap:
+            _, hours, node = heapq.heappop(heap)
+            if node in closed:
+                continue
+            if node == dst:
+                path = [node]
+                while node in came_from:
+                    node = came_from[node]
+                    path.append(node)
+                path.reverse()
+                return path, miles_to[dst], hours
+            closed.add(node)
+            for e in range(self.offsets[node], self.offsets[node + 1]):
+                nxt = self.targets[e]
+                if nxt in closed:
+                    continue
+                new_hours = hours + self.edge_hours[e]
+                if new_hours < best_hours.get(nxt, float("inf")):
+                    best_hours[nxt] = new_hours
+                    miles_to[nxt] = miles_to[node] + self.edge_miles[e]
+                    came_from[nxt] = node
+                    heapq.heappush(heap, (new_hours + heuristic(nxt), new_hours, nxt))
+        return None
+
+    def route(self, start_coords, end_coords, access_speed=35.0):
+        """
+        Route between two (lat, lon) points in the same shape as OSRM legs.
+        The hop from each point to its snapped node is added at `access_speed`.
+        """
+        src = self.nearest_node(*start_coords)
+        dst = self.nearest_node(*end_coords)
+        found = self.shortest_path(src, dst)
+        if found is None:
+            raise ValueError("No path in road graph")
+        path, miles, hours = found
+        access_miles = (
+            haversine_miles(start_coords[0], start_coords[1], self.lat[src], self.lon[src])
+            + haversine_miles(end_coords[0], end_coords[1], self.lat[dst], self.lon[dst])
+        )
+        coordinates = [[start_coords[1], start_coords[0]]]
+        coordinates += [[self.lon[i], self.lat[i]] for i in path]
+        coordinates.append([end_coords[1], end_coords[0]])
+        return {
+            "distance_miles": miles + access_miles,
+            "duration_hours": hours + access_miles / access_speed,
+            "geometry": {"type": "LineString", "coordinates": coordinates}
+        }
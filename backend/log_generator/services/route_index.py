@@ -0,0 +1,97 @@
+from array import array
+from bisect import bisect_right
+
+from .road_graph import haversine_miles
+
+# Coarse (min_lat, max_lat, min_lon, max_lon) boxes per US state. Boxes of
+# neighbouring states overlap, so a point close to a border may get the
+# neighbour's code; positions outside every box (sea, Canada, Mexico) get None.
+STATE_BOUNDS = {
+    "AL": (30.14, 35.01, -88.47, -84.89), "AK": (51.21, 71.39, -179.15, -129.98),
+    "AZ": (31.33, 37.00, -114.82, -109.04), "AR": (33.00, 36.50, -94.62, -89.64),
+    "CA": (32.53, 42.01, -124.41, -114.13), "CO": (36.99, 41.00, -109.06, -102.04),
+    "CT": (40.98, 42.05, -73.73, -71.79), "DE": (38.45, 39.84, -75.79, -75.05),
+    "DC": (38.79, 39.00, -77.12, -76.91), "FL": (24.52, 31.00, -87.63, -80.03),
+    "GA": (30.36, 35.00, -85.61, -80.84), "HI": (18.91, 28.40, -178.33, -154.81),
+    "ID": (41.99, 49.00, -117.24, -111.04), "IL": (36.97, 42.51, -91.51, -87.02),
+    "IN": (37.77, 41.76, -88.10, -84.78), "IA": (40.38, 43.50, -96.64, -90.14),
+    "KS": (36.99, 40.00, -102.05, -94.59), "KY": (36.50, 39.15, -89.57, -81.96),
+    "LA": (28.93, 33.02, -94.04, -88.82), "ME": (42.98, 47.46, -71.08, -66.95),
+    "MD": (37.91, 39.72, -79.49, -75.05), "MA": (41.24, 42.89, -73.51, -69.93),
+    "MI": (41.70, 48.31, -90.42, -82.41), "MN": (43.50, 49.38, -97.24, -89.49),
+    "MS": (30.17, 35.00, -91.66, -88.10), "MO": (35.99, 40.61, -95.77, -89.10),
+    "MT": (44.36, 49.00, -116.05, -104.04), "NE": (40.00, 43.00, -104.05, -95.31),
+    "NV": (35.00, 42.00, -120.01, -114.04), "NH": (42.70, 45.31, -72.56, -70.61),
+    "NJ": (38.93, 41.36, -75.56, -73.89), "NM": (31.33, 37.00, -109.05, -103.00),
+    "NY": (40.50, 45.02, -79.76, -71.86), "NC": (33.84, 36.59, -84.32, -75.46),
+    "ND": (45.94, 49.00, -104.05, -96.55), "OH": (38.40, 41.98, -84.82, -80.52),
+    "OK": (33.62, 37.00, -103.00, -94.43), "OR": (41.99, 46.29, -124.57, -116.46),
+    "PA": (39.72, 42.27, -80.52, -74.69), "RI": (41.15, 42.02, -71.91, -71.12),
+    "SC": (32.03, 35.22, -83.35, -78.54), "SD": (42.48, 45.95, -104.06, -96.44),
+    "TN": (34.98, 36.68, -90.31, -81.65), "TX": (25.84, 36.50, -106.65, -93.51),
+    "UT": (37.00, 42.00, -114.05, -109.04), "VT": (42.73, 45.02, -73.44, -71.46),
+    "VA": (36.54, 39.47, -83.68, -75.24), "WA": (45.54, 49.00, -124.85, -116.92),
+    "WV": (37.20, 40.64, -82.64, -77.72), "WI": (42.49, 47.08, -92.89, -86.25),
+    "WY": (41.00, 45.01, -111.06, -104.05),
+}
+# Smallest box first: where boxes overlap, the smaller state is usually right
+_STATES_BY_AREA = sorted(
+    STATE_BOUNDS.items(), key=lambda item: (item[1][1] - item[1][0]) * (item[1][3] - item[1][2])
+)
+
+
+def state_at(lat, lon):
+    """
+    Two-letter code of the US state whose box contains (lat, lon), or None.
+    """
+    for code, (min_lat, max_lat, min_lon, max_lon) in _STATES_BY_AREA:
+        if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+            return code
+    return None
+
+
+class RouteIndex:
+    """
+    Cumulative-distance index over a route LineString, so the position after
+    any fraction of the route is a binary search plus one interpolation
+    (O(log n) per lookup instead of walking the geometry).
+    """
+    def __init__(self, coordinates):
+        # GeoJSON order: [lon, lat]
+        self.lat = array("d")
+        self.lon = array("d")
+        self.cumulative = array("d")
+        total = 0.0
+        for lon, lat in coordinates:
+            if self.lat:
+                total += haversine_miles(self.lat[-1], self.lon[-1], lat, lon)
+            self.lat.append(lat)
+            self.lon.append(lon)
+            self.cumulative.append(total)
+        self.total_miles = total
+
+    @classmethod
+    def from_geometry(cls, geometry):
+        """
+        Index for a GeoJSON LineString, or None if there is no usable geometry
+        (e.g. the straight-line fallback route).
+        """
+        if not geometry or geometry.get("type") != "LineString":
+            return None
+        index = cls(geometry.get("coordinates") or [])
+        if len(index.cumulative) < 2 or index.total_miles <= 0:
+            return None
+        return index
+
+    def position_at(self, fraction):
+        """
+        (lat, lon) after `fraction` (0 to 1) of the route's length. Fractions
+        rather than miles, since the routed leg distance and the geometry's
+        great-circle length differ slightly.
+        """
+        target = min(max(fraction, 0.0), 1.0) * self.total_miles
+        i = min(bisect_right(self.cumulative, target) - 1, len(self.cumulative) - 2)
+        segment = self.cumulative[i + 1] - self.cumulative[i]
+        t = (target - self.cumulative[i]) / segment if segment > 0 else 0.0
+        return (self.lat[i] + (self.lat[i + 1] - self.lat[i]) * t,
+                self.lon[i] + (self.lon[i + 1] - self.lon[i]) * t)
@@ -1,44 +1,241 @@
-import requests
+import logging
+import re
+import threading
 
-def get_route(start_coords, end_coords):
+from .cache import TieredCache, get_setting
+from .metrics import geocode_failures, routing_errors, routing_fallbacks
+from .road_graph import RoadGraph
+from .upstream import upstream_get
+
+logger = logging.getLogger(__name__)
+
+_cache_lock = threading.Lock()
+_geocode_cache = None
+_route_cache = None
+
+
+def get_geocode_cache():
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _cache_lock:
+            if _geocode_cache is None:
+                _geocode_cache = TieredCache(
+                    "geocode",
+                    memory_size=get_setting("GEOCODE_CACHE_MEMORY_SIZE", 2048),
+                    max_entries=get_setting("GEOCODE_CACHE_MAX_ENTRIES", 50000),
+                    ttl=get_setting("GEOCODE_CACHE_TTL", 30 * 24 * 3600),
+                    path=get_setting("ROUTING_CACHE_PATH", None),
+                )
+    return _geocode_cache
+
+
+def get_route_cache():
+    global _route_cache
+    if _route_cache is None:
+        with _cache_lock:
+            if _route_cache is None:
+                _route_cache = TieredCache(
+                    "route",
+                    memory_size=get_setting("ROUTE_CACHE_MEMORY_SIZE", 512),
+                    max_entries=get_setting("ROUTE_CACHE_MAX_ENTRIES", 20000),
+                    ttl=get_setting("ROUTE_CACHE_TTL", 7 * 24 * 3600),
+                    path=get_setting("ROUTING_CACHE_PATH", None),
+                )
+    return _route_cache
+
+
+def route_cache_key(start_coords, end_coords):
     """
-    Get route from OSRM.
-    coords: (lat, lon) tuple
+    Quantize both endpoints so nearby geocodes of the same lane share an entry.
+    ROUTE_CACHE_PRECISION is in decimal places (3 places is roughly 100 m).
     """
-    # OSRM takes lon,lat
-    start_str = f"{start_coords[1]},{start_coords[0]}"
-    end_str = f"{end_coords[1]},{end_coords[0]}"
-    
-    url = f"http://router.project-osrm.org/route/v1/driving/{start_str};{end_str}?overview=full&geometries=geojson"
-    try:
-        # Add timeout!
-        response = requests.get(url, timeout=3)
-        data = response.json()
+    precision = get_setting("ROUTE_CACHE_PRECISION", 3)
+    parts = [f"{round(float(c), precision):.{precision}f}" for c in (*start_coords, *end_coords)]
+    return ",".join(parts)
+
+
+def normalize_address(address):
+    """
+    Canonical cache key for an address string:
+    "  Chicago ,IL " and "chicago, il" map to the same entry.
+    """
+    text = re.sub(r"\s*,\s*", ", ", str(address).strip().lower())
+    return re.sub(r"\s+", " ", text)
+
+class RoutingProvider:
+    """
+    A routing backend. route(waypoints) returns one leg dict per consecutive
+    waypoint pair or raises on failure. `cacheable` providers have their
+    answers stored in the route cache.
+    """
+    name = "base"
+    cacheable = False
+
+    def route(self, waypoints):
+        raise NotImplementedError
+
+
+class OSRMProvider(RoutingProvider):
+    name = "osrm"
+    cacheable = True
+
+    def route(self, waypoints):
+        # OSRM takes lon,lat
+        coords_str = ";".join(f"{lon},{lat}" for lat, lon in waypoints)
+        
+        base_url = get_setting("OSRM_URL", "http://router.project-osrm.org")
+        url = f"{base_url}/route/v1/driving/{coords_str}?overview=full&geometries=geojson&annotations=distance"
+        data = upstream_get("osrm", url)
         
         if data["code"] != "Ok":
              raise Exception(f"OSRM Error: {data.get('code')}")
             
         route = data["routes"][0]
-        return {
-            "distance_miles": route["distance"] * 0.000621371,
-            "duration_hours": route["duration"] / 3600,
-            "geometry": route["geometry"]
-        }
-    except Exception as e:
-        print(f"Routing Error: {e}")
-        # Fallback to simple calculation if API fails
-        dist = ((end_coords[0] - start_coords[0])**2 + (end_coords[1] - start_coords[1])**2)**0.5 * 69
-        return {
-             "distance_miles": dist,
-             "duration_hours": dist / 50.0,
-             "geometry": None
-        }
+        geometries = split_leg_geometry(route["geometry"], route["legs"])
+        return [
+            {
+                "distance_miles": leg["distance"] * 0.000621371,
+                "duration_hours": leg["duration"] / 3600,
+                "geometry": geometry
+            }
+            for leg, geometry in zip(route["legs"], geometries)
+        ]
+
+
+class RoadGraphProvider(RoutingProvider):
+    """
+    Offline routing over a local road network file (see RoadGraph).
+    """
+    name = "road_graph"
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def route(self, waypoints):
+        return [self.graph.route(start, end) for start, end in zip(waypoints, waypoints[1:])]
+
+
+class StraightLineProvider(RoutingProvider):
+    name = "straight_line"
+
+    def route(self, waypoints):
+        return [straight_line_route(start, end) for start, end in zip(waypoints, waypoints[1:])]
+
+
+_providers = None
+
+
+def get_providers():
+    """
+    Providers from ROUTING_PROVIDERS, tried in order. "road_graph" is skipped
+    when ROAD_GRAPH_PATH is not set or cannot be loaded.
+    """
+    global _providers
+    if _providers is None:
+        with _cache_lock:
+            if _providers is None:
+                providers = []
+                for name in get_setting("ROUTING_PROVIDERS", ["osrm", "road_graph"]):
+                    if name == "osrm":
+                        providers.append(OSRMProvider())
+                    elif name == "road_graph":
+                        path = get_setting("ROAD_GRAPH_PATH", None)
+                        if not path:
+                            continue
+                        try:
+                            providers.append(RoadGraphProvider(RoadGraph.load(path)))
+                        except (OSError, ValueError, KeyError) as e:
+                            logger.error("Road graph not loaded from %s: %s", path, e)
+                    elif name == "straight_line":
+                        providers.append(StraightLineProvider())
+                    else:
+                        raise ValueError(f"Unknown routing provider: {name}")
+                _providers = providers
+    return _providers
+
+
+def get_multi_leg_route(waypoints):
+    """
+    Route through all waypoints with one request to the first provider that
+    answers (a single OSRM call for the whole trip by default).
+    waypoints: list of (lat, lon) tuples, at least two.
+    Returns one dict per leg (distance_miles, duration_hours, geometry).
+
+    Successful OSRM answers are cached per quantized leg; the straight-line
+    fallback is never cached so the lane is retried on the next request.
+    """
+    if len(waypoints) < 2:
+        raise ValueError("At least two waypoints are required")
+
+    pairs = list(zip(waypoints, waypoints[1:]))
+    cache = get_route_cache()
+    keys = [route_cache_key(start, end) for start, end in pairs]
+    cached = [cache.get(key) for key in keys]
+    if all(leg is not None for leg in cached):
+        return cached
+
+    for provider in get_providers():
+        try:
+            legs = provider.route(waypoints)
+        except Exception as e:
+            logger.warning("Routing error (%s): %s", provider.name, e)
+            routing_errors.inc(provider=provider.name)
+            continue
+        if provider.cacheable:
+            for key, leg in zip(keys, legs):
+                cache.set(key, leg)
+        return legs
+
+    # Fallback to simple calculation if every provider fails; keep whatever was cached
+    routing_fallbacks.inc()
+    return [
+        leg if leg is not None else straight_line_route(start, end)
+        for leg, (start, end) in zip(cached, pairs)
+    ]
+
+
+def split_leg_geometry(geometry, legs):
+    """
+    Split the full route LineString into one LineString per leg.
+    With annotations=distance each leg lists one distance per segment, so a
+    leg spans len(distance) + 1 coordinates and shares its last coordinate
+    with the first coordinate of the next leg.
+    """
+    coords = geometry["coordinates"]
+    parts = []
+    offset = 0
+    for leg in legs:
+        segment_count = len(leg["annotation"]["distance"])
+        parts.append({
+            "type": "LineString",
+            "coordinates": coords[offset:offset + segment_count + 1]
+        })
+        offset += segment_count
+    return parts
+
+
+def straight_line_route(start_coords, end_coords):
+    dist = ((end_coords[0] - start_coords[0])**2 + (end_coords[1] - start_coords[1])**2)**0.5 * 69
+    return {
+         "distance_miles": dist,
+         "duration_hours": dist / 50.0,
+         "geometry": None
+    }
 
 def geocode(address):
     """
     Geocode address string to (lat, lon).
+    Results are cached by normalized address; failed lookups are not cached.
     """
-    url = "https://nominatim.openstreetmap.org/search"
+    if not address:
+        return None
+    cache = get_geocode_cache()
+    key = normalize_address(address)
+    cached = cache.get(key)
+    if cached is not None:
+        return tuple(cached)
+
+    url = get_setting("NOMINATIM_URL", "https://nominatim.openstreetmap.org") + "/search"
     params = {
         "q": address,
         "format": "json",
@@ -48,11 +245,13 @@ def geocode(address):
         "User-Agent": "DriverApp/1.0"
     }
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=3)
-        data = response.json()
+        data = upstream_get("nominatim", url, params=params, headers=headers)
         if data:
             # Lat/Lon are strings in Nominatim response
-            return (float(data[0]['lat']), float(data[0]['lon']))
+            coords = (float(data[0]['lat']), float(data[0]['lon']))
+            cache.set(key, list(coords))
+            return coords
     except Exception as e:
-        print(f"Geocoding Error: {e}")
+        logger.warning("Geocoding error for %r: %s", address, e)
+    geocode_failures.inc()
     return None
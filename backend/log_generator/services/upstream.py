@@ -0,0 +1,172 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import get_setting
+from .metrics import upstream_requests, upstream_seconds
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of making a request while an upstream's circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    After `failure_threshold` failures in a row the circuit opens and calls are
+    rejected for `reset_timeout` seconds; then a single trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow_request(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1 / max_rps seconds apart, without bursts (e.g.
+    Nominatim's usage policy allows one request per second). acquire() blocks
+    the calling thread until its slot comes up.
+    """
+    def __init__(self, max_rps):
+        self.interval = 1.0 / max_rps
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_lock = threading.Lock()
+_sessions = {}
+_breakers = {}
+_limiters = {}
+
+
+def get_session(name):
+    """
+    Module-level keep-alive session per upstream, so repeated calls reuse
+    pooled TCP/TLS connections instead of reconnecting every time.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                retry = Retry(
+                    total=get_setting("UPSTREAM_RETRIES", 2),
+                    backoff_factor=get_setting("UPSTREAM_BACKOFF_FACTOR", 0.3),
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                pool_size = get_setting("UPSTREAM_POOL_SIZE", 16)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[name] = session
+    return session
+
+
+def get_breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    name,
+                    failure_threshold=get_setting("UPSTREAM_BREAKER_THRESHOLD", 5),
+                    reset_timeout=get_setting("UPSTREAM_BREAKER_RESET", 30.0),
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+def get_rate_limiter(name):
+    """
+    Shared limiter for `name` from the <NAME>_MAX_RPS setting
+    (e.g. NOMINATIM_MAX_RPS), or None if that upstream is not limited.
+    """
+    with _lock:
+        if name not in _limiters:
+            max_rps = get_setting(f"{name.upper()}_MAX_RPS", None)
+            _limiters[name] = RateLimiter(max_rps) if max_rps else None
+        return _limiters[name]
+
+
+def upstream_get(name, url, timeout=None, **kwargs):
+    """
+    GET through the pooled session for `name`, guarded by its circuit breaker
+    and paced by its rate limiter. Returns the decoded JSON body. Raises
+    UpstreamUnavailable without touching the network while the circuit is open.
+    """
+    breaker = get_breaker(name)
+    if not breaker.allow_request():
+        upstream_requests.inc(upstream=name, outcome="circuit_open")
+        raise UpstreamUnavailable(f"{name} circuit open")
+    limiter = get_rate_limiter(name)
+    if limiter is not None:
+        limiter.acquire()
+    if timeout is None:
+        timeout = get_setting("UPSTREAM_TIMEOUT", 3)
+    start = time.perf_counter()
+    try:
+        response = get_session(name).get(url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        data = response.json()
+    except Exception:
+        breaker.record_failure()
+        upstream_requests.inc(upstream=name, outcome="error")
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - start, upstream=name)
+    breaker.record_success()
+    upstream_requests.inc(upstream=name, outcome="ok")
+    return data
@@ -0,0 +1,176 @@
+import tempfile
+import zlib
+
+from PIL import ImageColor
+
+# A4 landscape in PDF points
+PAGE_WIDTH_PT = 842
+PAGE_HEIGHT_PT = 595
+
+# Pillow's default font is ~10px with a 10px ascent; Helvetica is the closest
+# of the standard 14 fonts and needs no embedding.
+FONT_SIZE_PX = 10
+FONT_ASCENT_PX = 10
+
+
+def _num(value):
+    text = f"{value:.2f}".rstrip("0").rstrip(".")
+    return text if text not in ("", "-0") else "0"
+
+
+def _color(fill):
+    r, g, b = ImageColor.getrgb(fill)[:3]
+    return f"{_num(r / 255)} {_num(g / 255)} {_num(b / 255)}"
+
+
+def _escape(text):
+    text = str(text).encode("latin-1", "replace").decode("latin-1")
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+class PdfCanvas:
+    """
+    Records native PDF drawing operators through the subset of the
+    ImageDraw API that LogSheetDrawer uses (text, line, rectangle), so the
+    same layout code can draw either a raster page or a vector page.
+    Coordinates are in the drawer's pixel space (top-left origin) and are
+    scaled to an A4 landscape page.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.scale = min(PAGE_WIDTH_PT / width, PAGE_HEIGHT_PT / height)
+        self._ops = []
+        self._stroke = None
+        self._fill = None
+        self._line_width = None
+
+    def _x(self, x):
+        return _num(x * self.scale)
+
+    def _y(self, y):
+        return _num((self.height - y) * self.scale)
+
+    def _set_stroke(self, fill, width):
+        color = _color(fill)
+        if color != self._stroke:
+            self._ops.append(f"{color} RG")
+            self._stroke = color
+        line_width = _num(width * self.scale)
+        if line_width != self._line_width:
+            self._ops.append(f"{line_width} w")
+            self._line_width = line_width
+
+    def _set_fill(self, fill):
+        color = _color(fill)
+        if color != self._fill:
+            self._ops.append(f"{color} rg")
+            self._fill = color
+
+    def line(self, xy, fill="black", width=1):
+        (x1, y1), (x2, y2) = xy
+        self._set_stroke(fill, width)
+        self._ops.append(f"{self._x(x1)} {self._y(y1)} m {self._x(x2)} {self._y(y2)} l S")
+
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        (x1, y1), (x2, y2) = xy
+        rect = f"{self._x(x1)} {self._y(y2)} {_num((x2 - x1) * self.scale)} {_num((y2 - y1) * self.scale)} re"
+        if fill is not None:
+            self._set_fill(fill)
+            self._ops.append(f"{rect} f")
+        if outline is not None:
+            self._set_stroke(outline, width)
+            self._ops.append(f"{rect} S")
+
+    def text(self, xy, text, fill="black", font=None):
+        x, y = xy
+        self._set_fill(fill)
+        size = _num(FONT_SIZE_PX * self.scale)
+        self._ops.append(
+            f"BT /F1 {size} Tf {self._x(x)} {self._y(y + FONT_ASCENT_PX)} Td ({_escape(text)}) Tj ET"
+        )
+
+    def getvalue(self):
+        return ("\n".join(self._ops) + "\n").encode("latin-1")
+
+
+class VectorPdfWriter:
+    """
+    Writes a vector PDF incrementally to a temporary file, one page at a time.
+    The static form is stored once as a Form XObject that every page
+    references, so each page only carries its own fields and duty lines.
+    Same interface as PdfPageWriter: add_page(), getvalue(), close().
+    """
+    CATALOG, PAGES, FONT, TEMPLATE = 1, 2, 3, 4
+
+    def __init__(self, template_ops):
+        self._file = tempfile.TemporaryFile()
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 5
+        self._finished = None
+        self.page_count = 0
+
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(self.CATALOG, f"<< /Type /Catalog /Pages {self.PAGES} 0 R >>".encode())
+        self._write_object(
+            self.FONT,
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        )
+        self._write_stream(
+            self.TEMPLATE,
+            template_ops,
+            f"/Type /XObject /Subtype /Form /BBox [0 0 {PAGE_WIDTH_PT} {PAGE_HEIGHT_PT}] "
+            f"/Resources << /Font << /F1 {self.FONT} 0 R >> >>",
+        )
+
+    def _write_object(self, obj_id, body):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def _write_stream(self, obj_id, data, extra=""):
+        compressed = zlib.compress(data)
+        header = f"<< {extra} /Filter /FlateDecode /Length {len(compressed)} >>\nstream\n".encode()
+        self._write_object(obj_id, header + compressed + b"\nendstream")
+
+    def add_page(self, canvas):
+        content_id, page_id = self._next_id, self._next_id + 1
+        self._next_id += 2
+        # Draw the shared template first, then this page's own operators
+        self._write_stream(content_id, b"q /Tpl Do Q\n" + canvas.getvalue())
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {PAGE_WIDTH_PT} {PAGE_HEIGHT_PT}] "
+            f"/Resources << /Font << /F1 {self.FONT} 0 R >> /XObject << /Tpl {self.TEMPLATE} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>"
+        ).encode())
+        self._page_ids.append(page_id)
+        self.page_count += 1
+
+    def _finish(self):
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {self.page_count} >>".encode())
+        xref_offset = self._file.tell()
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            lines.append(f"{self._offsets[obj_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._file.write("".join(lines).encode())
+
+    def getvalue(self):
+        if self.page_count == 0:
+            return None
+        if self._finished is None:
+            self._finish()
+            self._file.seek(0)
+            self._finished = self._file.read()
+        return self._finished
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,3 +1,1049 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+from PIL import Image
+
+from .models import Driver, PlanJob
+from .services import planner, routing, upstream
+from .services.artifacts import ArtifactStore, get_artifact_store
+from .services.cache import LRUCache, TieredCache
+from .services.duty_history import record_duty_events, with_availability
+from .services.duty_log import DutyRecord, to_epoch_minutes
+from .services.hos_ledger import CycleLedger
+from .services.hos_logic import TripScheduler
+from .services.jobs import JobWorkerPool, claim_next_job, job_params, requeue_stale_jobs, run_job
+from .services.log_days import partition_days
+from .services.metrics import Registry, collect_timings, server_timing_header, span
+from .services.pdf_drawer import LogSheetDrawer
+from .services.planner import bucket_start_time, get_image_options, get_cached_plan, plan_cache_key
+from .services.road_graph import RoadGraph
+from .services.route_index import RouteIndex, state_at
+from .services.routing import get_multi_leg_route, normalize_address, route_cache_key, split_leg_geometry
+from .services.upstream import CircuitBreaker, RateLimiter, UpstreamUnavailable, upstream_get
+from .services.vector_pdf import PdfCanvas, VectorPdfWriter
+from .views import _PlanRequestError, _parse_range
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+
+def _minutes(*args, tz=timezone.utc):
+    # Whole epoch minutes
+    return round(to_epoch_minutes(datetime(*args, tzinfo=tz)))
+
+
+class CacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("log_generator.services.cache.time")
+        self.clock = patcher.start()
+        self.clock.time.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "cache.sqlite3"
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(ttl=60)
+        cache.set("a", 1)
+        self.clock.time.return_value = 1059.0
+        self.assertEqual(cache.get("a"), 1)
+        self.clock.time.return_value = 1061.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_disk_tier_survives_a_new_memory_tier(self):
+        TieredCache("test", path=self.path).set("chicago, il", [41.88, -87.63])
+        cache = TieredCache("test", path=self.path)
+        self.assertEqual(cache.get("chicago, il"), [41.88, -87.63])
+        # Promoted to memory on the way out
+        self.assertEqual(cache.memory.get("chicago, il"), [41.88, -87.63])
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_expired_disk_entry_is_a_miss(self):
+        TieredCache("test", ttl=60, path=self.path).set("key", "value")
+        self.clock.time.return_value = 1061.0
+        cache = TieredCache("test", ttl=60, path=self.path)
+        self.assertEqual(cache.get("key", "default"), "default")
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_normalized_addresses_share_a_key(self):
+        self.assertEqual(normalize_address("  Chicago ,IL "), normalize_address("chicago, il"))
+
+
+class RouteCacheTests(SimpleTestCase):
+    def setUp(self):
+        # A fresh memory-only route cache per test
+        patcher = mock.patch.object(routing, "_route_cache", TieredCache("route-test"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nearby_coordinates_share_a_key(self):
+        key = route_cache_key((41.88111, -87.62999), (39.1, -84.5))
+        self.assertEqual(key, route_cache_key((41.88149, -87.63011), (39.1, -84.5)))
+        self.assertNotEqual(key, route_cache_key((41.8822, -87.63), (39.1, -84.5)))
+
+    @mock.patch("log_generator.services.routing.upstream_get")
+    def test_each_leg_is_cached(self, get):
+        get.return_value = {"code": "Ok", "routes": [{
+            "geometry": {"type": "LineString", "coordinates": [[-87.63, 41.88], [-86.0, 40.5], [-84.5, 39.1]]},
+            "legs": [
+                {"distance": 160934.4, "duration": 7200, "annotation": {"distance": [160934.4]}},
+                {"distance": 80467.2, "duration": 3600, "annotation": {"distance": [80467.2]}},
+            ],
+        }]}
+        waypoints = [(41.88, -87.63), (40.5, -86.0), (39.1, -84.5)]
+        first = get_multi_leg_route(waypoints)
+        self.assertEqual(get_multi_leg_route(waypoints), first)
+        self.assertAlmostEqual(first[0]["distance_miles"], 100, places=3)
+        self.assertEqual(first[1]["geometry"]["coordinates"], [[-86.0, 40.5], [-84.5, 39.1]])
+        self.assertEqual(get.call_count, 1)
+
+    @mock.patch("log_generator.services.routing.upstream_get", side_effect=requests.ConnectionError)
+    def test_straight_line_fallback_is_not_cached(self, get):
+        waypoints = [(41.88, -87.63), (39.1, -84.5)]
+        self.assertIsNone(get_multi_leg_route(waypoints)[0]["geometry"])
+        get_multi_leg_route(waypoints)
+        self.assertEqual(get.call_count, 2)
+
+
+class SplitLegGeometryTests(SimpleTestCase):
+    def test_legs_share_their_joining_coordinate(self):
+        geometry = {"type": "LineString", "coordinates": [[0, 0], [1, 0], [2, 0], [3, 0], [4, 0]]}
+        legs = [{"annotation": {"distance": [1, 1]}}, {"annotation": {"distance": [1, 1]}}]
+        parts = split_leg_geometry(geometry, legs)
+        self.assertEqual([p["coordinates"] for p in parts], [[[0, 0], [1, 0], [2, 0]], [[2, 0], [3, 0], [4, 0]]])
+        self.assertEqual({p["type"] for p in parts}, {"LineString"})
+
+    def test_single_leg_keeps_the_whole_line(self):
+        geometry = {"type": "LineString", "coordinates": [[0, 0], [1, 1]]}
+        parts = split_leg_geometry(geometry, [{"annotation": {"distance": [157000.0]}}])
+        self.assertEqual(parts, [geometry])
+
+
+class RoadGraphTests(SimpleTestCase):
+    def setUp(self):
+        # Two ways from a to d: the short one is slow, the long one fast.
+        # The e -> a edge is one-way.
+        self.graph = RoadGraph(
+            nodes=[["a", 0.0, 0.0], ["b", 0.0, 1.0], ["c", 1.0, 1.0], ["d", 0.0, 2.0], ["e", 5.0, 5.0]],
+            edges=[["a", "b", 69, 30], ["b", "d", 69, 30], ["a", "c", 100, 70], ["c", "d", 100, 70],
+                   ["e", "a", 400, 65, True]],
+        )
+
+    def node(self, index):
+        return self.graph.node_ids[index]
+
+    def test_nearest_node(self):
+        self.assertEqual(self.node(self.graph.nearest_node(0.1, 0.1)), "a")
+        self.assertEqual(self.node(self.graph.nearest_node(4.0, 4.5)), "e")
+
+    def test_nearest_node_checks_the_next_ring(self):
+        # The query's own grid cell holds a node, but one across the cell edge is closer
+        graph = RoadGraph(nodes=[["near", 0.999, 0.5], ["far", 1.9, 0.5]], edges=[])
+        self.assertEqual(graph.node_ids[graph.nearest_node(1.001, 0.5)], "near")
+
+    def test_shortest_path_minimises_travel_time(self):
+        path, miles, hours = self.graph.shortest_path(0, 3)
+        self.assertEqual([self.node(i) for i in path], ["a", "c", "d"])
+        self.assertAlmostEqual(miles, 200)
+        self.assertAlmostEqual(hours, 200 / 70)
+
+    def test_one_way_edges(self):
+        self.assertEqual([self.node(i) for i in self.graph.shortest_path(4, 0)[0]], ["e", "a"])
+        self.assertIsNone(self.graph.shortest_path(0, 4))
+
+    def test_route_adds_access_hops(self):
+        leg = self.graph.route((0.0, 0.01), (0.0, 1.99))
+        self.assertGreater(leg["distance_miles"], 200)
+        self.assertEqual(leg["geometry"]["coordinates"][0], [0.01, 0.0])
+        self.assertEqual(leg["geometry"]["coordinates"][-1], [1.99, 0.0])
+        with self.assertRaises(ValueError):
+            self.graph.route((0.0, 0.0), (5.0, 5.0))
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("log_generator.services.upstream.time")
+        self.clock = patcher.start()
+        self.clock.monotonic.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "closed")
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_half_open_allows_one_trial(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.monotonic.return_value = 1030.0
+        self.assertEqual(self.breaker.state, "half-open")
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_trial_outcome_closes_or_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.monotonic.return_value = 1030.0
+        self.breaker.allow_request()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, "open")
+
+        self.clock.monotonic.return_value = 1060.0
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertTrue(self.breaker.allow_request())
+
+    @mock.patch("log_generator.services.upstream.get_session")
+    def test_open_circuit_skips_the_network(self, get_session):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        with mock.patch.dict(upstream._breakers, {"test": self.breaker}):
+            with self.assertRaises(UpstreamUnavailable):
+                upstream_get("test", "http://upstream.invalid/")
+        get_session.assert_not_called()
+
+
+class RateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("log_generator.services.upstream.time")
+        self.clock = patcher.start()
+        self.clock.monotonic.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+    def test_calls_are_spaced_evenly(self):
+        limiter = RateLimiter(2)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual([c.args[0] for c in self.clock.sleep.call_args_list], [0.5, 1.0])
+
+    def test_no_wait_after_an_idle_period(self):
+        limiter = RateLimiter(1)
+        limiter.acquire()
+        self.clock.monotonic.return_value = 1010.0
+        limiter.acquire()
+        self.clock.sleep.assert_not_called()
+
+    @mock.patch("log_generator.services.upstream.get_session")
+    def test_upstream_get_paces_limited_upstreams(self, get_session):
+        self.clock.perf_counter.return_value = 0.0
+        with override_settings(LIMITED_MAX_RPS=4), mock.patch.dict(upstream._limiters, clear=True):
+            upstream_get("limited", "http://upstream.invalid/")
+            upstream_get("limited", "http://upstream.invalid/")
+            upstream_get("unlimited", "http://upstream.invalid/")
+            self.assertEqual(upstream._limiters["limited"].interval, 0.25)
+            self.assertIsNone(upstream._limiters["unlimited"])
+        self.clock.sleep.assert_called_once_with(0.25)
+
+
+def _fake_geocode(address):
+    # "Nowhere" cannot be geocoded; everything else gets a made-up position
+    if "nowhere" in address.lower():
+        return None
+    return (float(len(address)), -float(len(address)))
+
+
+def _fake_route(waypoints):
+    return [{"distance_miles": 100.0, "duration_hours": 2.0, "geometry": None} for _ in waypoints[1:]]
+
+
+def _fake_build_plan(current, pickup, dropoff, route_1, route_2, cycle_used, *args, **kwargs):
+    return {"itinerary": [current, pickup, dropoff], "cycle_used": cycle_used, "log_images": [], "pdf": None}
+
+
+class BatchPlanViewTests(TestCase):
+    def setUp(self):
+        for name, fake in (("geocode", _fake_geocode), ("get_multi_leg_route", _fake_route),
+                           ("build_plan", _fake_build_plan)):
+            patcher = mock.patch(f"log_generator.views.{name}", side_effect=fake)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        # Threads instead of worker processes, so the fakes above apply
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        patcher = mock.patch("log_generator.views.get_process_pool", return_value=pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(planner, "_plan_cache", TieredCache("plan-test"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, trips):
+        response = self.client.post(
+            reverse("generate-plan-batch"), json.dumps({"trips": trips}), content_type="application/json"
+        )
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        return {line["index"]: line for line in lines}
+
+    def trip(self, current, pickup="Gary, IN", dropoff="Toledo, OH", **fields):
+        return dict(current_location=current, pickup_location=pickup, dropoff_location=dropoff, **fields)
+
+    def test_cached_trips_skip_geocoding(self):
+        self.post([self.trip("Chicago, IL")])
+        self.geocode.reset_mock()
+        self.build_plan.reset_mock()
+        results = self.post([self.trip("chicago, il")])
+        self.assertEqual(results[0]["status"], 200)
+        self.geocode.assert_not_called()
+        self.build_plan.assert_not_called()
+
+    def test_geocodes_and_routes_once_per_distinct_input(self):
+        results = self.post([
+            self.trip("Chicago, IL"),
+            self.trip("  chicago ,IL", cycle_used=10),
+            self.trip("Joliet, IL"),
+        ])
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual({line["status"] for line in results.values()}, {200})
+        self.assertEqual(results[1]["result"]["cycle_used"], 10)
+        # Chicago, Joliet, Gary and Toledo
+        self.assertEqual(self.geocode.call_count, 4)
+        self.assertEqual(self.get_multi_leg_route.call_count, 2)
+
+    def test_errors_are_reported_per_trip(self):
+        results = self.post([
+            self.trip("Chicago, IL"),
+            {"current_location": "Chicago, IL"},
+            self.trip("Nowhere"),
+            self.trip("Chicago, IL", cycle_used="lots"),
+            self.trip("Chicago, IL", cycle_used=71),
+        ])
+        self.assertEqual(results[0]["status"], 200)
+        self.assertEqual(results[1], {"index": 1, "status": 400, "error": "Invalid trip request"})
+        self.assertEqual(results[2], {"index": 2, "status": 400, "error": "Could not geocode locations"})
+        self.assertEqual(results[3]["status"], 400)
+        self.assertEqual(results[4]["status"], 400)
+
+    def test_stored_drivers_supply_their_duty_history(self):
+        driver = Driver.objects.create(name="Test Driver", home_timezone="America/Chicago")
+        results = self.post([
+            self.trip("Chicago, IL", driver_id=driver.pk),
+            self.trip("Chicago, IL", driver_id=driver.pk + 1),
+            self.trip("Chicago, IL", driver_id="me"),
+        ])
+        self.assertEqual(results[0]["status"], 200)
+        self.assertEqual(results[1], {"index": 1, "status": 404, "error": "Unknown driver"})
+        self.assertEqual(results[2], {"index": 2, "status": 400, "error": "driver_id must be an integer"})
+        args = self.build_plan.call_args.args
+        # start_time in the driver's zone, seven prior days and the open shift
+        self.assertEqual(str(args[6].tzinfo), "America/Chicago")
+        self.assertEqual(args[7], [0.0] * 7)
+        self.assertIsNotNone(args[9])
+
+    def test_rejects_a_body_without_trips(self):
+        response = self.client.post(reverse("generate-plan-batch"), {"trips": []}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class GeneratePlanValidationTests(SimpleTestCase):
+    def post(self, **fields):
+        body = dict(current_location="Chicago, IL", pickup_location="Gary, IN", dropoff_location="Toledo, OH", **fields)
+        return self.client.post(reverse("generate-plan"), json.dumps(body), content_type="application/json")
+
+    def test_cycle_used_must_be_a_finite_number_of_hours_in_the_cycle(self):
+        for cycle_used in (-1, 70.5, "NaN", "Infinity", "lots"):
+            with self.subTest(cycle_used=cycle_used):
+                response = self.post(cycle_used=cycle_used)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_prior_days_must_be_finite(self):
+        self.assertEqual(self.post(prior_days=[8, "NaN"]).status_code, 400)
+
+
+def _driving_before(events, remark):
+    # Driving minutes before the first event with `remark`
+    total = 0
+    for e in events:
+        if e['remark'] == remark:
+            return total
+        if e['status'] == 3:
+            total += e['duration']
+    raise AssertionError(f"No '{remark}' event")
+
+
+class DriveLegTests(SimpleTestCase):
+    def scheduler(self, **kwargs):
+        return TripScheduler(datetime(2024, 1, 8, 6, 0), **kwargs)
+
+    def schedule(self, miles, hours, **kwargs):
+        scheduler = self.scheduler(**kwargs)
+        scheduler.drive_leg(miles, hours, "Start, IL", "End, OH")
+        return scheduler.events
+
+    def test_break_after_8_hours_driving(self):
+        events = self.schedule(450, 9)
+        self.assertEqual(_driving_before(events, "30-min Rest Break"), 8 * 60)
+        self.assertEqual([e['status'] for e in events], [3, 1, 3, 4])
+
+    def test_reset_after_11_hours_driving(self):
+        events = self.schedule(600, 12)
+        self.assertEqual(_driving_before(events, "10-hour Sleeper Berth Reset"), 11 * 60)
+        self.assertEqual(sum(e['duration'] for e in events if e['status'] == 3), 12 * 60)
+
+    def test_reset_at_end_of_14_hour_window(self):
+        scheduler = self.scheduler()
+        scheduler.add_event(4, 10 * 60, "Yard", "Loading")
+        scheduler.drive_leg(300, 6, "Start, IL", "End, OH")
+        self.assertEqual(_driving_before(scheduler.events, "10-hour Sleeper Berth Reset"), 4 * 60)
+
+    def test_restart_when_70_hour_cycle_is_used(self):
+        events = self.schedule(100, 2, cycle_used_hours=69)
+        self.assertEqual(_driving_before(events, "34-Hour Cycle Restart"), 60)
+
+    def test_waits_for_cycle_hours_to_roll_off(self):
+        scheduler = TripScheduler(datetime(2024, 1, 8, 20, 0), prior_days=[10] * 7)
+        scheduler.drive_leg(100, 2, "Start, IL", "End, OH")
+        first = scheduler.events[0]
+        self.assertEqual(first['remark'], "Off Duty - Waiting for Cycle Hours")
+        self.assertEqual(first['duration'], 4 * 60)
+        self.assertNotIn("34-Hour Cycle Restart", [e['remark'] for e in scheduler.events])
+
+    def test_cycle_within_epsilon_of_the_limit_terminates(self):
+        # Used to loop forever: the ledger saw hours left, the scheduler did not
+        scheduler = TripScheduler(datetime(2024, 1, 8, 6, 0, tzinfo=timezone.utc), cycle_used_hours=69.9999997)
+        scheduler.drive_leg(100, 2, "Start, IL", "End, OH")
+        self.assertEqual(scheduler.events[0]['remark'], "34-Hour Cycle Restart")
+        self.assertAlmostEqual(sum(e['duration'] for e in scheduler.events if e['status'] == 3), 2 * 60)
+
+    def test_driving_is_labelled_with_the_state_it_passes_through(self):
+        scheduler = self.scheduler()
+        geometry = {"type": "LineString", "coordinates": [[-87.63, 41.88], [-83.54, 41.65]]}
+        scheduler.drive_leg(450, 9, "Chicago, IL", "Toledo, OH", geometry)
+        driving = [e['location'] for e in scheduler.events if e['status'] == 3]
+        self.assertEqual(driving[0], "41.88, -87.63, IL")
+        self.assertTrue(driving[1].endswith(", OH"), driving[1])
+
+    def test_positions_outside_every_state_keep_bare_coordinates(self):
+        scheduler = self.scheduler()
+        scheduler.drive_leg(100, 2, "Start", "End", {"type": "LineString", "coordinates": [[0, 0], [1, 0]]})
+        self.assertEqual(scheduler.events[0]['location'], "0.00, 0.00")
+
+    def test_fuel_every_1000_miles(self):
+        events = self.schedule(1100, 20)
+        fuel = [e for e in events if e['remark'] == "Fueling - On Duty"]
+        self.assertEqual(len(fuel), 1)
+        self.assertAlmostEqual(_driving_before(events, "Fueling - On Duty") * 55 / 60, 1000)
+
+    def test_multi_week_trip_is_not_truncated(self):
+        events = self.schedule(20000, 400)
+        self.assertAlmostEqual(sum(e['duration'] for e in events if e['status'] == 3), 400 * 60)
+        self.assertEqual(events[-1]['remark'], "Arrived / Post-Trip")
+        self.assertGreater(events[-1]['start'] - events[0]['start'], timedelta(days=21))
+
+
+def _pdf_objects(data):
+    """
+    {object id: body} of a PDF, found through its xref table, so every
+    offset the file advertises is checked.
+    """
+    tail = data[data.rindex(b"startxref"):].split()
+    xref = data[int(tail[1]):].split(b"\n")
+    if xref[0] != b"xref":
+        raise ValueError("startxref does not point at the xref table")
+    _, size = map(int, xref[1].split())
+    objects = {}
+    for obj_id in range(1, size):
+        offset = int(xref[2 + obj_id].split()[0])
+        header = f"{obj_id} 0 obj\n".encode()
+        if data[offset:offset + len(header)] != header:
+            raise ValueError(f"Bad offset for object {obj_id}")
+        objects[obj_id] = data[offset + len(header):data.index(b"\nendobj", offset)]
+    return objects
+
+
+def _pdf_stream(body):
+    length = int(re.search(rb"/Length (\d+)", body).group(1))
+    start = body.index(b"stream\n") + len(b"stream\n")
+    if body[start + length:] != b"\nendstream":
+        raise ValueError("Stream length does not match /Length")
+    return zlib.decompress(body[start:start + length])
+
+
+class VectorPdfTests(SimpleTestCase):
+    def page(self, text):
+        canvas = PdfCanvas(1000, 700)
+        canvas.line([(0, 0), (1000, 700)], width=2)
+        canvas.rectangle([(10, 10), (100, 50)], outline="black")
+        canvas.text((20, 20), text)
+        return canvas
+
+    def test_output_is_a_well_formed_pdf(self):
+        template = LogSheetDrawer().get_vector_template()
+        with VectorPdfWriter(template) as pdf:
+            pdf.add_page(self.page("Chicago, IL"))
+            pdf.add_page(self.page("Remarks (Loading)"))
+            data = pdf.getvalue()
+
+        self.assertTrue(data.startswith(b"%PDF-1.4"))
+        self.assertTrue(data.endswith(b"%%EOF\n"))
+        objects = _pdf_objects(data)
+        self.assertIn(b"/Type /Catalog", objects[VectorPdfWriter.CATALOG])
+        self.assertIn(b"/Count 2", objects[VectorPdfWriter.PAGES])
+        self.assertEqual(_pdf_stream(objects[VectorPdfWriter.TEMPLATE]), template)
+
+        pages = [body for body in objects.values() if b"/Type /Page " in body]
+        self.assertEqual(len(pages), 2)
+        contents = [_pdf_stream(objects[int(re.search(rb"/Contents (\d+) 0 R", page).group(1))]) for page in pages]
+        self.assertTrue(all(c.startswith(b"q /Tpl Do Q\n") for c in contents))
+        # Parentheses in text are escaped
+        self.assertIn(rb"(Remarks \(Loading\)) Tj", contents[1])
+
+    def test_no_pages_gives_no_pdf(self):
+        with VectorPdfWriter(b"") as pdf:
+            self.assertIsNone(pdf.getvalue())
+
+
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(_parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(_parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(_parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(_parse_range("bytes=-500", 100), (0, 99))
+        self.assertEqual(_parse_range("bytes=50-999", 100), (50, 99))
+
+    def test_full_response_for_missing_or_multi_range(self):
+        self.assertIsNone(_parse_range(None, 100))
+        self.assertIsNone(_parse_range("bytes=-", 100))
+        self.assertIsNone(_parse_range("bytes=0-1,5-6", 100))
+
+    def test_unsatisfiable(self):
+        for header in ("bytes=100-", "bytes=9-5", "bytes=-0"):
+            with self.assertRaises(ValueError):
+                _parse_range(header, 100)
+
+
+class ArtifactStoreTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = ArtifactStore(tmp.name)
+
+    def test_new_files_trigger_a_prune(self):
+        with mock.patch.object(ArtifactStore, "maybe_prune") as maybe_prune:
+            artifact_id = self.store.put(b"page", "png")
+            self.assertEqual(self.store.put(b"page", "png"), artifact_id)
+        maybe_prune.assert_called_once_with()
+
+    @override_settings(ARTIFACT_PRUNE_INTERVAL=3600, ARTIFACT_MAX_AGE=3600, PLAN_CACHE_TTL=60)
+    def test_background_prune_is_throttled(self):
+        with mock.patch.object(ArtifactStore, "maybe_prune"):
+            old, new = self.store.put(b"old", "png"), self.store.put(b"new", "png")
+        os.utime(self.store.path(old), (0, 0))
+        self.store.maybe_prune().join()
+        self.assertFalse(self.store.exists(old))
+        self.assertTrue(self.store.exists(new))
+        self.assertIsNone(self.store.maybe_prune())
+
+    @override_settings(ARTIFACT_PRUNE_INTERVAL=None)
+    def test_background_prune_can_be_disabled(self):
+        self.assertIsNone(self.store.maybe_prune())
+
+
+class ArtifactViewTests(SimpleTestCase):
+    DATA = bytes(range(100))
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(ARTIFACT_ROOT=Path(tmp.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.artifact_id = get_artifact_store().put(self.DATA, "png")
+
+    def get(self, artifact_id=None, **headers):
+        return self.client.get(reverse("artifact", args=[artifact_id or self.artifact_id]), headers=headers)
+
+    def test_full_response(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.DATA)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["ETag"], f'"{self.artifact_id[:64]}"')
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.get(if_none_match=f'"{self.artifact_id[:64]}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.get(if_none_match='"other"').status_code, 200)
+
+    def test_range_request(self):
+        response = self.get(range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.DATA[10:20])
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(response["Content-Length"], "10")
+
+    def test_unsatisfiable_range(self):
+        response = self.get(range="bytes=100-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */100")
+
+    def test_unknown_or_invalid_ids(self):
+        self.assertEqual(self.get("0" * 64 + ".png").status_code, 404)
+        self.assertEqual(self.get("settings.py").status_code, 404)
+
+    def test_pdf_is_a_download(self):
+        response = self.get(get_artifact_store().put(b"%PDF-1.4", "pdf"))
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertIn("attachment", response["Content-Disposition"])
+
+
+class PlanCacheTests(SimpleTestCase):
+    START = datetime(2024, 1, 8, 6, 0)
+
+    def test_key_is_canonical(self):
+        key = plan_cache_key(["Chicago, IL", "Gary, IN", "Toledo, OH"], 10, self.START)
+        self.assertEqual(key, plan_cache_key(["  chicago ,IL", "gary, in", "TOLEDO, OH"], 10.001, self.START))
+        self.assertNotEqual(key, plan_cache_key(["Chicago, IL", "Gary, IN", "Toledo, OH"], 11, self.START))
+        self.assertNotEqual(key, plan_cache_key(
+            ["Chicago, IL", "Gary, IN", "Toledo, OH"], 10, self.START + timedelta(minutes=15)
+        ))
+        self.assertNotEqual(key, plan_cache_key(["Gary, IN", "Chicago, IL", "Toledo, OH"], 10, self.START))
+
+    @override_settings(PLAN_CACHE_BUCKET_MINUTES=15)
+    def test_start_time_is_bucketed(self):
+        self.assertEqual(bucket_start_time(datetime(2024, 1, 8, 6, 14, 59, 5)), self.START)
+        self.assertEqual(bucket_start_time(datetime(2024, 1, 8, 23, 59)), datetime(2024, 1, 8, 23, 45))
+
+    def test_plan_with_missing_artifacts_is_a_miss(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with override_settings(ARTIFACT_ROOT=Path(tmp.name)), \
+                mock.patch.object(planner, "_plan_cache", TieredCache("plan-test")):
+            image = get_artifact_store().put(b"png", "png")
+            plan = {"log_images": [image], "pdf": None}
+            planner.get_plan_cache().set("key", plan)
+            self.assertEqual(get_cached_plan("key"), plan)
+            get_artifact_store().path(image).unlink()
+            self.assertIsNone(get_cached_plan("key"))
+
+
+class PartitionDaysTests(SimpleTestCase):
+    def test_clips_at_local_midnight(self):
+        start = _minutes(2024, 1, 8, 22, 0, tz=NEW_YORK)
+        days = partition_days([DutyRecord(3, start, 240, "Road", "Driving", NEW_YORK)], NEW_YORK)
+        self.assertEqual([d.date.isoformat() for d in days], ["2024-01-08", "2024-01-09"])
+        self.assertEqual([d.minutes[2] for d in days], [120, 120])
+        for day in days:
+            self.assertEqual(sum(day.minutes), 24 * 60)
+
+    def test_daylight_saving_days(self):
+        for day, hours in ((10, 23), (3, 25)):
+            month = 3 if day == 10 else 11
+            start = _minutes(2024, month, day, 8, 0, tz=NEW_YORK)
+            days = partition_days([DutyRecord(4, start, 60, "Yard", "Pre-Trip", NEW_YORK)], NEW_YORK)
+            self.assertEqual(len(days), 1)
+            self.assertEqual(days[0].length_hours, hours)
+            self.assertEqual(sum(days[0].minutes), hours * 60)
+            self.assertEqual(sum(days[0].totals_hours()), hours)
+
+
+class CycleLedgerTests(SimpleTestCase):
+    def test_oldest_day_rolls_off_at_midnight(self):
+        ledger = CycleLedger(_minutes(2024, 1, 8, 20, 0), timezone.utc, prior_days=[10] * 7)
+        self.assertEqual(ledger.available_hours(), 0)
+        ledger.advance_to(_minutes(2024, 1, 9, 0, 0))
+        self.assertEqual(ledger.used_hours(), 60)
+        self.assertEqual(ledger.available_hours(), 10)
+
+    def test_on_duty_split_at_midnight(self):
+        now = _minutes(2024, 1, 8, 22, 0)
+        ledger = CycleLedger(now, timezone.utc)
+        ledger.add_on_duty(now, now + 4 * 60)
+        self.assertEqual(ledger.recap_for(datetime(2024, 1, 8).date())['worked_today'], 2)
+        self.assertEqual(ledger.worked_today, 2 * 60)
+        self.assertEqual(ledger.used_hours(), 4)
+
+    def test_minutes_until_the_oldest_day_rolls_off(self):
+        now = _minutes(2024, 1, 8, 20, 0)
+        ledger = CycleLedger(now, timezone.utc, prior_days=[10] * 7)
+        self.assertEqual(ledger.minutes_until_available(now), 4 * 60)
+        self.assertEqual(CycleLedger(now, timezone.utc, prior_days=[5] * 7).minutes_until_available(now), 0)
+
+    def test_nothing_frees_up_when_today_holds_the_cycle(self):
+        now = _minutes(2024, 1, 8, 20, 0)
+        ledger = CycleLedger(now, timezone.utc, today_hours=70)
+        self.assertIsNone(ledger.minutes_until_available(now))
+
+    def test_restart_clears_the_window(self):
+        ledger = CycleLedger(_minutes(2024, 1, 8, 20, 0), timezone.utc, prior_days=[10] * 7)
+        ledger.restart()
+        self.assertEqual(ledger.available_hours(), 70)
+
+
+class DutyHistoryTests(TestCase):
+    def setUp(self):
+        self.driver = Driver.objects.create(name="Test Driver", home_timezone="UTC")
+
+    def record_days(self, days, hours=9):
+        # `hours` of driving from 06:00 on each January day
+        record_duty_events(self.driver.pk, [
+            {'status': 3, 'start_min': _minutes(2024, 1, day, 6, 0),
+             'end_min': _minutes(2024, 1, day, 6, 0) + hours * 60}
+            for day in days
+        ])
+
+    def availability(self, now_min):
+        return with_availability(Driver.objects.filter(pk=self.driver.pk), now_min).get()
+
+    def test_counters_reset_after_10_hours_rest(self):
+        self.record_days(range(1, 9))
+        self.driver.refresh_from_db()
+        self.assertEqual(self.driver.drive_minutes, 9 * 60)
+        self.assertEqual(self.driver.shift_start_min, _minutes(2024, 1, 8, 6, 0))
+
+    def test_cycle_uses_calendar_day_window(self):
+        self.record_days(range(1, 9))
+        driver = self.availability(_minutes(2024, 1, 9, 3, 0))
+        # Jan 2-8 are in the window: 63 hours used
+        self.assertAlmostEqual(driver.cycle_hours, 7)
+        self.assertAlmostEqual(driver.drive_hours, 11)
+        self.assertAlmostEqual(driver.window_hours, 14)
+
+    def test_shift_limits_during_shift(self):
+        self.record_days([8], hours=5)
+        driver = self.availability(_minutes(2024, 1, 8, 12, 0))
+        self.assertAlmostEqual(driver.drive_hours, 6)
+        self.assertAlmostEqual(driver.window_hours, 8)
+        self.assertAlmostEqual(driver.cycle_hours, 65)
+
+    def test_34_hour_restart_restores_cycle(self):
+        self.record_days(range(1, 8))
+        self.record_days([9])
+        driver = self.availability(_minutes(2024, 1, 9, 16, 0))
+        self.assertAlmostEqual(driver.cycle_hours, 70 - 9)
+
+    def test_rejects_invalid_events(self):
+        self.record_days([8])
+        start = _minutes(2024, 1, 8, 7, 0)
+        with self.assertRaises(ValueError):
+            record_duty_events(self.driver.pk, [{'status': 3, 'start_min': start, 'end_min': start + 60}])
+        later = _minutes(2024, 1, 9, 7, 0)
+        with self.assertRaises(ValueError):
+            record_duty_events(self.driver.pk, [{'status': 5, 'start_min': later, 'end_min': later + 60}])
+        self.assertEqual(self.driver.duty_events.count(), 1)
+
+
+class PlanStreamViewTests(SimpleTestCase):
+    IMAGES = ["a" * 64 + ".png", "b" * 64 + ".png"]
+    PDF = "c" * 64 + ".pdf"
+
+    def setUp(self):
+        summary = {"itinerary": ["Chicago, IL", "Gary, IN", "Toledo, OH"], "route_geometry": None}
+        renders = [("log_image", self.IMAGES[0]), ("log_image", self.IMAGES[1]), ("pdf", self.PDF)]
+        for target, kwargs in (
+            ("log_generator.views._route_trip", {"return_value": ("leg-1", "leg-2")}),
+            ("log_generator.views.schedule_plan", {"return_value": (summary, [])}),
+            ("log_generator.views.iter_render_logs", {"side_effect": lambda day_logs, options: iter(renders)}),
+        ):
+            patcher = mock.patch(target, **kwargs)
+            setattr(self, target.rsplit(".", 1)[1], patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(planner, "_plan_cache", TieredCache("plan-test"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def post(self, body):
+        response = await self.async_client.post(
+            reverse("generate-plan-stream"), body, content_type="application/json"
+        )
+        if response.status_code != 200:
+            return response, None
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(content.endswith(b"\n"))
+        return response, [json.loads(line) for line in content.splitlines()]
+
+    def trip(self):
+        return json.dumps({"current_location": "Chicago, IL", "pickup_location": "Gary, IN",
+                           "dropoff_location": "Toledo, OH", "cycle_used": 10})
+
+    async def test_streams_plan_then_days_then_pdf(self):
+        _, lines = await self.post(self.trip())
+        self.assertEqual([line["event"] for line in lines], ["plan", "log_image", "log_image", "pdf"])
+        self.assertEqual(lines[0]["itinerary"], ["Chicago, IL", "Gary, IN", "Toledo, OH"])
+        self.assertEqual([line["day"] for line in lines[1:3]], [0, 1])
+        self.assertTrue(lines[1]["url"].endswith(f"/api/artifacts/{self.IMAGES[0]}"))
+        self.assertTrue(lines[3]["pdf_url"].endswith(f"/api/artifacts/{self.PDF}"))
+
+    def test_streams_under_wsgi(self):
+        response = self.client.post(reverse("generate-plan-stream"), self.trip(), content_type="application/json")
+        self.assertFalse(response.is_async)
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([line["event"] for line in lines], ["plan", "log_image", "log_image", "pdf"])
+
+    async def test_second_request_is_served_from_the_plan_cache(self):
+        _, first = await self.post(self.trip())
+        with mock.patch.object(ArtifactStore, "exists", return_value=True):
+            _, second = await self.post(self.trip())
+        self.assertEqual(first, second)
+        self.assertEqual(self.schedule_plan.call_count, 1)
+
+    async def test_routing_failure_is_an_error_line(self):
+        self._route_trip.side_effect = _PlanRequestError("Could not geocode locations")
+        _, lines = await self.post(self.trip())
+        self.assertEqual(lines, [{"event": "error", "status": 400, "error": "Could not geocode locations"}])
+
+    async def test_invalid_body_is_rejected_before_streaming(self):
+        response, _ = await self.post("not json")
+        self.assertEqual(response.status_code, 400)
+
+
+class PlanJobQueueTests(TestCase):
+    def job(self, priority=PlanJob.INTERACTIVE):
+        return PlanJob.objects.create(params={}, cache_key="key", priority=priority)
+
+    def test_claims_by_priority_then_age(self):
+        bulk = self.job(PlanJob.BULK)
+        first, second = self.job(), self.job()
+        self.assertEqual([claim_next_job().pk for _ in range(3)], [first.pk, second.pk, bulk.pk])
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(PlanJob.objects.filter(status=PlanJob.RUNNING).count(), 3)
+
+    def test_max_priority_leaves_bulk_jobs_queued(self):
+        self.job(PlanJob.BULK)
+        self.assertIsNone(claim_next_job(PlanJob.INTERACTIVE))
+
+    def test_bulk_jobs_are_limited_to_their_slots(self):
+        pool = JobWorkerPool(workers=2, bulk_slots=1)
+        self.job(PlanJob.BULK)
+        self.job(PlanJob.BULK)
+        self.assertEqual(pool._claim("w/0").priority, PlanJob.BULK)
+        # The second worker waits for interactive work instead of taking more bulk
+        self.assertIsNone(pool._claim("w/1"))
+        interactive = self.job()
+        self.assertEqual(pool._claim("w/1").pk, interactive.pk)
+
+    def test_claim_records_the_worker(self):
+        self.job()
+        job = claim_next_job(worker="host:1:abc/0")
+        self.assertEqual(job.worker, "host:1:abc/0")
+        self.assertIsNotNone(job.heartbeat_at)
+
+    def test_only_jobs_without_a_recent_heartbeat_are_requeued(self):
+        long_running, lost = self.job(), self.job()
+        claim_next_job(worker="a/0")
+        claim_next_job(worker="b/0")
+        an_hour_ago = django_timezone.now() - timedelta(hours=1)
+        PlanJob.objects.update(started_at=an_hour_ago)
+        PlanJob.objects.filter(pk=lost.pk).update(heartbeat_at=an_hour_ago)
+        self.assertEqual(requeue_stale_jobs(120), 1)
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.worker), (PlanJob.QUEUED, ""))
+        self.assertEqual(PlanJob.objects.get(pk=long_running.pk).status, PlanJob.RUNNING)
+
+    def test_pool_heartbeat_keeps_its_jobs_alive(self):
+        pool = JobWorkerPool(workers=1)
+        self.job()
+        job = pool._claim("w/0")
+        PlanJob.objects.filter(pk=job.pk).update(heartbeat_at=django_timezone.now() - timedelta(hours=1))
+        pool._beat()
+        self.assertEqual(requeue_stale_jobs(120), 0)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_exposition_format(self):
+        registry = Registry()
+        calls = registry.counter("calls_total", "Calls.", labels=("upstream",))
+        latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        registry.callback(lambda: [("cache_hits", "gauge", "Hits.", {"cache": "route"}, 3)])
+        calls.inc(upstream='o"srm')
+        calls.inc(2, upstream='o"srm')
+        latency.observe(0.05)
+        latency.observe(0.5)
+        self.assertEqual(registry.render().splitlines(), [
+            "# HELP calls_total Calls.",
+            "# TYPE calls_total counter",
+            'calls_total{upstream="o\\"srm"} 3',
+            "# HELP latency_seconds Latency.",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 2',
+            'latency_seconds_bucket{le="+Inf"} 2',
+            "latency_seconds_sum 0.55",
+            "latency_seconds_count 2",
+            "# HELP cache_hits Hits.",
+            "# TYPE cache_hits gauge",
+            'cache_hits{cache="route"} 3',
+        ])
+
+    def test_spans_are_collected_per_context(self):
+        with collect_timings() as timings:
+            with span("geocode"):
+                pass
+            with span("geocode"):
+                pass
+        self.assertEqual(list(timings), ["geocode"])
+        with span("route"):
+            pass
+        self.assertEqual(list(timings), ["geocode"])
+        self.assertEqual(server_timing_header({"geocode": 0.0125}), "geocode;dur=12.5")
+
+    def test_metrics_view(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn("# TYPE plan_stage_seconds histogram", response.content.decode())
+        self.assertNotIn("Server-Timing", response)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get("/metrics")
+        self.assertRegex(response["Server-Timing"], r"^total;dur=\d+\.\d$")
+        self.assertIn('http_requests_total{view="metrics",status="200"}', self.client.get("/metrics").content.decode())
+
+
+class ImageFormatTests(SimpleTestCase):
+    def setUp(self):
+        self.drawer = LogSheetDrawer()
+        self.page = self.drawer.get_template().copy()
+        self.addCleanup(self.page.close)
+
+    def decode(self, data):
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+
+    def test_encodings(self):
+        for image_format, pil_format, mode in (
+            ("png", "PNG", "RGB"), ("palette", "PNG", "P"), ("mono", "PNG", "1"), ("webp", "WEBP", "RGB"),
+        ):
+            with self.subTest(image_format):
+                img = self.decode(self.drawer.save_image(self.page, image_format))
+                self.assertEqual((img.format, img.mode), (pil_format, mode))
+                self.assertEqual(img.size, self.page.size)
+
+    def test_palette_keeps_the_sheet_colours(self):
+        decoded = self.decode(self.drawer.save_image(self.page, "palette")).convert("RGB")
+        self.assertLessEqual(len(decoded.getcolors()), 16)
+        # Pure sheet colours survive unchanged; only antialiased edges are snapped
+        original = dict((colour, count) for count, colour in self.page.getcolors(1 << 16))
+        snapped = dict((colour, count) for count, colour in decoded.getcolors())
+        for colour in ((0, 0, 0), (255, 255, 255)):
+            self.assertGreaterEqual(snapped[colour], original[colour])
+
+    def test_reduced_formats_are_smaller(self):
+        rgb = len(self.drawer.save_image(self.page, "png"))
+        self.assertLess(len(self.drawer.save_image(self.page, "palette")), rgb)
+        self.assertLess(len(self.drawer.save_image(self.page, "mono")), rgb)
+
+    def test_thumbnail_keeps_the_aspect_ratio(self):
+        thumb = self.drawer.thumbnail(self.page, 200)
+        self.assertEqual(thumb.size, (200, round(self.page.height * 200 / self.page.width)))
+
+    def test_options_are_validated(self):
+        self.assertEqual(get_image_options("mono", "120"), {"format": "mono", "thumbnail_width": 120})
+        with self.assertRaises(ValueError):
+            self.drawer.save_image(self.page, "gif")
+        for image_format, width in (("gif", None), ("png", 8), ("png", "wide")):
+            with self.assertRaises(ValueError):
+                get_image_options(image_format, width)
+
+
+class RouteIndexTests(SimpleTestCase):
+    # Two equal segments along the equator, then a degenerate repeated point
+    GEOMETRY = {"type": "LineString", "coordinates": [[0, 0], [1, 0], [2, 0], [2, 0]]}
+
+    def test_position_at_interpolates_along_the_route(self):
+        index = RouteIndex.from_geometry(self.GEOMETRY)
+        for fraction, lon in ((0, 0), (0.25, 0.5), (0.5, 1), (0.75, 1.5), (1, 2)):
+            lat, lon_at = index.position_at(fraction)
+            self.assertAlmostEqual(lat, 0)
+            self.assertAlmostEqual(lon_at, lon)
+
+    def test_fractions_are_clamped(self):
+        index = RouteIndex.from_geometry(self.GEOMETRY)
+        self.assertEqual(index.position_at(-1), (0, 0))
+        self.assertEqual(index.position_at(2), (0, 2))
+
+    def test_state_from_position(self):
+        for (lat, lon), state in (
+            ((41.88, -87.63), "IL"), ((41.59, -87.35), "IN"), ((41.65, -83.54), "OH"),
+            ((39.74, -104.99), "CO"), ((30.27, -97.74), "TX"), ((0, 0), None), ((45.5, -73.57), None),
+        ):
+            self.assertEqual(state_at(lat, lon), state, (lat, lon))
+
+    def test_unusable_geometry(self):
+        self.assertIsNone(RouteIndex.from_geometry(None))
+        self.assertIsNone(RouteIndex.from_geometry({"type": "Point", "coordinates": [0, 0]}))
+        self.assertIsNone(RouteIndex.from_geometry({"type": "LineString", "coordinates": [[1, 1], [1, 1]]}))
+
+
+class RunJobTests(TestCase):
+    def setUp(self):
+        self.pools = {}
+        for name in ("get_interactive_pool", "get_process_pool"):
+            pool = ThreadPoolExecutor(max_workers=1)
+            self.addCleanup(pool.shutdown)
+            self.pools[name] = pool
+            patcher = mock.patch(f"log_generator.services.jobs.{name}", return_value=pool)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, fake in (("geocode", _fake_geocode), ("get_multi_leg_route", _fake_route),
+                           ("build_plan", _fake_build_plan)):
+            patcher = mock.patch(f"log_generator.services.jobs.{name}", side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(planner, "_plan_cache", TieredCache("plan-test"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def claim(self, priority=PlanJob.INTERACTIVE, worker="w/0"):
+        params = job_params(["Chicago, IL", "Gary, IN", "Toledo, OH"], 10,
+                            datetime(2024, 1, 8, 6, 0, tzinfo=ZoneInfo("UTC")), None)
+        PlanJob.objects.create(params=params, cache_key="key", priority=priority)
+        return claim_next_job(worker=worker)
+
+    def test_interactive_jobs_use_their_own_pool(self):
+        with mock.patch.object(self.pools["get_process_pool"], "submit") as bulk_submit:
+            self.assertTrue(run_job(self.claim()))
+        bulk_submit.assert_not_called()
+        with mock.patch.object(self.pools["get_interactive_pool"], "submit") as interactive_submit:
+            self.assertTrue(run_job(self.claim(PlanJob.BULK)))
+        interactive_submit.assert_not_called()
+        self.assertEqual(PlanJob.objects.filter(status=PlanJob.DONE).count(), 2)
+
+    def test_result_is_dropped_after_a_takeover(self):
+        job = self.claim(worker="a/0")
+        # The job was requeued and another worker claimed it meanwhile
+        PlanJob.objects.filter(pk=job.pk).update(heartbeat_at=django_timezone.now() - timedelta(hours=1))
+        requeue_stale_jobs(120)
+        claim_next_job(worker="b/0")
+        self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.result), (PlanJob.RUNNING, "b/0", None))
@@ -1,6 +1,17 @@
 from django.urls import path
-from .views import GeneratePlanView
+from django.views.decorators.csrf import csrf_exempt
+from .views import (
+    ArtifactView, BatchPlanView, DriverAvailabilityView, DutyEventsView, GeneratePlanView, PlanJobStatusView,
+    PlanJobView, PlanStreamView,
+)
 
 urlpatterns = [
     path('generate-plan/', GeneratePlanView.as_view(), name='generate-plan'),
+    path('generate-plan/stream/', csrf_exempt(PlanStreamView.as_view()), name='generate-plan-stream'),
+    path('generate-plan/batch/', BatchPlanView.as_view(), name='generate-plan-batch'),
+    path('jobs/', PlanJobView.as_view(), name='plan-jobs'),
+    path('jobs/<uuid:job_id>/', PlanJobStatusView.as_view(), name='plan-job'),
+    path('drivers/availability/', DriverAvailabilityView.as_view(), name='driver-availability'),
+    path('drivers/<int:driver_id>/duty-events/', DutyEventsView.as_view(), name='driver-duty-events'),
+    path('artifacts/<str:artifact_id>', ArtifactView.as_view(), name='artifact'),
 ]
@@ -2,211 +2,634 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
-import base64
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views import View
+from asgiref.sync import sync_to_async
+import json
+import logging
+import re
+import time
 from datetime import datetime
+from zoneinfo import ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from .models import Driver, PlanJob
+from .services.duty_history import current_shift, prior_duty_hours, record_duty_events, with_availability
+from .services.duty_log import to_epoch_minutes
+from .services.jobs import submit_job
+from .services.metrics import registry, span
+from .services.profiling import RequestProfiler, profiling_allowed
+from .services.routing import geocode, get_multi_leg_route, normalize_address, straight_line_route
+from .services.artifacts import get_artifact_store
+from .services.planner import (
+    bucket_start_time, build_plan, get_cached_plan, get_home_timezone, get_image_options, get_plan_cache,
+    get_process_pool, iter_render_logs, plan_cache_key, schedule_plan,
+)
+
+logger = logging.getLogger(__name__)
+
+# Shared pool for upstream I/O (Nominatim / OSRM); the calls are network-bound
+_upstream_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'PLAN_UPSTREAM_WORKERS', 16),
+    thread_name_prefix='plan-upstream',
+)
+
+
+def _run_concurrently(func, args_list, deadline):
+    """
+    Run func(*args) for every entry of args_list on the upstream pool and wait
+    until `deadline` (a time.monotonic() value). Calls that have not finished
+    by then come back as None; they keep running and still warm the caches.
+    """
+    futures = [_upstream_pool.submit(func, *args) for args in args_list]
+    wait(futures, timeout=max(0, deadline - time.monotonic()))
+    results = []
+    for future in futures:
+        if future.done() and future.exception() is None:
+            results.append(future.result())
+        else:
+            results.append(None)
+    return results
+
+
+def _resolve_legs(waypoints, deadline):
+    """
+    Route a list of waypoints, falling back to straight-line legs when the
+    routing call misses the deadline.
+    """
+    legs, = _run_concurrently(get_multi_leg_route, [(waypoints,)], deadline)
+    if legs is None:
+        legs = [straight_line_route(start, end) for start, end in zip(waypoints, waypoints[1:])]
+    return legs
+
+
+def _artifact_url(request, artifact_id):
+    return request.build_absolute_uri(reverse('artifact', args=[artifact_id]))
+
+
+def _with_artifact_urls(request, plan):
+    """
+    Swap the planner's artifact ids for download URLs:
+    log_images / log_thumbnails -> lists of image URLs, pdf -> pdf_url.
+    """
+    plan = dict(plan)
+    plan['log_images'] = [_artifact_url(request, artifact_id) for artifact_id in plan['log_images']]
+    plan['log_thumbnails'] = [_artifact_url(request, artifact_id) for artifact_id in plan.get('log_thumbnails', [])]
+    pdf_id = plan.pop('pdf', None)
+    plan['pdf_url'] = _artifact_url(request, pdf_id) if pdf_id else None
+    return plan
+
+
+def _parse_prior_days(value):
+    """
+    Optional on-duty hours for the 7 days before today, oldest first.
+    Raises ValueError if malformed.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, list) or len(value) > 7:
+        raise ValueError("prior_days must be a list of at most 7 numbers")
+    hours = [float(h) for h in value]
+    # Written so NaN fails the range check too
+    if not all(0 <= h <= 24 for h in hours):
+        raise ValueError("prior_days values must be between 0 and 24")
+    return hours
+
+
+def _parse_cycle_used(value):
+    """
+    On-duty hours already used in the current 70-hour / 8-day cycle.
+    Raises ValueError if malformed or out of range.
+    """
+    hours = float(0 if value is None else value)
+    if not 0 <= hours <= 70:
+        raise ValueError("cycle_used must be between 0 and 70")
+    return hours
+
+
+class _PlanRequestError(Exception):
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _plan_inputs(data):
+    """
+    Validate a generate-plan body.
+    Returns (locations, cycle_used, start_time, prior_days, image_options, shift);
+    raises _PlanRequestError. shift is None unless a stored driver is given.
+    """
+    locations = [data.get('current_location'), data.get('pickup_location'), data.get('dropoff_location')]
+    try:
+        cycle_used = _parse_cycle_used(data.get('cycle_used'))
+        prior_days = _parse_prior_days(data.get('prior_days'))
+        # Optional "image_format" (png, palette, mono, webp) and "thumbnail_width"
+        image_options = get_image_options(data.get('image_format'), data.get('thumbnail_width'))
+    except (TypeError, ValueError) as e:
+        raise _PlanRequestError(str(e))
+
+    # Log days are split at midnight in the driver's home-terminal timezone
+    try:
+        home_tz = get_home_timezone(data.get('home_timezone'))
+    except (ZoneInfoNotFoundError, ValueError):
+        raise _PlanRequestError("Unknown home_timezone")
+
+    # A stored driver supplies the timezone, the previous 7 days of duty and
+    # today's hours and open shift
+    driver = None
+    if data.get('driver_id') is not None:
+        try:
+            driver_id = int(data.get('driver_id'))
+        except (TypeError, ValueError):
+            raise _PlanRequestError("driver_id must be an integer")
+        driver = Driver.objects.filter(pk=driver_id).first()
+        if driver is None:
+            raise _PlanRequestError("Unknown driver", status.HTTP_404_NOT_FOUND)
+        if data.get('home_timezone') is None:
+            try:
+                home_tz = get_home_timezone(driver.home_timezone)
+            except (ZoneInfoNotFoundError, ValueError):
+                raise _PlanRequestError("Driver has an unknown home_timezone")
+
+    # Identical requests within the same start-time bucket reuse the stored plan
+    start_time = bucket_start_time(datetime.now(home_tz))
+    shift = None
+    if driver is not None:
+        start_min = to_epoch_minutes(start_time)
+        if prior_days is None:
+            prior_days = prior_duty_hours(driver, start_min, home_tz)
+        shift = current_shift(driver, start_min, home_tz)
+    return locations, cycle_used, start_time, prior_days, image_options, shift
+
+
+def _route_trip(locations):
+    """
+    Geocode the trip's locations and route both legs.
+    Returns (route_1, route_2); raises _PlanRequestError.
+    """
+    # Resolve all three locations, then both legs, in parallel.
+    # Upstream latency is bounded by one deadline for the whole request.
+    deadline = time.monotonic() + getattr(settings, 'PLAN_UPSTREAM_DEADLINE', 10.0)
+
+    with span("geocode"):
+        coords = _run_concurrently(geocode, [(loc,) for loc in locations], deadline)
+    if not all(coords):
+        raise _PlanRequestError("Could not geocode locations")
+
+    # Both legs come from a single multi-stop OSRM request
+    with span("route"):
+        route_1, route_2 = _resolve_legs(coords, deadline)
+    if not (route_1 and route_2):
+        raise _PlanRequestError("Could not find routes")
+    return route_1, route_2
 
-from .services.routing import geocode, get_route
-from .services.hos_logic import TripScheduler
-from .services.pdf_drawer import LogSheetDrawer
 
 class GeneratePlanView(APIView):
     def post(self, request):
+        # Opt-in profiling (PROFILING_ENABLED): X-Profile header or ?profile= flag
+        flag = request.headers.get('X-Profile') or request.query_params.get('profile')
+        if not profiling_allowed(flag):
+            return self._post(request)
+
+        with RequestProfiler("generate-plan") as profiler:
+            response = self._post(request, use_cache=not profiler.active)
+        if profiler.active:
+            response['X-Profile-Id'] = profiler.profile_id
+        else:
+            response['X-Profile-Status'] = 'busy'
+        return response
+
+    def _post(self, request, use_cache=True):
         try:
-            data = request.data
-            current_loc_str = data.get('current_location')
-            pickup_loc_str = data.get('pickup_location')
-            dropoff_loc_str = data.get('dropoff_location')
-            cycle_used = float(data.get('cycle_used', 0))
-            
-            curr_coords = geocode(current_loc_str)
-            pick_coords = geocode(pickup_loc_str)
-            drop_coords = geocode(dropoff_loc_str)
-            
-            if not (curr_coords and pick_coords and drop_coords):
-                return Response({"error": "Could not geocode locations"}, status=status.HTTP_400_BAD_REQUEST)
-                
-            route_1 = get_route(curr_coords, pick_coords)
-            route_2 = get_route(pick_coords, drop_coords)
-            
-            if not (route_1 and route_2):
-                 return Response({"error": "Could not find routes"}, status=status.HTTP_400_BAD_REQUEST)
-                 
-            scheduler = TripScheduler(start_time=datetime.now(), cycle_used_hours=cycle_used)
-            
-            # 1. Pre-trip (15m)
-            scheduler.add_event(4, 15, current_loc_str, "Pre-trip Inspection")
-            
-            # 2. Drive to Pickup
-            scheduler.drive_leg(route_1['distance_miles'], route_1['duration_hours'], current_loc_str, pickup_loc_str)
-            
-            # 3. Pickup (1hr)
-            scheduler.add_event(4, 60, pickup_loc_str, "Loading")
-            
-            # 4. Drive to Dropoff
-            scheduler.drive_leg(route_2['distance_miles'], route_2['duration_hours'], pickup_loc_str, dropoff_loc_str)
-            
-            # 5. Dropoff (1hr)
-            scheduler.add_event(4, 60, dropoff_loc_str, "Unloading")
-            
-            # 6. Post-trip (15m)
-            scheduler.add_event(4, 15, dropoff_loc_str, "Post-trip Inspection")
-            
-            # Group events by Day
-            events_by_day = {}
-            day_stats = {} # store miles/totals per day
-
-            for e in scheduler.events:
-                day_key = e['start'].date()
-                if day_key not in events_by_day:
-                    events_by_day[day_key] = []
-                    day_stats[day_key] = {
-                        'miles': 0,
-                        'totals': [0, 0, 0, 0], # Off, SB, Drive, On
-                        'remarks': [],
-                        'from_city': current_loc_str, # Default start
-                        'to_city': dropoff_loc_str # Default end
-                    }
-                
-                start_hour = e['start'].hour + e['start'].minute/60.0
-                duration_hours = e['duration'] / 60.0
-                
-                # Add to daily totals
-                status_idx = e['status'] - 1 # 1-based status to 0-based index
-                if 0 <= status_idx < 4:
-                    day_stats[day_key]['totals'][status_idx] += duration_hours
-                
-                # Add to miles if driving
-                if e['status'] == 3: # Driving
-                     miles = duration_hours * 50.0 
-                     day_stats[day_key]['miles'] += miles
-
-                # Format Remark
-                time_str = e['start'].strftime('%H:%M')
-                loc = e['location']
-                rem_text = e['remark']
-                day_stats[day_key]['remarks'].append(f"{time_str} - {loc} - {rem_text}")
-
-                events_by_day[day_key].append({
-                    'status': e['status'],
-                    'start_hour': start_hour,
-                    'duration_hours': duration_hours
-                })
-                
-                # Update From/To for the day (First event loc is From, Last is To - roughly)
-                if len(events_by_day[day_key]) == 1:
-                    day_stats[day_key]['from_city'] = e['location']
-                day_stats[day_key]['to_city'] = e['location']
-
-            drawer = LogSheetDrawer()
-            log_images_b64 = []
-            pil_images = []
-            
-            # Sort days
-            sorted_days = sorted(events_by_day.keys())
-            
-            cycle_used_current = float(cycle_used) # Initialize running counter
-
-            for day in sorted_days:
-                stats = day_stats[day]
-                
-                # Normalize totals to ensure exactly 24.00
-                # Round every component to 2 decimals first, because that's what we display
-                stats['totals'] = [round(x, 2) for x in stats['totals']]
-                
-                total_sum = sum(stats['totals'])
-                
-                # Check for floating point drift or rounding gaps
-                if abs(total_sum - 24.00) > 0.001:
-                    diff = 24.00 - total_sum
-                    # Add remaining diff to Off Duty (Status 1, Index 0)
-                    stats['totals'][0] += diff
-                    # Re-round to be sure
-                    stats['totals'][0] = round(stats['totals'][0], 2)
-
-                day_info = {
-                    'date': str(day),
-                    'miles_today': stats['miles'],
-                    'carrier': "Logistics Co.",
-                    'main_office': "123 Main St, Springfield",
-                    'home_terminal': "456 Depot Ln, Hometown",
-                    'truck_num': "1042",
-                    'trailer_num': "5301",
-                    'from_city': stats['from_city'],
-                    'to_city': stats['to_city'],
-                    'totals': stats['totals'],
-                    'remarks_list': stats['remarks']
-                }
-
-                # --- Recap Calculations ---
-                # Cycle Rule: 70 hours in 8 days.
-                # We know 'cycle_used' at start of trip.
-                # valid_cycle_used tracks the running total at start of THIS day.
-                
-                if day == sorted_days[0]:
-                   current_day_start_cycle = float(cycle_used)
-                else:
-                   # For subsequent days, it's prev_day_end
-                   # We need to track this loop-to-loop.
-                   # Let's retroactively calculate it or just maintain a running counter in the loop?
-                   # Better: maintain running counter.
-                   pass # handled by running variable below
-
-                # We need a define variable outside loop for running cycle
-                
-                # Hours worked today = Driving (idx 2) + On Duty (idx 3)
-                hours_worked_today = stats['totals'][2] + stats['totals'][3]
-                
-                # 70 Hour Rule Math
-                # Available Today = 70 - Used_Last_7_Days (which is our running 'cycle_used_current')
-                # But wait, 'cycle_used' passed in IS "Used Last 7 Days"
-                
-                hours_available_today = 70.0 - cycle_used_current
-                if hours_available_today < 0: hours_available_today = 0
-                
-                cycle_used_end = cycle_used_current + hours_worked_today
-                
-                hours_available_tomorrow = 70.0 - cycle_used_end
-                if hours_available_tomorrow < 0: hours_available_tomorrow = 0
-                
-                day_info['recap'] = {
-                    'limit': "70 / 8",
-                    'used_last_7': cycle_used_current,
-                    'available_today': hours_available_today,
-                    'worked_today': hours_worked_today,
-                    'total_since_start': cycle_used_end, # Simplified "Total on duty 7/8 days"
-                    'available_tomorrow': hours_available_tomorrow
-                }
-                
-                # Update for next day
-                cycle_used_current = cycle_used_end
-                
-                img, _ = drawer.create_blank_log(day_info, "Driver")
-                drawer.draw_events(img, _, events_by_day[day])
-                
-                # Store for API response (PNG)
-                png_data = drawer.save_image(img)
-                log_images_b64.append(f"data:image/png;base64,{base64.b64encode(png_data).decode('utf-8')}")
-                
-                # Store for PDF
-                pil_images.append(img)
-            
-            # Generate PDF
-            pdf_data = drawer.save_pdf(pil_images)
-            pdf_b64 = base64.b64encode(pdf_data).decode('utf-8') if pdf_data else ""
-            
-            return Response({
-                "itinerary": [e['remark'] + f" at {e['start'].strftime('%H:%M')}" for e in scheduler.events],
-                "log_images": log_images_b64,
-                "pdf_blob": pdf_b64,
-                "route_geometry": {
-                    "type": "FeatureCollection",
-                    "features": [
-                        {"type": "Feature", "geometry": route_1['geometry'], "properties": {"type": "pre-load"}},
-                        {"type": "Feature", "geometry": route_2['geometry'], "properties": {"type": "load"}}
-                    ]
-                }
-            })
+            locations, cycle_used, start_time, prior_days, image_options, shift = _plan_inputs(request.data)
+            cache_key = plan_cache_key(locations, cycle_used, start_time, prior_days, image_options, shift)
+            # Profiled requests always do the full work
+            if use_cache:
+                with span("plan_cache"):
+                    plan = get_cached_plan(cache_key)
+                if plan is not None:
+                    return Response(_with_artifact_urls(request, plan))
+
+            route_1, route_2 = _route_trip(locations)
+            plan = build_plan(*locations, route_1, route_2, cycle_used, start_time, prior_days, image_options, shift)
+            get_plan_cache().set(cache_key, plan)
+            return Response(_with_artifact_urls(request, plan))
+        except _PlanRequestError as e:
+            return Response({"error": str(e)}, status=e.status_code)
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception("Plan generation failed")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _stream_plan_events(request, cache_key, locations, cycle_used, start_time, prior_days, image_options, shift):
+    """
+    Blocking generator of the NDJSON lines for PlanStreamView, one line as
+    each step of the plan finishes.
+    """
+    def line(**fields):
+        return json.dumps(fields) + "\n"
+
+    plan = get_cached_plan(cache_key)
+    if plan is not None:
+        yield line(event="plan", itinerary=plan["itinerary"], route_geometry=plan["route_geometry"])
+        for day, artifact_id in enumerate(plan.get("log_thumbnails", [])):
+            yield line(event="log_thumbnail", day=day, url=_artifact_url(request, artifact_id))
+        for day, artifact_id in enumerate(plan["log_images"]):
+            yield line(event="log_image", day=day, url=_artifact_url(request, artifact_id))
+        yield line(event="pdf", pdf_url=_artifact_url(request, plan["pdf"]) if plan["pdf"] else None)
+        return
+
+    try:
+        route_1, route_2 = _route_trip(locations)
+        summary, day_logs = schedule_plan(
+            *locations, route_1, route_2, cycle_used, start_time, prior_days, shift
+        )
+        yield line(event="plan", **summary)
+
+        log_image_ids = []
+        thumbnail_ids = []
+        pdf_id = None
+        for kind, artifact_id in iter_render_logs(day_logs, image_options):
+            if kind == "log_image":
+                yield line(event="log_image", day=len(log_image_ids), url=_artifact_url(request, artifact_id))
+                log_image_ids.append(artifact_id)
+            elif kind == "log_thumbnail":
+                yield line(event="log_thumbnail", day=len(log_image_ids), url=_artifact_url(request, artifact_id))
+                thumbnail_ids.append(artifact_id)
+            else:
+                pdf_id = artifact_id
+                yield line(event="pdf", pdf_url=_artifact_url(request, pdf_id) if pdf_id else None)
+    except _PlanRequestError as e:
+        yield line(event="error", status=e.status_code, error=str(e))
+        return
+    except Exception as e:
+        logger.exception("Streamed plan generation failed")
+        yield line(event="error", status=status.HTTP_500_INTERNAL_SERVER_ERROR, error=str(e))
+        return
+
+    plan = dict(summary, log_images=log_image_ids, log_thumbnails=thumbnail_ids, pdf=pdf_id)
+    get_plan_cache().set(cache_key, plan)
+
+
+class PlanStreamView(View):
+    """
+    Variant of generate-plan that streams NDJSON as the plan is built:
+    {"event": "plan", itinerary, route_geometry} once the trip is scheduled,
+    {"event": "log_thumbnail", "day": i, "url": ...} (if thumbnail_width was given)
+    and {"event": "log_image", "day": i, "url": ...} as each day is rendered,
+    then {"event": "pdf", "pdf_url": ...}, or {"event": "error", "error": ...}.
+    Under ASGI each step runs in a worker thread, so the event loop stays
+    free while one trip renders. Under WSGI, which would buffer an async
+    iterator completely, the lines come from a plain iterator instead.
+    """
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b"{}")
+            if not isinstance(data, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            inputs = await sync_to_async(_plan_inputs)(data)
+        except _PlanRequestError as e:
+            return JsonResponse({"error": str(e)}, status=e.status_code)
+        cache_key = plan_cache_key(*inputs)
+        locations, cycle_used, start_time, prior_days, image_options, shift = inputs
+        lines = _stream_plan_events(
+            request, cache_key, locations, cycle_used, start_time, prior_days, image_options, shift
+        )
+        if not isinstance(request, ASGIRequest):
+            return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+
+        async def stream():
+            # Pull one line at a time off a worker thread
+            next_line = sync_to_async(next, thread_sensitive=False)
+            while True:
+                item = await next_line(lines, None)
+                if item is None:
+                    break
+                yield item
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+def _job_body(request, job):
+    body = {
+        "job_id": str(job.id),
+        "status": job.status,
+        "priority": job.priority,
+        "status_url": request.build_absolute_uri(reverse('plan-job', args=[job.id])),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status == PlanJob.DONE:
+        body["result"] = _with_artifact_urls(request, job.result)
+    elif job.status == PlanJob.FAILED:
+        body["error"] = job.error
+    return body
+
+
+class PlanJobView(APIView):
+    """
+    Queue a plan instead of waiting for it.
+    Body: the generate-plan body plus an optional "priority" of "interactive"
+    (default) or "bulk". Returns 202 with the job id and its status URL
+    (200 with the result if the plan was already cached).
+    """
+    def post(self, request):
+        priority = PlanJob.PRIORITIES.get(request.data.get('priority', 'interactive'))
+        if priority is None:
+            return Response({"error": "priority must be 'interactive' or 'bulk'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            locations, cycle_used, start_time, prior_days, image_options, shift = _plan_inputs(request.data)
+        except _PlanRequestError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+
+        cache_key = plan_cache_key(locations, cycle_used, start_time, prior_days, image_options, shift)
+        job = submit_job(locations, cycle_used, start_time, prior_days, image_options, cache_key, priority, shift)
+        # Cached plans come back as already-done jobs
+        code = status.HTTP_200_OK if job.status == PlanJob.DONE else status.HTTP_202_ACCEPTED
+        return Response(_job_body(request, job), status=code)
+
+
+class PlanJobStatusView(APIView):
+    """
+    Status of a queued plan; "result" is included once it is done.
+    """
+    def get(self, request, job_id):
+        job = PlanJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({"error": "Unknown job"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_job_body(request, job))
+
+
+class BatchPlanView(APIView):
+    """
+    Plan many trips in one request.
+    Body: {"trips": [{current_location, pickup_location, dropoff_location, cycle_used, prior_days,
+                      home_timezone, driver_id, image_format, thumbnail_width}, ...]}
+    Each trip is validated like a generate-plan body; an invalid trip gets
+    its own error line and does not fail the batch.
+    Trips found in the plan cache are answered first; for the rest, geocodes
+    and routes are deduplicated across the batch, and scheduling plus
+    rendering runs on the shared process pool. The response is NDJSON, one
+    line per trip in completion order: {"index": i, "status": ..., "result"/"error": ...}
+    """
+    def post(self, request):
+        trips = request.data.get('trips') if isinstance(request.data, dict) else None
+        if not isinstance(trips, list) or not trips:
+            return Response({"error": "'trips' must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+        max_trips = getattr(settings, 'PLAN_BATCH_MAX_TRIPS', 500)
+        if len(trips) > max_trips:
+            return Response({"error": f"At most {max_trips} trips per batch"}, status=status.HTTP_400_BAD_REQUEST)
+
+        parsed = []
+        rejected = {}
+        for index, trip in enumerate(trips):
+            try:
+                if not isinstance(trip, dict) or not all(
+                    trip.get(field) for field in ('current_location', 'pickup_location', 'dropoff_location')
+                ):
+                    raise _PlanRequestError("Invalid trip request")
+                # (locations, cycle_used, start_time, prior_days, image_options, shift)
+                parsed.append(_plan_inputs(trip))
+            except _PlanRequestError as e:
+                parsed.append(None)
+                rejected[index] = {"index": index, "status": e.status_code, "error": str(e)}
+
+        # Trips already planned in this start-time bucket come straight from the cache
+        cache_keys = {}
+        cached = []
+        for index, entry in enumerate(parsed):
+            if entry:
+                key = plan_cache_key(*entry)
+                plan = get_cached_plan(key)
+                if plan is not None:
+                    cached.append({"index": index, "status": 200, "result": _with_artifact_urls(request, plan)})
+                    parsed[index] = False
+                else:
+                    cache_keys[index] = key
+
+        deadline = time.monotonic() + getattr(settings, 'PLAN_BATCH_UPSTREAM_DEADLINE', 60.0)
+
+        # One geocode per distinct address across the whole batch
+        addresses = {}
+        for entry in parsed:
+            if entry:
+                for loc in entry[0]:
+                    addresses.setdefault(normalize_address(loc), loc)
+        address_keys = list(addresses)
+        coords = dict(zip(address_keys, _run_concurrently(
+            geocode, [(addresses[key],) for key in address_keys], deadline
+        )))
+
+        # One routing call per distinct waypoint sequence
+        waypoint_sets = {}
+        for entry in parsed:
+            if entry:
+                points = tuple(coords[normalize_address(loc)] for loc in entry[0])
+                if all(points):
+                    waypoint_sets.setdefault(points, None)
+        waypoint_keys = list(waypoint_sets)
+        routed = _run_concurrently(get_multi_leg_route, [(list(points),) for points in waypoint_keys], deadline)
+        for points, legs in zip(waypoint_keys, routed):
+            if legs is None:
+                legs = [straight_line_route(start, end) for start, end in zip(points, points[1:])]
+            waypoint_sets[points] = legs
+
+        pool = get_process_pool()
+        futures = {}
+        errors = []
+        for index, entry in enumerate(parsed):
+            if entry is False:
+                continue
+            if entry is None:
+                errors.append(rejected[index])
+                continue
+            locations, cycle_used, start_time, prior_days, image_options, shift = entry
+            points = tuple(coords[normalize_address(loc)] for loc in locations)
+            if not all(points):
+                errors.append({"index": index, "status": 400, "error": "Could not geocode locations"})
+                continue
+            route_1, route_2 = waypoint_sets[points]
+            future = pool.submit(
+                build_plan, *locations, route_1, route_2, cycle_used, start_time, prior_days, image_options, shift
+            )
+            futures[future] = index
+
+        def stream():
+            for line in cached + errors:
+                yield json.dumps(line) + "\n"
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    plan = future.result()
+                    get_plan_cache().set(cache_keys[index], plan)
+                    line = {"index": index, "status": 200, "result": _with_artifact_urls(request, plan)}
+                except Exception as e:
+                    line = {"index": index, "status": 500, "error": str(e)}
+                yield json.dumps(line) + "\n"
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header, size):
+    """
+    Parse a single-range "bytes=start-end" header into an inclusive
+    (start, end) pair. Returns None for a missing or multi-range header
+    (served as a full response) and raises ValueError if unsatisfiable.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def _iter_file_range(f, start, length, chunk_size=64 * 1024):
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class ArtifactView(APIView):
+    """
+    Streams a stored log image or PDF. Artifacts are content-addressed and
+    immutable, so they are served with a long-lived cache header, an ETag and
+    single-range (206) support.
+    """
+    def get(self, request, artifact_id):
+        store = get_artifact_store()
+        try:
+            path = store.path(artifact_id)
+        except ValueError:
+            raise Http404("Unknown artifact")
+        if not path.exists():
+            raise Http404("Unknown artifact")
+
+        etag = f'"{artifact_id.split(".")[0]}"'
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponse(status=304, headers={'ETag': etag})
+
+        size = path.stat().st_size
+        content_type = store.content_type(artifact_id)
+        try:
+            byte_range = _parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}'})
+
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                _iter_file_range(open(path, 'rb'), start, length), status=206, content_type=content_type
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(length)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        if content_type == 'application/pdf':
+            response['Content-Disposition'] = 'attachment; filename="driver_logs.pdf"'
+        return response
+
+
+def _parse_event_time(value, tz):
+    # ISO 8601 time to whole epoch minutes; times without an offset are in tz
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return round(to_epoch_minutes(dt))
+
+
+class DutyEventsView(APIView):
+    """
+    Records a driver's duty events.
+    Body: {"events": [{status, start, end, location, remark}, ...]} with
+    ISO 8601 times, appended after the driver's existing history.
+    """
+    def post(self, request, driver_id):
+        driver = Driver.objects.filter(pk=driver_id).first()
+        if driver is None:
+            return Response({"error": "Unknown driver"}, status=status.HTTP_404_NOT_FOUND)
+        events = request.data.get('events')
+        if not isinstance(events, list) or not events:
+            return Response({"error": "'events' must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            tz = get_home_timezone(driver.home_timezone)
+            parsed = [{
+                'status': int(e['status']),
+                'start_min': _parse_event_time(e['start'], tz),
+                'end_min': _parse_event_time(e['end'], tz),
+                'location': e.get('location'),
+                'remark': e.get('remark'),
+            } for e in events]
+            recorded = record_duty_events(driver.pk, parsed)
+        except (KeyError, TypeError, ValueError) as e:
+            return Response({"error": f"Invalid event: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"recorded": recorded}, status=status.HTTP_201_CREATED)
+
+
+class DriverAvailabilityView(APIView):
+    """
+    Remaining drive, 14-hour window and 70-hour cycle hours for many drivers
+    in one query. Optional query params: ids (comma-separated) and at
+    (ISO 8601 time, default now).
+    """
+    def get(self, request):
+        try:
+            at = request.query_params.get('at')
+            now = datetime.fromisoformat(at) if at else datetime.now(get_home_timezone())
+            if now.tzinfo is None:
+                now = now.replace(tzinfo=get_home_timezone())
+            drivers = Driver.objects.all()
+            ids = request.query_params.get('ids')
+            if ids:
+                drivers = drivers.filter(pk__in=[int(i) for i in ids.split(',')])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = with_availability(drivers, round(to_epoch_minutes(now))).order_by('pk').values(
+            'id', 'name', 'drive_hours', 'window_hours', 'cycle_hours'
+        )
+        return Response({"as_of": now.isoformat(), "drivers": list(rows)})
+
+
+class MetricsView(View):
+    """
+    Process metrics in the Prometheus text format: plan stage latency,
+    upstream calls and fallbacks, cache hit ratios and request counts.
+    Work done in the shared process pool (batch and job plans) is timed in
+    the worker processes and is not included.
+    """
+    def get(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise Http404("Metrics are disabled")
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
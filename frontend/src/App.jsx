@@ -1,5 +1,4 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import TripForm from './components/TripForm';
 import MapDisplay from './components/MapDisplay';
 import './index.css';
@@ -17,9 +16,39 @@ function App() {
       if (!baseUrl) {
         throw new Error("VITE_API_BASE_URL is not defined");
       }
-     const response = await axios.post(`${baseUrl}/api/generate-plan/`, data);
+      const response = await fetch(`${baseUrl}/api/generate-plan/stream/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(data),
+      });
+      if (!response.ok) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
 
-      setResult(response.data);
+      // NDJSON stream: itinerary and route first, then each day's log, then the PDF
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (!line) continue;
+          const message = JSON.parse(line);
+          if (message.event === 'error') {
+            throw new Error(message.error);
+          } else if (message.event === 'plan') {
+            setResult({ itinerary: message.itinerary, route_geometry: message.route_geometry, log_images: [], pdf_url: null });
+          } else if (message.event === 'log_image') {
+            setResult((prev) => ({ ...prev, log_images: [...prev.log_images, message.url] }));
+          } else if (message.event === 'pdf') {
+            setResult((prev) => ({ ...prev, pdf_url: message.pdf_url }));
+          }
+        }
+      }
     } catch (err) {
       console.error(err);
       setError("Failed to generate plan. Please check inputs and server connection.");
@@ -49,9 +78,9 @@ function App() {
             <div className="card" style={{ marginBottom: '2rem' }}>
               <h2>Itinerary</h2>
               {/* PDF Download Button */}
-              {result.pdf_blob && (
+              {result.pdf_url && (
                 <a
-                  href={`data:application/pdf;base64,${result.pdf_blob}`}
+                  href={result.pdf_url}
                   download="driver_logs.pdf"
                   className="download-btn"
                   style={{
@@ -84,7 +113,7 @@ function App() {
               {result.log_images.map((imgSrc, idx) => (
                 <div key={idx}>
                   <p style={{ fontSize: '0.8rem', color: 'var(--text-secondary)' }}>Day {idx + 1}</p>
-                  <img src={imgSrc} alt={`Log Day ${idx + 1}`} className="log-image" />
+                  <img src={imgSrc} alt={`Log Day ${idx + 1}`} className="log-image" loading="lazy" />
                 </div>
               ))}
             </div>
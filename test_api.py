@@ -1,6 +1,5 @@
 import requests
 import json
-import base64
 
 url = "http://localhost:8000/api/generate-plan/"
 data = {
@@ -26,16 +25,16 @@ try:
         
         # Save Images
         if res_json.get('log_images'):
-            print("Image Data Length:", len(res_json['log_images'][0]))
+            print("First Image URL:", res_json['log_images'][0])
             
         # Save PDF
-        if res_json.get('pdf_blob'):
-            pdf_bytes = base64.b64decode(res_json['pdf_blob'])
+        if res_json.get('pdf_url'):
+            pdf_bytes = requests.get(res_json['pdf_url']).content
             with open("test_output.pdf", "wb") as f:
                 f.write(pdf_bytes)
             print("Successfully saved test_output.pdf")
         else:
-            print("No PDF blob returned")
+            print("No PDF URL returned")
             
     else:
         print(response.text)